@@ -10,6 +10,95 @@ class Settings(BaseSettings):
     # LLM / RAG settings
     gemini_api_key: str | None = None
 
+    # LLM client resilience (timeouts, retries, hedging, circuit breaker)
+    llm_timeout_sec: float = 20.0
+    llm_max_retries: int = 2
+    llm_backoff_base_sec: float = 0.5
+    llm_backoff_max_sec: float = 4.0
+    llm_hedge_enabled: bool = False
+    llm_hedge_min_delay_sec: float = 1.0
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_sec: float = 30.0
+    llm_fallback_model: str | None = "gemini-flash-lite-latest"
+    llm_fallback_reply: str = (
+        "Sorry, I'm having trouble answering right now. "
+        "Please try again in a moment or contact a human agent."
+    )
+
+    # Fake LLM for load tests (tools/log_replay.py): no Gemini calls, latency sampled from the logs
+    llm_fake: bool = False
+    llm_fake_latency_logs: str = "logs"  # relative to the backend folder
+    llm_fake_latency_ms: float = 1500.0  # median when the logs carry no latency_ms
+    llm_fake_embed_latency_ms: float = 150.0
+
+    # Explicit Gemini context caching of the stable prompt prefix (off by default: cache storage is billed)
+    llm_context_cache_enabled: bool = False
+    llm_context_cache_ttl_sec: int = 600
+    llm_context_cache_min_chars: int = 4096  # ~1k tokens; the API rejects smaller caches
+    llm_context_cache_min_uses: int = 2  # only cache prefixes that repeat
+
+    # Copilot batch endpoint
+    copilot_batch_max_items: int = 100
+    copilot_batch_concurrency: int = 8
+
+    # Rolling case summaries (keyed by conversation prefix)
+    summary_cache_max_entries: int = 1000
+    summary_cache_ttl_sec: float = 3600.0
+
+    # Retrieval result cache (local LRU + optional SQLite tier shared by workers)
+    retrieval_cache_enabled: bool = True
+    retrieval_cache_max_entries: int = 5000
+    retrieval_cache_ttl_sec: float = 86400.0
+    retrieval_cache_shared: bool = True
+    retrieval_cache_db_path: str = "retrieval_cache.sqlite3"  # relative to the backend folder
+    kb_version_check_sec: float = 1.0  # how often a worker looks for another worker's re-index (shared cache file)
+
+    # Multi-tenant KBs: the default tenant uses app/kb, others app/kb_tenants/<tenant>/
+    kb_default_tenant: str = "default"
+    kb_tenants_dir: str = "app/kb_tenants"  # relative to the backend folder
+    kb_tenant_state_cache_mib: int = 64  # cap on tenants' reranker / spell-corrector state, coldest dropped first (not Chroma vectors)
+
+    # Context selection after retrieval (Chroma L2 distance, lower = closer)
+    rag_adaptive_k: bool = True
+    rag_max_distance: float = 1.0  # drop chunks farther than this ("hey" ~1.3, real questions ~0.5-0.9)
+    rag_max_distance_gap: float = 0.15  # stop once a chunk is this much worse than the best one
+    rag_merge_adjacent: bool = True  # merge neighbouring chunks of the same KB document
+
+    # Optional rerank stage: fetch a wider candidate set, rerank on CPU, keep top n
+    rerank_endpoints: str = ""  # comma-separated: "chatbot", "suggest_reply" (also used by the batch), or "*"
+    rerank_candidates: int = 20
+    rerank_model: str = ""  # e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2" (needs sentence-transformers); empty = BM25
+    rerank_vector_weight: float = 0.3  # share of the vector similarity in the fused score
+    rerank_max_score_gap: float = 0.5  # adaptive k after rerank: stop this far below the top fused score (0-1)
+    rerank_cache_max_entries: int = 20000
+
+    # Query normalization after PII masking (canonical form feeds the FAQ router, retrieval and caches)
+    query_spellcheck_enabled: bool = True  # correct typos against the tenant's KB vocabulary
+    query_spellcheck_max_distance: int = 2  # edits allowed for words of 10+ letters (shorter: 1)
+    query_spellcheck_min_zipf: float = 3.0  # English words at least this frequent are never corrected (needs wordfreq)
+
+    # Pre-LLM FAQ intent router
+    intent_router_enabled: bool = True
+    intent_router_min_confidence: float = 0.5
+    intent_router_min_margin: float = 0.12
+
+    # Opt-in request profiling to speedscope files in logs/profiles (no middleware at all when off)
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0  # share of requests profiled, e.g. 0.01
+    profiling_header: str = "X-Debug-Profile"  # requests sending this header (with the token) are always profiled
+    profiling_header_token: str = ""  # required: header trigger and /admin/profiles are off while empty
+    profiling_interval_ms: float = 5.0
+    profiling_max_files: int = 50
+
+    # Background jobs
+    jobs_store: str = "sqlite"  # "sqlite" | "memory"
+    jobs_db_path: str = "jobs.sqlite3"  # relative to the backend folder
+    jobs_workers: int = 4
+    jobs_max_retries: int = 2
+    jobs_retry_backoff_sec: float = 1.0
+    jobs_result_ttl_sec: float = 3600.0
+    jobs_lease_sec: float = 120.0  # a running job is re-queued if its worker stops renewing for this long
+
     class Config:
         env_file = ".env"
 
@@ -1,13 +1,31 @@
-from fastapi import FastAPI
+import warnings
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.config import settings
+from app.services.llm_client import generate_text, get_llm_stats
+from app.services.rag_service import UnknownTenantError, reindex_tenant, tenants
+from app.utils.logger import BASE_LOG_DIR
+from app.utils.profiling import ProfileStore, ProfilingMiddleware, token_matches
+from app.routers import chatbot, copilot, jobs  # <-- add this import
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background job workers live as long as the app
+    await jobs.job_queue.start()
+    yield
+    await jobs.job_queue.stop()
 
-from app.services.llm_client import generate_text
-from app.routers import chatbot, copilot  # <-- add this import
 
 app = FastAPI(
     title="AI Customer Service Backend",
     version="0.1.0",
     description="RAG chatbot + agent copilot backend for MS Design Studio project",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -18,9 +36,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+profile_store = ProfileStore(BASE_LOG_DIR / "profiles", max_files=settings.profiling_max_files)
+if settings.profiling_enabled:
+    if not settings.profiling_header_token:
+        warnings.warn(
+            "PROFILING_HEADER_TOKEN is not set: the profiling header trigger and "
+            "/admin/profiles are disabled (sampled profiling still runs)"
+        )
+    # Outermost, so the profile covers CORS and routing too
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        sample_rate=settings.profiling_sample_rate,
+        header=settings.profiling_header,
+        token=settings.profiling_header_token,
+        interval_ms=settings.profiling_interval_ms,
+    )
+
 # include routers
 app.include_router(chatbot.router)  # <-- add this line
 app.include_router(copilot.router)  # <-- add this line
+app.include_router(jobs.router)
+
+
+@app.exception_handler(UnknownTenantError)
+async def unknown_tenant_handler(request: Request, exc: UnknownTenantError):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
 
 @app.get("/health")
 def health_check():
@@ -31,3 +73,56 @@ def health_check():
 def llm_test():
     text = generate_text("Say one short sentence confirming Gemini is connected.")
     return {"response": text}
+
+
+@app.get("/llm-stats")
+def llm_stats():
+    """
+    Input tokens, cached tokens and latency of LLM calls, with and without prefix caching.
+    """
+    return get_llm_stats()
+
+
+@app.get("/kb/tenants")
+def kb_tenants():
+    """
+    Tenant KB indexes currently loaded, their KB versions and the estimated
+    memory of their in-process state (reranker, spell corrector).
+    """
+    return tenants.stats()
+
+
+@app.post("/kb/{tenant_id}/reindex")
+def kb_reindex(tenant_id: str):
+    """
+    Re-read one tenant's KB folder; only that tenant's cached retrievals are invalidated.
+    """
+    return {"tenant_id": tenant_id, "kb_version": reindex_tenant(tenant_id)}
+
+
+def require_profiling_token(request: Request) -> None:
+    """
+    Profiles expose stack frames and timings, so the admin endpoints need the
+    same token as the profiling header (sent in that header).
+    """
+    if not token_matches(request.headers.get(settings.profiling_header), settings.profiling_header_token):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_profiling_token)])
+def list_profiles():
+    """
+    Recent request profiles, newest first (set PROFILING_ENABLED=true to record them).
+    """
+    return {"enabled": settings.profiling_enabled, "profiles": profile_store.list()}
+
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profiling_token)])
+def get_profile(profile_id: str):
+    """
+    Download one profile; open it at https://www.speedscope.app.
+    """
+    path = profile_store.path_for(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
@@ -11,6 +11,7 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     query: str
     history: Optional[List[ChatMessage]] = []  # past messages (optional)
+    tenant_id: Optional[str] = None  # storefront KB; falls back to the X-Tenant-ID header, then the default
 
 
 class ChatResponse(BaseModel):
@@ -11,12 +11,26 @@ class SuggestReplyRequest(BaseModel):
     customer_message: str
     conversation_history: Optional[List[ChatMessage]] = []
     topic_hint: Optional[str] = None  # e.g. "orders", "returns", "account"
+    tenant_id: Optional[str] = None  # storefront KB; falls back to the batch / X-Tenant-ID header, then the default
 
 
 class SuggestReplyResponse(BaseModel):
     suggested_reply: str
 
 
+class SuggestReplyBatchRequest(BaseModel):
+    items: List[SuggestReplyRequest]
+    max_concurrency: Optional[int] = None  # defaults to settings.copilot_batch_concurrency
+    tenant_id: Optional[str] = None  # default tenant for items that don't set one
+
+
+class SuggestReplyBatchItem(BaseModel):
+    index: int  # position of the item in the request
+    suggested_reply: Optional[str] = None
+    handled_by: Optional[str] = None
+    error: Optional[str] = None
+
+
 class SummarizeCaseRequest(BaseModel):
     conversation: List[ChatMessage]
 
@@ -0,0 +1,22 @@
+from typing import Any, Literal, Optional
+
+from pydantic import BaseModel
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: JobStatus
+    priority: int
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
-from typing import Any, List
+import time
+from typing import Annotated, Any, List
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
 
-from app.models.chatbot import ChatRequest, ChatResponse, ChatMessage
+from app.models.chatbot import ChatMessage, ChatRequest, ChatResponse
+from app.services.intent_router import route_faq
 from app.services.llm_client import generate_text
-from app.services.rag_service import retrieve_relevant_chunks
-from app.utils.logger import log_chatbot_call
-from app.utils.pii import mask_pii
+from app.services.prompts import PromptTemplate, format_history
+from app.services.rag_service import (
+    DEFAULT_TENANT,
+    canonical_query,
+    get_kb_version,
+    resolve_tenant_id,
+    retrieve_relevant_chunks,
+)
+from app.utils.logger import elapsed_ms, log_chatbot_call
+from app.utils.pii import mask_messages, mask_pii
 from app.utils.safety import classify_safety
 
 router = APIRouter(
@@ -31,77 +40,71 @@ You answer questions about orders, shipping, returns, refunds, and accounts.
 If you are not sure about the answer, say you are not sure and suggest contacting a human agent.
 Keep answers short, clear, and friendly.
 """
-def build_baseline_prompt(request: ChatRequest) -> str:
-    lines: List[str] = [BASELINE_SYSTEM_INSTRUCTIONS.strip(), ""]
 
-    lines.append("Conversation so far:")
-    if request.history:
-        for msg in request.history:
-            prefix = "User" if msg.role == "user" else "Assistant"
-            lines.append(f"{prefix}: {msg.content}")
-    else:
-        lines.append("(no previous messages)")
+# Precompiled prompt layouts: static system text + KB snippets form the
+# cacheable prefix, the conversation and the new query come last.
+_TURN_SUFFIX = "Conversation so far:\n{history}\n\nUser: {query}\nAssistant:"
+
+BASELINE_TEMPLATE = PromptTemplate(BASELINE_SYSTEM_INSTRUCTIONS, suffix=_TURN_SUFFIX)
+
+CHATBOT_TEMPLATE = PromptTemplate(
+    SYSTEM_INSTRUCTIONS,
+    suffix=_TURN_SUFFIX,
+    kb_header="Knowledge base snippets (treat these as ground truth if relevant):",
+    no_kb_notice=(
+        "No specific knowledge base snippets were found. "
+        "Answer only if it is generic customer-service knowledge; "
+        "otherwise, say you are not sure and suggest a human agent."
+    ),
+)
 
-    lines.append("")
-    lines.append(f"User: {request.query}")
-    lines.append("Assistant:")
-    return "\n".join(lines)
 
+def build_baseline_prompt(request: ChatRequest) -> str:
+    return BASELINE_TEMPLATE.render(
+        history=format_history(request.history or [], "User", "Assistant"),
+        query=request.query,
+    )
 
 
 def build_prompt(request: ChatRequest, contexts: List[dict[str, Any]]) -> str:
     """
-    Turn history + new query + RAG context into one prompt for Gemini.
+    Turn RAG context + history + new query into one prompt for Gemini.
     Assumes the query/history are already PII-masked if needed.
     """
-    lines: List[str] = [SYSTEM_INSTRUCTIONS.strip(), ""]
-
-    # 1) Conversation history
-    lines.append("Conversation so far:")
-    if request.history:
-        for msg in request.history:
-            prefix = "User" if msg.role == "user" else "Assistant"
-            lines.append(f"{prefix}: {msg.content}")
-    else:
-        lines.append("(no previous messages)")
-
-    # 2) RAG knowledge base snippets
-    if contexts:
-        lines.append("")
-        lines.append(
-            "Knowledge base snippets (treat these as ground truth if relevant):"
-        )
-        for i, ctx in enumerate(contexts, start=1):
-            meta = ctx.get("metadata", {}) or {}
-            src = meta.get("source", "kb")
-            lines.append(f"[{i}] Source: {src}")
-            lines.append(ctx["text"])
-            lines.append("")
-    else:
-        lines.append("")
-        lines.append(
-            "No specific knowledge base snippets were found. "
-            "Answer only if it is generic customer-service knowledge; "
-            "otherwise, say you are not sure and suggest a human agent."
-        )
+    return CHATBOT_TEMPLATE.render(
+        contexts,
+        history=format_history(request.history or [], "User", "Assistant"),
+        query=request.query,
+    )
 
-    # 3) Final user turn
-    lines.append("")
-    lines.append(f"User: {request.query}")
-    lines.append("Assistant:")
 
-    return "\n".join(lines)
+def _masked_request(query: str, history: List[dict[str, str]]) -> ChatRequest:
+    """
+    ChatRequest holding the PII-masked query and history, built without
+    re-validating input that was validated on the way in.
+    """
+    return ChatRequest.model_construct(
+        query=query,
+        history=[ChatMessage.model_construct(role=m["role"], content=m["content"]) for m in history],
+    )
 
 
 @router.post("/query", response_model=ChatResponse)
-def chatbot_query(request: ChatRequest) -> ChatResponse:
+def chatbot_query(
+    request: ChatRequest,
+    x_tenant_id: Annotated[str | None, Header()] = None,
+) -> ChatResponse:
     """
     Main chatbot endpoint with:
     - Safety classification (unsafe / out_of_scope / normal)
     - PII masking (emails, phones, card-like numbers)
-    - RAG-based prompting
+    - FAQ intent router (templated KB answer, no LLM call)
+    - RAG-based prompting over the tenant's KB (tenant_id field or X-Tenant-ID header)
     - Structured logging
     """
+    started = time.perf_counter()
+    tenant_id = resolve_tenant_id(request.tenant_id or x_tenant_id)
+
     # --- Safety classification on the raw query ---
     raw_query = request.query or ""
     safety_flag = classify_safety(raw_query)
@@ -109,20 +112,13 @@ def chatbot_query(request: ChatRequest) -> ChatResponse:
     # --- PII masking for query and history ---
     masked_query, had_pii_query = mask_pii(raw_query)
 
-    masked_history: List[ChatMessage] = []
-    had_pii_history = False
-    for msg in (request.history or []):
-        masked_content, had_pii_msg = mask_pii(msg.content)
-        if had_pii_msg:
-            had_pii_history = True
-        masked_history.append(
-            ChatMessage(role=msg.role, content=masked_content)
-        )
+    masked_history, had_pii_history = mask_messages(request.history)
 
     pii_masked = had_pii_query or had_pii_history
 
-    # Build a masked version of the request for the model
-    masked_request = ChatRequest(query=masked_query, history=masked_history)
+    # Masked version of the request for the prompt; the input was already
+    # validated, so skip re-validation
+    masked_request = _masked_request(masked_query, masked_history)
 
     # --- Handle safety / scope before calling LLM ---
     if safety_flag == "unsafe":
@@ -134,12 +130,14 @@ def chatbot_query(request: ChatRequest) -> ChatResponse:
 
         log_chatbot_call(
             query=masked_query,
-            history=[m.model_dump() for m in masked_history],
+            history=masked_history,
             reply=safe_reply,
             extra={
                 "safety_flag": safety_flag,
                 "pii_masked": pii_masked,
+                "tenant_id": tenant_id,
                 "handled_by": "safety_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return ChatResponse(reply=safe_reply)
@@ -153,30 +151,66 @@ def chatbot_query(request: ChatRequest) -> ChatResponse:
 
         log_chatbot_call(
             query=masked_query,
-            history=[m.model_dump() for m in masked_history],
+            history=masked_history,
             reply=safe_reply,
             extra={
                 "safety_flag": safety_flag,
                 "pii_masked": pii_masked,
+                "tenant_id": tenant_id,
                 "handled_by": "scope_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return ChatResponse(reply=safe_reply)
 
+    # Canonical query (case, Unicode, order numbers, typos) for the FAQ router,
+    # retrieval and their caches; the prompt keeps the customer's own wording
+    canonical = canonical_query(masked_query, tenant_id)
+
+    # --- Simple FAQ: answer from the KB section without calling the LLM ---
+    # (the FAQ answers come from the default KB, so other tenants skip it)
+    faq = route_faq(canonical) if tenant_id == DEFAULT_TENANT else None
+    if faq is not None:
+        log_chatbot_call(
+            query=masked_query,
+            history=masked_history,
+            reply=faq["reply"],
+            extra={
+                "safety_flag": safety_flag,
+                "pii_masked": pii_masked,
+                "tenant_id": tenant_id,
+                "canonical_query": canonical,
+                "intent": faq["intent"],
+                "intent_confidence": faq["confidence"],
+                "handled_by": "intent_router",
+                "latency_ms": elapsed_ms(started),
+            },
+        )
+        return ChatResponse(reply=faq["reply"])
+
     # --- Normal path: RAG + Gemini ---
-    contexts = retrieve_relevant_chunks(masked_query, n_results=3)
+    contexts = retrieve_relevant_chunks(
+        canonical,
+        n_results=3,
+        endpoint="chatbot",
+        tenant_id=tenant_id,
+    )
     prompt = build_prompt(masked_request, contexts)
     reply = generate_text(prompt)
 
     log_chatbot_call(
         query=masked_query,
-        history=[m.model_dump() for m in masked_history],
+        history=masked_history,
         reply=reply,
         extra={
             "safety_flag": safety_flag,
             "pii_masked": pii_masked,
+            "tenant_id": tenant_id,
+            "canonical_query": canonical,
             "contexts": contexts,
+            "kb_version": get_kb_version(tenant_id),
             "handled_by": "rag_chatbot",
+            "latency_ms": elapsed_ms(started),
         },
     )
 
@@ -189,23 +223,17 @@ def chatbot_query_baseline(request: ChatRequest) -> ChatResponse:
     - BUT no RAG: only system prompt + conversation
     Useful for experiments comparing quality against the RAG version.
     """
+    started = time.perf_counter()
+
     raw_query = request.query or ""
     safety_flag = classify_safety(raw_query)
 
     # PII masking
     masked_query, had_pii_query = mask_pii(raw_query)
-    masked_history: List[ChatMessage] = []
-    had_pii_history = False
-    for msg in (request.history or []):
-        masked_content, had_pii_msg = mask_pii(msg.content)
-        if had_pii_msg:
-            had_pii_history = True
-        masked_history.append(
-            ChatMessage(role=msg.role, content=masked_content)
-        )
+    masked_history, had_pii_history = mask_messages(request.history)
 
     pii_masked = had_pii_query or had_pii_history
-    masked_request = ChatRequest(query=masked_query, history=masked_history)
+    masked_request = _masked_request(masked_query, masked_history)
 
     # Safety guardrails same as main chatbot
     if safety_flag == "unsafe":
@@ -216,12 +244,13 @@ def chatbot_query_baseline(request: ChatRequest) -> ChatResponse:
         )
         log_chatbot_call(
             query=masked_query,
-            history=[m.model_dump() for m in masked_history],
+            history=masked_history,
             reply=safe_reply,
             extra={
                 "safety_flag": safety_flag,
                 "pii_masked": pii_masked,
                 "handled_by": "baseline_safety_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return ChatResponse(reply=safe_reply)
@@ -234,12 +263,13 @@ def chatbot_query_baseline(request: ChatRequest) -> ChatResponse:
         )
         log_chatbot_call(
             query=masked_query,
-            history=[m.model_dump() for m in masked_history],
+            history=masked_history,
             reply=safe_reply,
             extra={
                 "safety_flag": safety_flag,
                 "pii_masked": pii_masked,
                 "handled_by": "baseline_scope_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return ChatResponse(reply=safe_reply)
@@ -250,13 +280,14 @@ def chatbot_query_baseline(request: ChatRequest) -> ChatResponse:
 
     log_chatbot_call(
         query=masked_query,
-        history=[m.model_dump() for m in masked_history],
+        history=masked_history,
         reply=reply,
         extra={
             "safety_flag": safety_flag,
             "pii_masked": pii_masked,
             "contexts": [],
             "handled_by": "baseline_chatbot",
+            "latency_ms": elapsed_ms(started),
         },
     )
 
@@ -1,21 +1,38 @@
 from __future__ import annotations
 
-from typing import Any, List
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Annotated, Any, Dict, Iterator, List, Tuple
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
 
+from app.config import settings
 from app.models.copilot import (
+    SuggestReplyBatchItem,
+    SuggestReplyBatchRequest,
     SuggestReplyRequest,
     SuggestReplyResponse,
     SummarizeCaseRequest,
     SummarizeCaseResponse,
-    ChatMessage,
 )
 from app.services.llm_client import generate_text
-from app.services.rag_service import retrieve_relevant_chunks
-from app.utils.logger import log_copilot_call
-from app.utils.pii import mask_pii
-from app.utils.safety import classify_safety
+from app.services.prompts import PromptTemplate, format_history
+from app.services.rag_service import (
+    canonical_query,
+    get_kb_version,
+    resolve_tenant_id,
+    retrieve_relevant_chunks,
+    retrieve_relevant_chunks_batch,
+)
+from app.services.summary_cache import parse_summary_output, summary_cache
+from app.utils.hashing import message_prefix_digests
+from app.utils.logger import elapsed_ms, log_copilot_call
+from app.utils.pii import mask_messages, mask_pii
+from app.utils.safety import classify_safety, classify_safety_batch
+
+# Masked conversation messages are plain {"role", "content"} dicts (see mask_messages)
+Message = Dict[str, str]
 
 router = APIRouter(
     prefix="/copilot",
@@ -45,79 +62,131 @@ Your task:
 - Do not hallucinate extra facts; only use what is in the conversation.
 """
 
+SUMMARY_UPDATE_SYSTEM_PROMPT = """
+You are an AI assistant helping CUSTOMER SUPPORT AGENTS understand a case quickly.
+
+Your task:
+- You are given the current summary and key points of a case, plus the new messages since then.
+- Update the summary so it covers the whole case (3–6 sentences).
+- Update the key points (3–6 bullet points: issues, promises, next steps); keep ones that still apply.
+- Do not hallucinate extra facts; only use the previous summary and the new messages.
+"""
+
+SUMMARY_OUTPUT_FORMAT = (
+    "Answer in exactly this format:\n"
+    "Summary: <the summary>\n"
+    "Key points:\n"
+    "- <point>\n"
+    "- <point>"
+)
+
 
-def _format_conversation(conversation: List[ChatMessage]) -> str:
-    lines: List[str] = []
-    for msg in conversation:
-        prefix = "Customer" if msg.role == "user" else "Agent"
-        lines.append(f"{prefix}: {msg.content}")
-    return "\n".join(lines) if lines else "(no previous messages)"
+# Agent guidance returned instead of a drafted reply when guardrails trigger
+SUGGEST_UNSAFE_REPLY = (
+    "The customer's message appears to mention self-harm, violence, or another safety-critical issue. "
+    "Follow your organization's crisis and escalation procedures immediately, and avoid giving advice "
+    "beyond approved guidelines."
+)
+
+SUGGEST_OUT_OF_SCOPE_REPLY = (
+    "The customer's request seems outside the store's scope (for example, medical, legal, tax, or "
+    "investment advice). You should gently explain that this support channel can only help with orders, "
+    "shipping, returns, refunds, and account issues, and redirect the customer to an appropriate professional "
+    "or official resource."
+)
+
+SUGGEST_GUARDRAILS: Dict[str, Tuple[str, str]] = {
+    "unsafe": (SUGGEST_UNSAFE_REPLY, "safety_guardrail"),
+    "out_of_scope": (SUGGEST_OUT_OF_SCOPE_REPLY, "scope_guardrail"),
+}
+
+
+def _format_conversation(conversation: List[Message]) -> str:
+    return format_history(conversation, "Customer", "Agent")
+
+
+# Precompiled prompt layouts: static system text (+ KB snippets) form the
+# cacheable prefix, the case-specific parts come last.
+SUGGEST_TEMPLATE = PromptTemplate(
+    SUGGEST_SYSTEM_PROMPT,
+    kb_header="Relevant knowledge base snippets (treat these as ground truth):",
+    no_kb_notice=(
+        "No specific KB snippet was found. Answer only using generic customer-service best practices, "
+        "and recommend checking or escalating if needed."
+    ),
+    suffix=(
+        "Conversation so far:\n{history}\n\n"
+        "Latest customer message:\nCustomer: {customer_message}\n\n"
+        "{topic_line}"
+        "Now, draft ONE suggested reply the agent can send to the customer. "
+        "Do not mention that you used a knowledge base in your answer.\n"
+        "Suggested reply:"
+    ),
+)
+
+SUMMARY_TEMPLATE = PromptTemplate(
+    f"{SUMMARY_SYSTEM_PROMPT.strip()}\n\n{SUMMARY_OUTPUT_FORMAT}",
+    suffix=(
+        "Conversation:\n{conversation}\n\n"
+        "Now provide the summary, then key bullet points, in the format above."
+    ),
+)
+
+SUMMARY_UPDATE_TEMPLATE = PromptTemplate(
+    f"{SUMMARY_UPDATE_SYSTEM_PROMPT.strip()}\n\n{SUMMARY_OUTPUT_FORMAT}",
+    suffix=(
+        "Current summary:\n{summary}\n\n"
+        "Current key points:\n{key_points}\n\n"
+        "New messages:\n{conversation}\n\n"
+        "Now provide the updated summary, then key bullet points, in the format above."
+    ),
+)
 
 
 def build_suggest_prompt(
     customer_message: str,
-    history: List[ChatMessage],
+    history: List[Message],
     contexts: List[dict[str, Any]],
     topic_hint: str | None,
 ) -> str:
-    lines: List[str] = [SUGGEST_SYSTEM_PROMPT.strip(), ""]
-
-    # 1) Conversation so far
-    lines.append("Conversation so far:")
-    lines.append(_format_conversation(history))
-    lines.append("")
-
-    # 2) New customer message
-    lines.append("Latest customer message:")
-    lines.append(f"Customer: {customer_message}")
-    lines.append("")
-
-    # 3) Knowledge base snippets (RAG)
-    if contexts:
-        lines.append("Relevant knowledge base snippets (treat these as ground truth):")
-        for i, ctx in enumerate(contexts, start=1):
-            meta = ctx.get("metadata", {}) or {}
-            src = meta.get("source", "kb")
-            lines.append(f"[{i}] Source: {src}")
-            lines.append(ctx["text"])
-            lines.append("")
-    else:
-        lines.append(
-            "No specific KB snippet was found. Answer only using generic customer-service best practices, "
-            "and recommend checking or escalating if needed."
-        )
-        lines.append("")
-
-    # 4) Instruction to the model
-    if topic_hint:
-        lines.append(f"Topic hint: {topic_hint}")
-
-    lines.append(
-        "Now, draft ONE suggested reply the agent can send to the customer. "
-        "Do not mention that you used a knowledge base in your answer."
+    return SUGGEST_TEMPLATE.render(
+        contexts,
+        history=_format_conversation(history),
+        customer_message=customer_message,
+        topic_line=f"Topic hint: {topic_hint}\n" if topic_hint else "",
     )
-    lines.append("Suggested reply:")
 
-    return "\n".join(lines)
 
+def build_summary_prompt(conversation: List[Message]) -> str:
+    return SUMMARY_TEMPLATE.render(conversation=_format_conversation(conversation))
 
-def build_summary_prompt(conversation: List[ChatMessage]) -> str:
-    lines: List[str] = [SUMMARY_SYSTEM_PROMPT.strip(), ""]
-    lines.append("Conversation:")
-    lines.append(_format_conversation(conversation))
-    lines.append("")
-    lines.append("Now provide the summary, then key bullet points.")
-    return "\n".join(lines)
+
+def build_summary_update_prompt(
+    previous_summary: str,
+    previous_key_points: List[str],
+    new_messages: List[Message],
+) -> str:
+    return SUMMARY_UPDATE_TEMPLATE.render(
+        summary=previous_summary,
+        key_points="\n".join(f"- {p}" for p in previous_key_points or ["(none)"]),
+        conversation=_format_conversation(new_messages),
+    )
 
 
 @router.post("/suggest-reply", response_model=SuggestReplyResponse)
-def suggest_reply(req: SuggestReplyRequest) -> SuggestReplyResponse:
+def suggest_reply(
+    req: SuggestReplyRequest,
+    x_tenant_id: Annotated[str | None, Header()] = None,
+) -> SuggestReplyResponse:
     """
     Agent copilot endpoint:
     - PII masking for customer message + history
     - Safety classification (so we can guide the agent for crisis / out-of-scope cases)
-    - RAG-augmented prompt to draft a suggested reply
+    - RAG-augmented prompt over the tenant's KB (tenant_id field or X-Tenant-ID header)
     """
+    started = time.perf_counter()
+    tenant_id = resolve_tenant_id(req.tenant_id or x_tenant_id)
+
     raw_msg = req.customer_message or ""
     safety_flag = classify_safety(raw_msg)
 
@@ -125,25 +194,13 @@ def suggest_reply(req: SuggestReplyRequest) -> SuggestReplyResponse:
     masked_customer_message, had_pii_msg = mask_pii(raw_msg)
 
     # PII masking for history
-    masked_history: List[ChatMessage] = []
-    had_pii_history = False
-    for msg in (req.conversation_history or []):
-        masked_content, had_pii = mask_pii(msg.content)
-        if had_pii:
-            had_pii_history = True
-        masked_history.append(
-            ChatMessage(role=msg.role, content=masked_content)
-        )
+    masked_history, had_pii_history = mask_messages(req.conversation_history)
 
     pii_masked = had_pii_msg or had_pii_history
 
     # Safety: in copilot we return guidance to the agent instead of customer-facing text
     if safety_flag == "unsafe":
-        safe_reply = (
-            "The customer's message appears to mention self-harm, violence, or another safety-critical issue. "
-            "Follow your organization's crisis and escalation procedures immediately, and avoid giving advice "
-            "beyond approved guidelines."
-        )
+        safe_reply = SUGGEST_UNSAFE_REPLY
 
         log_copilot_call(
             mode="suggest-reply",
@@ -152,18 +209,15 @@ def suggest_reply(req: SuggestReplyRequest) -> SuggestReplyResponse:
             extra={
                 "safety_flag": safety_flag,
                 "pii_masked": pii_masked,
+                "tenant_id": tenant_id,
                 "handled_by": "safety_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return SuggestReplyResponse(suggested_reply=safe_reply)
 
     if safety_flag == "out_of_scope":
-        safe_reply = (
-            "The customer's request seems outside the store's scope (for example, medical, legal, tax, or "
-            "investment advice). You should gently explain that this support channel can only help with orders, "
-            "shipping, returns, refunds, and account issues, and redirect the customer to an appropriate professional "
-            "or official resource."
-        )
+        safe_reply = SUGGEST_OUT_OF_SCOPE_REPLY
 
         log_copilot_call(
             mode="suggest-reply",
@@ -172,17 +226,23 @@ def suggest_reply(req: SuggestReplyRequest) -> SuggestReplyResponse:
             extra={
                 "safety_flag": safety_flag,
                 "pii_masked": pii_masked,
+                "tenant_id": tenant_id,
                 "handled_by": "scope_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return SuggestReplyResponse(suggested_reply=safe_reply)
 
-    # Normal path: RAG + Gemini
-    rag_query = masked_customer_message
-    if req.topic_hint:
-        rag_query = f"{req.topic_hint}: {masked_customer_message}"
-
-    contexts = retrieve_relevant_chunks(rag_query, n_results=3)
+    # Normal path: RAG + Gemini (the topic hint is folded into the retrieval query;
+    # retrieval uses the canonical query, the prompt the customer's own wording)
+    canonical = canonical_query(masked_customer_message, tenant_id)
+    contexts = retrieve_relevant_chunks(
+        canonical,
+        n_results=3,
+        topic_hint=req.topic_hint,
+        endpoint="suggest_reply",
+        tenant_id=tenant_id,
+    )
     prompt = build_suggest_prompt(
         customer_message=masked_customer_message,
         history=masked_history,
@@ -198,14 +258,145 @@ def suggest_reply(req: SuggestReplyRequest) -> SuggestReplyResponse:
         extra={
             "safety_flag": safety_flag,
             "pii_masked": pii_masked,
+            "tenant_id": tenant_id,
+            "canonical_query": canonical,
             "contexts": contexts,
+            "kb_version": get_kb_version(tenant_id),
             "handled_by": "rag_copilot",
+            "latency_ms": elapsed_ms(started),
         },
     )
 
     return SuggestReplyResponse(suggested_reply=reply)
 
 
+def _ndjson(item: SuggestReplyBatchItem) -> str:
+    # Pydantic serializes straight to JSON (no intermediate dict + json.dumps)
+    return item.model_dump_json() + "\n"
+
+
+@router.post("/suggest-reply/batch")
+def suggest_reply_batch(
+    req: SuggestReplyBatchRequest,
+    x_tenant_id: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    """
+    Batch version of /suggest-reply for agent ticket queues.
+    - Guardrails for all items in one vectorized pass
+    - One batched embedding call + Chroma query per tenant for the items that need RAG
+      (item tenant_id, else the batch tenant_id, else the X-Tenant-ID header)
+    - LLM generations run concurrently (bounded by max_concurrency)
+    Results are streamed as NDJSON (one SuggestReplyBatchItem per line) in
+    completion order; a failing item reports `error` instead of failing the batch.
+    """
+    started = time.perf_counter()
+
+    items = req.items
+    if len(items) > settings.copilot_batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.copilot_batch_max_items} items per batch",
+        )
+    concurrency = max(1, min(req.max_concurrency or settings.copilot_batch_concurrency, len(items) or 1))
+    # Resolved before streaming starts, so an unknown tenant is still a plain 404
+    tenant_ids = [resolve_tenant_id(item.tenant_id or req.tenant_id or x_tenant_id) for item in items]
+
+    def _log(index: int, reply: str, extra: Dict[str, Any]) -> None:
+        log_copilot_call(
+            mode="suggest-reply",
+            payload=items[index].model_dump(),
+            output={"suggested_reply": reply},
+            extra={
+                **extra,
+                "tenant_id": tenant_ids[index],
+                "batch_size": len(items),
+                "latency_ms": elapsed_ms(started),
+            },
+        )
+
+    def _stream() -> Iterator[str]:
+        # 1) Guardrails + PII masking for the whole batch
+        safety_flags = classify_safety_batch([item.customer_message or "" for item in items])
+
+        rag_items: List[Tuple[int, str, List[Message], bool]] = []
+        for i, (item, safety_flag) in enumerate(zip(items, safety_flags)):
+            masked_customer_message, had_pii_msg = mask_pii(item.customer_message or "")
+            masked_history, had_pii_history = mask_messages(item.conversation_history)
+            pii_masked = had_pii_msg or had_pii_history
+
+            if safety_flag in SUGGEST_GUARDRAILS:
+                safe_reply, handled_by = SUGGEST_GUARDRAILS[safety_flag]
+                _log(i, safe_reply, {"safety_flag": safety_flag, "pii_masked": pii_masked, "handled_by": handled_by})
+                yield _ndjson(SuggestReplyBatchItem(index=i, suggested_reply=safe_reply, handled_by=handled_by))
+                continue
+
+            rag_items.append((i, masked_customer_message, masked_history, pii_masked))
+
+        if not rag_items:
+            return
+
+        # 2) Shared retrieval for every item that needs RAG, one batch per tenant
+        by_tenant: Dict[str, List[Tuple[int, str, List[Message], bool]]] = {}
+        for entry in rag_items:
+            by_tenant.setdefault(tenant_ids[entry[0]], []).append(entry)
+
+        all_contexts: Dict[int, List[dict[str, Any]]] = {}
+        for tenant_id, group in by_tenant.items():
+            try:
+                results = retrieve_relevant_chunks_batch(
+                    [canonical_query(msg, tenant_id) for _, msg, _, _ in group],
+                    n_results=3,
+                    topic_hints=[items[i].topic_hint for i, _, _, _ in group],
+                    endpoint="suggest_reply",
+                    tenant_id=tenant_id,
+                )
+            except Exception as exc:
+                for i, _, _, _ in group:
+                    yield _ndjson(SuggestReplyBatchItem(index=i, error=f"retrieval failed: {exc}"))
+                continue
+            for (i, _, _, _), contexts in zip(group, results):
+                all_contexts[i] = contexts
+
+        # 3) Concurrent generations, streamed back as they complete
+        def _generate(i: int, msg: str, history: List[Message], contexts: List[dict[str, Any]]) -> str:
+            prompt = build_suggest_prompt(
+                customer_message=msg,
+                history=history,
+                contexts=contexts,
+                topic_hint=items[i].topic_hint,
+            )
+            return generate_text(prompt)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {
+                pool.submit(_generate, i, msg, history, all_contexts[i]): (i, pii_masked, all_contexts[i])
+                for i, msg, history, pii_masked in rag_items
+                if i in all_contexts
+            }
+            for fut in as_completed(futures):
+                i, pii_masked, contexts = futures[fut]
+                try:
+                    reply = fut.result()
+                except Exception as exc:
+                    yield _ndjson(SuggestReplyBatchItem(index=i, error=str(exc)))
+                    continue
+
+                _log(
+                    i,
+                    reply,
+                    {
+                        "safety_flag": "normal",
+                        "pii_masked": pii_masked,
+                        "contexts": contexts,
+                        "kb_version": get_kb_version(tenant_ids[i]),
+                        "handled_by": "rag_copilot",
+                    },
+                )
+                yield _ndjson(SuggestReplyBatchItem(index=i, suggested_reply=reply, handled_by="rag_copilot"))
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
 @router.post("/summarize-case", response_model=SummarizeCaseResponse)
 def summarize_case(req: SummarizeCaseRequest) -> SummarizeCaseResponse:
     """
@@ -214,20 +405,14 @@ def summarize_case(req: SummarizeCaseRequest) -> SummarizeCaseResponse:
     - Safety classification on conversation content
     - Logs with safety + pii flags
     """
+    started = time.perf_counter()
+
     # Combine conversation text for safety classification
     combined_text = " ".join(msg.content for msg in req.conversation or [])
     safety_flag = classify_safety(combined_text)
 
     # PII mask conversation
-    masked_conversation: List[ChatMessage] = []
-    had_pii = False
-    for msg in req.conversation:
-        masked_content, had_pii_msg = mask_pii(msg.content)
-        if had_pii_msg:
-            had_pii = True
-        masked_conversation.append(
-            ChatMessage(role=msg.role, content=masked_content)
-        )
+    masked_conversation, had_pii = mask_messages(req.conversation)
 
     # For unsafe content, we still can provide a short guidance summary for the agent
     if safety_flag == "unsafe":
@@ -245,28 +430,56 @@ def summarize_case(req: SummarizeCaseRequest) -> SummarizeCaseResponse:
                 "safety_flag": safety_flag,
                 "pii_masked": had_pii,
                 "handled_by": "safety_guardrail",
+                "latency_ms": elapsed_ms(started),
             },
         )
         return SummarizeCaseResponse(summary=summary_text, key_points=[])
 
-    # Normal path: summarize via LLM
-    prompt = build_summary_prompt(masked_conversation)
-    text = generate_text(prompt)
+    # Normal path: summarize via LLM, reusing cached summaries of earlier
+    # prefixes of this conversation (keyed by prefix digest)
+    digests = message_prefix_digests(masked_conversation)
+    cached = summary_cache.get(digests[-1])
+
+    if cached is not None:
+        # Same conversation summarized before: no LLM call
+        summary, key_points = cached["summary"], cached["key_points"]
+        handled_by = "summary_cache"
+    else:
+        prefix_len, previous = summary_cache.longest_prefix(digests)
+        if previous is not None:
+            # Only summarize the new turns and merge them into the previous summary
+            prompt = build_summary_update_prompt(
+                previous["summary"],
+                previous["key_points"],
+                masked_conversation[prefix_len:],
+            )
+            handled_by = "summary_copilot_incremental"
+        else:
+            prompt = build_summary_prompt(masked_conversation)
+            handled_by = "summary_copilot"
+
+        text = generate_text(prompt)
+        summary, key_points = parse_summary_output(text)
+        # Never cache the canned reply the LLM client returns when Gemini is down
+        if text != settings.llm_fallback_reply:
+            summary_cache.put(
+                digests[-1],
+                {"summary": summary, "key_points": key_points, "length": len(masked_conversation)},
+            )
 
-    # For now we return the full text as summary and keep key_points empty.
-    # You can later parse bullet points into key_points if you want more structure.
     log_copilot_call(
         mode="summarize-case",
         payload=req.model_dump(),
-        output={"summary": text, "key_points": []},
+        output={"summary": summary, "key_points": key_points},
         extra={
             "safety_flag": safety_flag,
             "pii_masked": had_pii,
-            "handled_by": "summary_copilot",
+            "handled_by": handled_by,
+            "latency_ms": elapsed_ms(started),
         },
     )
 
     return SummarizeCaseResponse(
-        summary=text,
-        key_points=[],
+        summary=summary,
+        key_points=key_points,
     )
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Annotated, Any, Dict, List
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.config import settings
+from app.models.chatbot import ChatRequest
+from app.models.copilot import (
+    SuggestReplyBatchRequest,
+    SuggestReplyRequest,
+    SummarizeCaseRequest,
+)
+from app.models.jobs import JobStatusResponse, JobSubmitResponse
+from app.routers.chatbot import chatbot_query
+from app.routers.copilot import suggest_reply, suggest_reply_batch, summarize_case
+from app.services.rag_service import resolve_tenant_id
+from app.services.jobs import (
+    PRIORITY_BATCH,
+    PRIORITY_LIVE_CHAT,
+    PRIORITY_SUGGEST_REPLY,
+    PRIORITY_SUMMARY,
+    Job,
+    JobQueue,
+    create_job_store,
+)
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+)
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]  # .../backend
+
+job_queue = JobQueue(
+    store=create_job_store(settings.jobs_store, BACKEND_DIR / settings.jobs_db_path),
+    workers=settings.jobs_workers,
+    max_retries=settings.jobs_max_retries,
+    retry_backoff_sec=settings.jobs_retry_backoff_sec,
+    result_ttl_sec=settings.jobs_result_ttl_sec,
+    lease_sec=settings.jobs_lease_sec,
+)
+
+
+# ---------- Handlers (reuse the synchronous endpoints) ----------
+
+def _run_chatbot_query(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return chatbot_query(ChatRequest(**payload)).model_dump()
+
+
+def _run_suggest_reply(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return suggest_reply(SuggestReplyRequest(**payload)).model_dump()
+
+
+def _run_summarize_case(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return summarize_case(SummarizeCaseRequest(**payload)).model_dump()
+
+
+async def _run_suggest_reply_batch(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    response = suggest_reply_batch(SuggestReplyBatchRequest(**payload))
+    items: List[Dict[str, Any]] = []
+    async for chunk in response.body_iterator:
+        text = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        items.extend(json.loads(line) for line in text.splitlines() if line.strip())
+    return sorted(items, key=lambda item: item["index"])
+
+
+job_queue.register("chatbot-query", _run_chatbot_query, PRIORITY_LIVE_CHAT)
+job_queue.register("suggest-reply", _run_suggest_reply, PRIORITY_SUGGEST_REPLY)
+job_queue.register("suggest-reply-batch", _run_suggest_reply_batch, PRIORITY_BATCH)
+job_queue.register("summarize-case", _run_summarize_case, PRIORITY_SUMMARY)
+
+
+# ---------- Endpoints ----------
+
+def _status(job: Job) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        priority=job["priority"],
+        attempts=job["attempts"],
+        result=job["result"],
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+    )
+
+
+def _submitted(job: Job) -> JobSubmitResponse:
+    return JobSubmitResponse(job_id=job["id"], status=job["status"])
+
+
+def _tenant_payload(req: Any, x_tenant_id: str | None) -> Dict[str, Any]:
+    """
+    Job payload with the X-Tenant-ID header folded in; tenants are checked at
+    submit time so a typo is a 404 now rather than a failed job later.
+    """
+    payload = req.model_dump()
+    payload["tenant_id"] = resolve_tenant_id(payload.get("tenant_id") or x_tenant_id)
+    for item in payload.get("items") or []:
+        if item.get("tenant_id"):
+            resolve_tenant_id(item["tenant_id"])
+    return payload
+
+
+@router.post("/chatbot-query", response_model=JobSubmitResponse, status_code=202)
+async def submit_chatbot_query(
+    request: ChatRequest,
+    x_tenant_id: Annotated[str | None, Header()] = None,
+) -> JobSubmitResponse:
+    return _submitted(await job_queue.submit("chatbot-query", _tenant_payload(request, x_tenant_id)))
+
+
+@router.post("/suggest-reply", response_model=JobSubmitResponse, status_code=202)
+async def submit_suggest_reply(
+    req: SuggestReplyRequest,
+    x_tenant_id: Annotated[str | None, Header()] = None,
+) -> JobSubmitResponse:
+    return _submitted(await job_queue.submit("suggest-reply", _tenant_payload(req, x_tenant_id)))
+
+
+@router.post("/suggest-reply/batch", response_model=JobSubmitResponse, status_code=202)
+async def submit_suggest_reply_batch(
+    req: SuggestReplyBatchRequest,
+    x_tenant_id: Annotated[str | None, Header()] = None,
+) -> JobSubmitResponse:
+    return _submitted(await job_queue.submit("suggest-reply-batch", _tenant_payload(req, x_tenant_id)))
+
+
+@router.post("/summarize-case", response_model=JobSubmitResponse, status_code=202)
+async def submit_summarize_case(req: SummarizeCaseRequest) -> JobSubmitResponse:
+    return _submitted(await job_queue.submit("summarize-case", req.model_dump()))
+
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str) -> JobStatusResponse:
+    """
+    Poll a job. Results stay available for `jobs_result_ttl_sec` after completion.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return _status(job)
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str) -> StreamingResponse:
+    """
+    Server-Sent Events stream: one event per status change, named after the
+    status, ending after "succeeded" or "failed".
+    """
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def _stream():
+        async for job in job_queue.subscribe(job_id):
+            if job is None:
+                yield ": keepalive\n\n"
+                continue
+            data = _status(job).model_dump_json()
+            yield f"event: {job['status']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
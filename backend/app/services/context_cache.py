@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.utils.hashing import text_digest
+
+# create(model_name, prefix, ttl_sec) -> provider handle (e.g. a Gemini CachedContent)
+CreateCache = Callable[[str, str, int], Any]
+
+
+class PrefixContextCache:
+    """
+    Tracks stable prompt prefixes and creates a provider-side context cache
+    for the ones that are reused, so later calls only send the suffix.
+
+    - a prefix is cached once it has been seen `min_uses` times and is at
+      least `min_chars` long (providers reject tiny caches)
+    - handles are dropped a little before their TTL runs out
+    - if creation fails the prefix is marked uncacheable for one TTL, so a
+      bad model/size combination doesn't cost an extra request every call
+    """
+
+    def __init__(
+        self,
+        create: CreateCache,
+        ttl_sec: int = 600,
+        min_chars: int = 4096,
+        min_uses: int = 2,
+        max_entries: int = 256,
+    ) -> None:
+        self._create = create
+        self.ttl_sec = ttl_sec
+        self.min_chars = min_chars
+        self.min_uses = min_uses
+        self.max_entries = max_entries
+        # (model, prefix digest) -> [uses, handle or None, expires_at]
+        self._entries: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.create_failures = 0
+
+    def lookup(self, model_name: str, prefix: str) -> Optional[Any]:
+        """
+        Handle for a live cache of `prefix`, creating one when it is due.
+        """
+        if len(prefix) < self.min_chars:
+            return None
+        key = (model_name, text_digest(prefix))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [0, None, 0.0]
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            entry[0] += 1
+            if entry[2] > now:
+                return entry[1]
+            if entry[0] < self.min_uses:
+                return None
+
+        # Create outside the lock (network call); a concurrent duplicate is harmless
+        try:
+            handle = self._create(model_name, prefix, self.ttl_sec)
+        except Exception:
+            handle = None
+        with self._lock:
+            if handle is None:
+                self.create_failures += 1
+            else:
+                self.created += 1
+            # Leave a safety margin so we never use a handle the provider just expired
+            entry[1], entry[2] = handle, now + self.ttl_sec * 0.9
+        return handle
+
+    def forget(self, model_name: str, prefix: str) -> None:
+        """
+        Drop a handle the provider no longer knows (e.g. deleted early).
+        """
+        with self._lock:
+            self._entries.pop((model_name, text_digest(prefix)), None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            live = sum(1 for e in self._entries.values() if e[1] is not None and e[2] > now)
+            tracked = len(self._entries)
+        return {
+            "tracked_prefixes": tracked,
+            "live_caches": live,
+            "created": self.created,
+            "create_failures": self.create_failures,
+        }
+
+
+class LLMUsageStats:
+    """
+    Running totals of input tokens and latency, split by whether the call
+    went through a context cache, to report what prefix caching saves.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, cached: bool, prompt_tokens: int, cached_tokens: int, latency_ms: float) -> None:
+        with self._lock:
+            bucket = self._totals.setdefault(
+                "cached" if cached else "uncached",
+                {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "latency_ms": 0.0},
+            )
+            bucket["calls"] += 1
+            bucket["prompt_tokens"] += prompt_tokens
+            bucket["cached_tokens"] += cached_tokens
+            bucket["latency_ms"] += latency_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {k: dict(v) for k, v in self._totals.items()}
+        out: Dict[str, Any] = {}
+        prompt_total = cached_total = 0
+        for name, b in totals.items():
+            prompt_total += int(b["prompt_tokens"])
+            cached_total += int(b["cached_tokens"])
+            out[name] = {
+                "calls": int(b["calls"]),
+                "prompt_tokens": int(b["prompt_tokens"]),
+                "cached_tokens": int(b["cached_tokens"]),
+                "avg_prompt_tokens": round(b["prompt_tokens"] / b["calls"], 1),
+                "avg_latency_ms": round(b["latency_ms"] / b["calls"], 1),
+            }
+        # Includes implicit (provider-side automatic) prefix cache hits
+        out["cached_token_share"] = round(cached_total / prompt_total, 4) if prompt_total else None
+        return out
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+
+def filter_by_relevance(
+    chunks: List[Dict[str, Any]],
+    max_distance: Optional[float],
+    max_gap: Optional[float],
+) -> List[Dict[str, Any]]:
+    """
+    Adaptive k: keep chunks (sorted by distance) while they are
+    - closer than `max_distance` (absolute relevance threshold), and
+    - within `max_gap` of the best chunk (stop once the score falls off).
+    """
+    ranked = sorted(chunks, key=lambda c: c.get("distance", 0.0))
+    kept: List[Dict[str, Any]] = []
+    for chunk in ranked:
+        dist = chunk.get("distance", 0.0)
+        if max_distance is not None and dist > max_distance:
+            break
+        if max_gap is not None and kept and dist - kept[0].get("distance", 0.0) > max_gap:
+            break
+        kept.append(chunk)
+    return kept
+
+
+def filter_by_rerank_score(
+    chunks: List[Dict[str, Any]],
+    max_distance: Optional[float],
+    max_gap: Optional[float],
+) -> List[Dict[str, Any]]:
+    """
+    Adaptive k for reranked chunks, keeping the rerank order:
+    - nothing at all when even the nearest chunk is farther than
+      `max_distance` (fused scores are relative to the candidate set, so
+      only the vector distance says the query matches nothing in the KB)
+    - otherwise chunks while their rerank_score is within `max_gap` of the top one
+    """
+    if not chunks:
+        return []
+    if max_distance is not None and min(c.get("distance", 0.0) for c in chunks) > max_distance:
+        return []
+    top = chunks[0].get("rerank_score", 0.0)
+    kept: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        if max_gap is not None and kept and top - chunk.get("rerank_score", 0.0) > max_gap:
+            break
+        kept.append(chunk)
+    return kept
+
+
+def merge_adjacent_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge chunks that are neighbours in the same KB document (same base_id,
+    consecutive chunk_index) into one snippet, so the prompt shows one
+    continuous passage instead of two overlapping-looking ones.
+    Expects ranked input (by distance or rerank score); each merged group
+    takes the rank of its best (first) chunk, so the ranking is kept.
+    """
+    groups: List[List[Dict[str, Any]]] = []
+    for chunk in chunks:
+        meta = chunk.get("metadata", {}) or {}
+        base_id, idx = meta.get("base_id"), meta.get("chunk_index")
+        placed = False
+        if base_id is not None and isinstance(idx, int):
+            for group in groups:
+                gmeta = [(c.get("metadata", {}) or {}) for c in group]
+                if gmeta[0].get("base_id") != base_id:
+                    continue
+                indexes = [m.get("chunk_index") for m in gmeta]
+                if idx == min(indexes) - 1 or idx == max(indexes) + 1:
+                    group.append(chunk)
+                    placed = True
+                    break
+        if not placed:
+            groups.append([chunk])
+
+    merged: List[Dict[str, Any]] = []
+    for group in groups:
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        group.sort(key=lambda c: (c.get("metadata", {}) or {}).get("chunk_index", 0))
+        best = min(c.get("distance", 0.0) for c in group)
+        item = {
+            "id": group[0].get("id"),
+            "text": "\n\n".join(c["text"] for c in group),
+            "metadata": group[0].get("metadata", {}),
+            "distance": best,
+            "merged_ids": [c.get("id") for c in group],
+        }
+        if any("rerank_score" in c for c in group):
+            item["rerank_score"] = max(c.get("rerank_score", 0.0) for c in group)
+        merged.append(item)
+    return merged
+
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+
+# handled_by values of logged requests that made an LLM call
+LLM_HANDLERS = {
+    "rag_chatbot",
+    "baseline_chatbot",
+    "rag_copilot",
+    "summary_copilot",
+    "summary_copilot_incremental",
+}
+
+FAKE_REPLY = "[fake LLM reply]"
+
+
+def _logged_latencies(log_dir: Path) -> List[float]:
+    out: List[float] = []
+    for path in sorted(log_dir.glob("*_logs.jsonl")):
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    extra = json.loads(line).get("extra") or {}
+                except (ValueError, AttributeError):
+                    continue
+                latency = extra.get("latency_ms")
+                if extra.get("handled_by") in LLM_HANDLERS and isinstance(latency, (int, float)) and latency > 0:
+                    out.append(float(latency))
+    return out
+
+
+class FakeLLM:
+    """
+    Stand-in for Gemini during load tests (settings.llm_fake, see
+    tools/log_replay.py): no network calls, but the same blocking time.
+
+    - generate() sleeps for a latency drawn from the logged `latency_ms` of
+      requests that called the LLM (end-to-end request time, so it slightly
+      overstates the LLM share); without logged timings it draws from a
+      log-normal around `fallback_ms`
+    - embed() returns deterministic hash vectors after `embed_latency_ms`
+    """
+
+    def __init__(
+        self,
+        log_dir: Path,
+        fallback_ms: float = 1500.0,
+        embed_latency_ms: float = 150.0,
+        dim: int = 768,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.samples = _logged_latencies(log_dir) if log_dir.exists() else []
+        self.fallback_ms = fallback_ms
+        self.embed_latency_ms = embed_latency_ms
+        self.dim = dim
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_ms(self) -> float:
+        with self._lock:
+            if self.samples:
+                return self._rng.choice(self.samples)
+            # sigma 0.4: p95 is ~1.9x the median, typical for hosted LLM calls
+            return self.fallback_ms * math.exp(self._rng.gauss(0.0, 0.4))
+
+    def generate(self, prompt: str, model_name: str, timeout_sec: float) -> str:
+        """
+        Provider for ResilientLLMClient (same signature as _gemini_provider).
+        """
+        delay = self.sample_ms() / 1000
+        time.sleep(min(delay, timeout_sec))
+        if delay > timeout_sec:
+            raise TimeoutError("fake LLM timed out")
+        return FAKE_REPLY
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 - 0.5 for i in range(self.dim)]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.embed_latency_ms / 1000)
+        return [self._vector(t) for t in texts]
+
+
+_instance: Optional[FakeLLM] = None
+_instance_lock = threading.Lock()
+
+
+def get_fake_llm() -> FakeLLM:
+    """
+    The process-wide FakeLLM, configured from settings on first use.
+    """
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = FakeLLM(
+                Path(__file__).resolve().parents[2] / settings.llm_fake_latency_logs,
+                fallback_ms=settings.llm_fake_latency_ms,
+                embed_latency_ms=settings.llm_fake_embed_latency_ms,
+            )
+        return _instance
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.utils.text import content_tokens
+
+KB_DIR = Path(__file__).resolve().parents[1] / "kb"
+
+# FAQ intents that can be answered straight from one KB section.
+# "section" is the heading prefix in kb/<kb>.md; its bullets become the answer.
+FAQ_INTENTS: List[Dict[str, Any]] = [
+    {
+        "name": "return_window",
+        "kb": "returns_and_refunds",
+        "section": "1. General Return Policy",
+        "lead": "Here is our general return policy:",
+        "examples": [
+            "what is your return policy",
+            "how many days do i have to return an item",
+            "how long is the return window",
+            "can i return an item",
+            "what is the time limit for returns",
+            "return policy days",
+        ],
+    },
+    {
+        "name": "non_returnable_items",
+        "kb": "returns_and_refunds",
+        "section": "2. Non-Returnable Items",
+        "lead": "These items are usually not eligible for return (unless defective or damaged on arrival):",
+        "examples": [
+            "which items cannot be returned",
+            "what items are non returnable",
+            "can i return a gift card",
+            "are final sale items returnable",
+            "can i return digital products",
+        ],
+    },
+    {
+        "name": "return_shipping_cost",
+        "kb": "returns_and_refunds",
+        "section": "4. Return Shipping Costs",
+        "lead": "Here is who pays for return shipping:",
+        "examples": [
+            "who pays for return shipping",
+            "is return shipping free",
+            "do i have to pay to send a return back",
+            "return shipping cost",
+        ],
+    },
+    {
+        "name": "refund_timing",
+        "kb": "returns_and_refunds",
+        "section": "6. Refund Methods and Timing",
+        "lead": "Here is how and when refunds are issued:",
+        "examples": [
+            "how long does a refund take",
+            "when will i get my refund",
+            "how are refunds paid",
+            "refund processing time",
+            "how many days for refund",
+        ],
+    },
+    {
+        "name": "order_processing_time",
+        "kb": "orders_and_shipping",
+        "section": "2. Order Processing Time",
+        "lead": "Here is how long order processing takes:",
+        "examples": [
+            "how long does it take to process an order",
+            "when will my order be processed",
+            "order processing time",
+            "how long before my order ships",
+        ],
+    },
+    {
+        "name": "shipping_times",
+        "kb": "orders_and_shipping",
+        "section": "3. Shipping Methods and Delivery Times",
+        "lead": "Here are our shipping options and delivery times:",
+        "examples": [
+            "how long does shipping take",
+            "what are the shipping options",
+            "how long does standard shipping take",
+            "how fast is express shipping",
+            "delivery time for international shipping",
+            "shipping methods and delivery times",
+        ],
+    },
+    {
+        "name": "shipping_fees",
+        "kb": "orders_and_shipping",
+        "section": "4. Shipping Fees",
+        "lead": "Here is how shipping fees work:",
+        "examples": [
+            "how much is shipping",
+            "what are the shipping fees",
+            "do you offer free shipping",
+            "shipping cost",
+        ],
+    },
+    {
+        "name": "order_tracking",
+        "kb": "orders_and_shipping",
+        "section": "5. Order Tracking",
+        "lead": "Here is how to track an order:",
+        "examples": [
+            "how do i track my order",
+            "where can i find my tracking number",
+            "how can i see the tracking link",
+            "order tracking",
+        ],
+    },
+    {
+        "name": "forgot_password",
+        "kb": "account_and_security",
+        "section": "2.2 Forgot Password",
+        "lead": "Here is how to reset your password:",
+        "examples": [
+            "i forgot my password",
+            "how do i reset my password",
+            "password reset link",
+            "cannot remember my password",
+        ],
+    },
+]
+
+# Examples of case-specific questions that need the full RAG + LLM path.
+# If one of these is the best match, we never short-circuit.
+NEEDS_LLM_EXAMPLES = [
+    "my order has not arrived yet",
+    "i did not receive my order",
+    "my order was supposed to arrive days ago but it is still not here",
+    "my package is late what can you do",
+    "my item arrived damaged",
+    "i received the wrong item",
+    "my package is lost",
+    "i want to cancel my order",
+    "i want to change my shipping address",
+    "i bought something days ago can i still return it and get a refund",
+    "my refund has not arrived yet",
+    "i got a login alert i do not recognize how do i secure my account",
+    "someone accessed my account",
+    "i want to delete my account",
+    "hello how are you",
+]
+
+FAQ_FOOTER = "If your question is about a specific order, just let me know and I can help further or connect you with a human agent."
+
+# Agent-only instructions in the KB markdown that aren't blockquoted
+_AGENT_NOTE_RE = re.compile(r"\bagents should\b", re.IGNORECASE)
+
+
+def _load_section(kb: str, heading: str) -> str:
+    """
+    Customer-facing text of one KB section: its lines up to the next heading
+    of the same or higher level, minus separators and agent-only notes:
+    "> " blockquotes and "Agents should ..." instructions. Matching the
+    instruction phrase, not the word "agent", keeps customer lines such as
+    "connect you with a human agent".
+    """
+    path = KB_DIR / f"{kb}.md"
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return ""
+
+    out: List[str] = []
+    level = 0
+    for line in lines:
+        m = re.match(r"^(#+)\s+(.*)$", line)
+        if level == 0:
+            if m and m.group(2).strip().startswith(heading):
+                level = len(m.group(1))
+            continue
+        if m and len(m.group(1)) <= level:
+            break
+        stripped = line.strip()
+        if not stripped or stripped == "---" or stripped.startswith(">") or _AGENT_NOTE_RE.search(stripped):
+            continue
+        if m:
+            # Sub-heading (e.g. "### 3.1 Standard Shipping") becomes a plain label
+            stripped = re.sub(r"^\d+(\.\d+)*\s*", "", m.group(2)).strip() + ":"
+        out.append(line.rstrip() if line.startswith(" ") else stripped)
+    return "\n".join(out).replace("**", "")
+
+
+class IntentRouter:
+    """
+    Tiny TF-IDF nearest-centroid classifier over example utterances.
+    Runs in microseconds, needs no model download and no network call.
+    """
+
+    def __init__(self, intents: List[Dict[str, Any]], needs_llm_examples: List[str]) -> None:
+        labelled = [(intent["name"], ex) for intent in intents for ex in intent["examples"]]
+        labelled += [("needs_llm", ex) for ex in needs_llm_examples]
+
+        docs = [content_tokens(ex) for _, ex in labelled]
+        df = Counter(tok for doc in docs for tok in set(doc))
+        n_docs = len(docs)
+        self._idf = {tok: math.log((1 + n_docs) / (1 + n)) + 1 for tok, n in df.items()}
+
+        # One normalized centroid vector per label
+        sums: Dict[str, Counter] = {}
+        for (label, _), doc in zip(labelled, docs):
+            sums.setdefault(label, Counter()).update(self._vector(doc))
+        self._centroids = {label: self._normalize(vec) for label, vec in sums.items()}
+
+        self._intents = {intent["name"]: intent for intent in intents}
+        self._answers = {
+            intent["name"]: _load_section(intent["kb"], intent["section"]) for intent in intents
+        }
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        tf = Counter(tokens)
+        vec = {tok: n * self._idf[tok] for tok, n in tf.items() if tok in self._idf}
+        return self._normalize(vec)
+
+    @staticmethod
+    def _normalize(vec: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(v * v for v in vec.values()))
+        return {k: v / norm for k, v in vec.items()} if norm else {}
+
+    def scores(self, query: str) -> List[tuple[str, float]]:
+        qvec = self._vector(content_tokens(query))
+        ranked = [
+            (label, sum(w * centroid.get(tok, 0.0) for tok, w in qvec.items()))
+            for label, centroid in self._centroids.items()
+        ]
+        return sorted(ranked, key=lambda kv: kv[1], reverse=True)
+
+    def route(
+        self,
+        query: str,
+        min_confidence: float,
+        min_margin: float,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return {"intent", "confidence", "margin", "reply"} when the query is a
+        high-confidence FAQ, else None (use the normal RAG + LLM path).
+        """
+        # One known word (e.g. just "order") is not enough evidence for a canned answer
+        if sum(1 for tok in set(content_tokens(query)) if tok in self._idf) < 2:
+            return None
+        ranked = self.scores(query)
+        if not ranked:
+            return None
+        label, top = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        if label == "needs_llm" or top < min_confidence or top - second < min_margin:
+            return None
+        section = self._answers.get(label)
+        if not section:
+            return None
+
+        intent = self._intents[label]
+        reply = f"{intent['lead']}\n\n{section}\n\n{FAQ_FOOTER}"
+        return {
+            "intent": label,
+            "confidence": round(top, 3),
+            "margin": round(top - second, 3),
+            "reply": reply,
+        }
+
+
+intent_router = IntentRouter(FAQ_INTENTS, NEEDS_LLM_EXAMPLES)
+
+
+def route_faq(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Fast pre-LLM check used by the chatbot; None when disabled or not confident.
+    """
+    if not settings.intent_router_enabled:
+        return None
+    return intent_router.route(
+        query,
+        min_confidence=settings.intent_router_min_confidence,
+        min_margin=settings.intent_router_min_margin,
+    )
@@ -0,0 +1,458 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from fastapi import HTTPException
+
+# A job is a plain dict:
+# {"id", "kind", "priority", "status", "payload", "result", "error",
+#  "attempts", "created_at", "updated_at", "expires_at", "owner", "lease_expires_at"}
+Job = Dict[str, Any]
+Handler = Callable[[Dict[str, Any]], Union[Any, Awaitable[Any]]]
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+# Lower number = served first. Live chat goes ahead of agent tooling.
+PRIORITY_LIVE_CHAT = 0
+PRIORITY_SUGGEST_REPLY = 10
+PRIORITY_BATCH = 20
+PRIORITY_SUMMARY = 30
+
+
+# ---------- Persistence ----------
+
+class JobStore(ABC):
+    """
+    Pluggable persistence for jobs. JobQueue calls every method through
+    asyncio.to_thread(), so implementations may block but must be thread-safe.
+
+    Several processes may share one store: a worker only runs a job after
+    claim() moved it from "queued" to "running" under its owner ID, and
+    holds it with a lease it keeps renewing. Running jobs whose lease
+    expired (their process died) are handed back by requeue_expired().
+    """
+
+    @abstractmethod
+    def save(self, job: Job) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def list_queued(self) -> List[Job]:
+        ...
+
+    @abstractmethod
+    def claim(self, job_id: str, owner: str, lease_expires_at: float) -> Optional[Job]:
+        """
+        Atomically mark a queued job running for `owner` (and count the
+        attempt); None if it is no longer queued, e.g. another worker won.
+        """
+
+    @abstractmethod
+    def renew_lease(self, job_id: str, owner: str, lease_expires_at: float) -> bool:
+        ...
+
+    @abstractmethod
+    def requeue_expired(self, now: float) -> List[str]:
+        """
+        Put running jobs whose lease ran out back in the queue; returns their IDs.
+        """
+
+    @abstractmethod
+    def delete_expired(self, now: float) -> int:
+        ...
+
+
+class InMemoryJobStore(JobStore):
+    def __init__(self) -> None:
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_queued(self) -> List[Job]:
+        with self._lock:
+            return [dict(j) for j in self._jobs.values() if j["status"] == "queued"]
+
+    def claim(self, job_id: str, owner: str, lease_expires_at: float) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return None
+            job.update(
+                status="running", owner=owner, lease_expires_at=lease_expires_at,
+                attempts=job["attempts"] + 1, updated_at=time.time(),
+            )
+            return dict(job)
+
+    def renew_lease(self, job_id: str, owner: str, lease_expires_at: float) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "running" or job.get("owner") != owner:
+                return False
+            job["lease_expires_at"] = lease_expires_at
+            return True
+
+    def requeue_expired(self, now: float) -> List[str]:
+        out = []
+        with self._lock:
+            for job in self._jobs.values():
+                lease = job.get("lease_expires_at")
+                if job["status"] == "running" and (lease is None or lease <= now):
+                    job.update(status="queued", owner=None, lease_expires_at=None, updated_at=now)
+                    out.append(job["id"])
+        return out
+
+    def delete_expired(self, now: float) -> int:
+        with self._lock:
+            expired = [jid for jid, j in self._jobs.items() if j.get("expires_at") and j["expires_at"] <= now]
+            for jid in expired:
+                del self._jobs[jid]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Local SQLite persistence, so queued jobs survive a restart and several
+    worker processes can share one queue file.
+    """
+
+    _COLUMNS = (
+        "id", "kind", "priority", "status", "payload", "result", "error",
+        "attempts", "created_at", "updated_at", "expires_at", "owner", "lease_expires_at",
+    )
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL,
+                    owner TEXT,
+                    lease_expires_at REAL
+                )
+                """
+            )
+            # Stores created before leases existed
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs(expires_at)")
+
+    def _row_to_job(self, row: tuple) -> Job:
+        job = dict(zip(self._COLUMNS, row))
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def save(self, job: Job) -> None:
+        values = dict(job)
+        values["payload"] = json.dumps(job.get("payload"), ensure_ascii=False)
+        values["result"] = json.dumps(job.get("result"), ensure_ascii=False) if job.get("result") is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(self._COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in self._COLUMNS)})",
+                [values.get(c) for c in self._COLUMNS],
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_queued(self) -> List[Job]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE status = 'queued'"
+            ).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def claim(self, job_id: str, owner: str, lease_expires_at: float) -> Optional[Job]:
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_expires_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ? AND status = 'queued'",
+                (owner, lease_expires_at, time.time(), job_id),
+            )
+        return self.get(job_id) if cur.rowcount == 1 else None
+
+    def renew_lease(self, job_id: str, owner: str, lease_expires_at: float) -> bool:
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                (lease_expires_at, job_id, owner),
+            )
+        return cur.rowcount == 1
+
+    def requeue_expired(self, now: float) -> List[str]:
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at <= ?) "
+                "RETURNING id",
+                (now, now),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def delete_expired(self, now: float) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+        return cur.rowcount
+
+
+# ---------- Queue ----------
+
+class JobQueue:
+    """
+    In-process async job queue:
+    - submit() persists the job and returns it immediately (status "queued")
+    - store calls run in a thread (asyncio.to_thread), so a slow SQLite
+      write never stalls the event loop
+    - `workers` asyncio tasks pull jobs by priority; sync handlers run in a
+      thread so a slow LLM call never blocks the event loop
+    - a job is claimed in the store before it runs and its lease renewed
+      every `lease_sec / 3`, so processes sharing a store never run the
+      same job twice and a crashed process's jobs are picked up again
+    - failures are retried with exponential backoff up to `max_retries`
+    - finished jobs are kept for `result_ttl_sec`, then purged
+    - subscribe() yields every status change (used for SSE)
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = 4,
+        max_retries: int = 2,
+        retry_backoff_sec: float = 1.0,
+        result_ttl_sec: float = 3600.0,
+        lease_sec: float = 120.0,
+    ) -> None:
+        self.store = store
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff_sec = retry_backoff_sec
+        self.result_ttl_sec = result_ttl_sec
+        self.lease_sec = lease_sec
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, Handler] = {}
+        self._default_priority: Dict[str, int] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    def register(self, kind: str, handler: Handler, priority: int) -> None:
+        self._handlers[kind] = handler
+        self._default_priority[kind] = priority
+
+    # --- lifecycle ---
+
+    async def start(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        # Pick up pending work, and running jobs whose worker stopped renewing its lease
+        await asyncio.to_thread(self.store.requeue_expired, time.time())
+        for job in await asyncio.to_thread(self.store.list_queued):
+            self._enqueue(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._janitor()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- public API ---
+
+    async def submit(self, kind: str, payload: Dict[str, Any], priority: Optional[int] = None) -> Job:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        now = time.time()
+        job: Job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "priority": self._default_priority[kind] if priority is None else priority,
+            "status": "queued",
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": None,
+            "owner": None,
+            "lease_expires_at": None,
+        }
+        await self._save(job)
+        self._enqueue(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job and job.get("expires_at") and job["expires_at"] <= time.time():
+            return None
+        return job
+
+    async def subscribe(self, job_id: str, keepalive_sec: float = 15.0):
+        """
+        Async generator of job snapshots: the current state, then one per
+        change, ending after a terminal status. Yields None as a keepalive.
+        """
+        # Check the job exists before registering an event for it
+        job = await self.get(job_id)
+        if job is None:
+            return
+        yield job
+        while job["status"] not in TERMINAL_STATUSES:
+            # Take the event before re-reading, so no update can slip in between
+            event = self._changed.setdefault(job_id, asyncio.Event())
+            latest = await self.get(job_id)
+            if latest is None or latest["status"] in TERMINAL_STATUSES:
+                # No further change will set the event: drop it (and wake any
+                # other subscriber waiting on it) instead of leaking it
+                self._notify(job_id)
+                if latest is None:
+                    return
+            if latest["updated_at"] != job["updated_at"]:
+                job = latest
+                yield job
+                continue
+            try:
+                await asyncio.wait_for(event.wait(), timeout=keepalive_sec)
+            except asyncio.TimeoutError:
+                yield None
+
+    # --- internals ---
+
+    def _enqueue(self, job: Job) -> None:
+        assert self._queue is not None
+        self._queue.put_nowait((job["priority"], next(self._seq), job["id"]))
+
+    async def _save(self, job: Job) -> None:
+        job["updated_at"] = time.time()
+        await asyncio.to_thread(self.store.save, dict(job))
+        self._notify(job["id"])
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _run_handler(self, job: Job) -> Any:
+        handler = self._handlers[job["kind"]]
+        if inspect.iscoroutinefunction(handler):
+            return await handler(job["payload"])
+        return await asyncio.to_thread(handler, job["payload"])
+
+    async def _requeue_later(self, job: Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._enqueue(job)
+
+    async def _keep_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_sec / 3)
+            if not await asyncio.to_thread(self.store.renew_lease, job_id, self.owner, time.time() + self.lease_sec):
+                return
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                job = await asyncio.to_thread(self.store.claim, job_id, self.owner, time.time() + self.lease_sec)
+                if job is None:
+                    continue
+                self._notify(job_id)
+
+                lease = asyncio.create_task(self._keep_lease(job_id))
+                try:
+                    job["result"] = await self._run_handler(job)
+                    job["status"] = "succeeded"
+                    job["error"] = None
+                except Exception as exc:
+                    job["error"] = str(exc) or exc.__class__.__name__
+                    # Client errors (bad input) are not worth retrying
+                    if isinstance(exc, HTTPException) or job["attempts"] > self.max_retries:
+                        job["status"] = "failed"
+                    else:
+                        job["status"] = "queued"
+                        job["owner"] = None
+                        job["lease_expires_at"] = None
+                        await self._save(job)
+                        delay = self.retry_backoff_sec * (2 ** (job["attempts"] - 1))
+                        self._tasks.append(asyncio.create_task(self._requeue_later(job, delay)))
+                        continue
+                finally:
+                    lease.cancel()
+
+                job["lease_expires_at"] = None
+                job["expires_at"] = time.time() + self.result_ttl_sec
+                await self._save(job)
+            finally:
+                self._queue.task_done()
+
+    async def _janitor(self, every_sec: float = 60.0) -> None:
+        while True:
+            await asyncio.sleep(every_sec)
+            now = time.time()
+            await asyncio.to_thread(self.store.delete_expired, now)
+            # Jobs of a process that died while another one keeps serving
+            for job_id in await asyncio.to_thread(self.store.requeue_expired, now):
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is not None:
+                    self._enqueue(job)
+            self._tasks = [t for t in self._tasks if not t.done()]
+
+
+def create_job_store(kind: str, path: Path) -> JobStore:
+    """
+    "sqlite" (default, persistent) or "memory" (tests / throwaway runs).
+    """
+    if kind == "memory":
+        return InMemoryJobStore()
+    return SQLiteJobStore(path)
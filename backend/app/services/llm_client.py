@@ -1,8 +1,14 @@
+import datetime
+import time
+
 import google.generativeai as gen
 
 from app.config import settings
+from app.services.context_cache import LLMUsageStats, PrefixContextCache
+from app.services.fake_llm import get_fake_llm
+from app.services.resilience import CircuitBreaker, ResilientLLMClient
 
-if not settings.gemini_api_key:
+if not settings.gemini_api_key and not settings.llm_fake:
     raise RuntimeError("GEMINI_API_KEY is not set in .env")
 
 gen.configure(api_key=settings.gemini_api_key)
@@ -12,7 +18,101 @@ DEFAULT_GEMINI_MODEL = "gemini-flash-latest"
 # You could also try: "gemini-2.0-flash" or "gemini-2.5-flash"
 
 
-def generate_text(prompt: str, model_name: str = DEFAULT_GEMINI_MODEL) -> str:
-    model = gen.GenerativeModel(model_name)
-    response = model.generate_content(prompt)
+def _create_gemini_cache(model_name: str, prefix: str, ttl_sec: int):
+    return gen.caching.CachedContent.create(
+        model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+        contents=[prefix],
+        ttl=datetime.timedelta(seconds=ttl_sec),
+    )
+
+
+# Explicit context caching of stable prompt prefixes (see app/services/prompts.py).
+# Independently of this, Gemini 2.5 models cache repeated prefixes implicitly,
+# which the stable prefix ordering also benefits from.
+_context_cache = PrefixContextCache(
+    create=_create_gemini_cache,
+    ttl_sec=settings.llm_context_cache_ttl_sec,
+    min_chars=settings.llm_context_cache_min_chars,
+    min_uses=settings.llm_context_cache_min_uses,
+)
+usage_stats = LLMUsageStats()
+
+
+def _gemini_provider(prompt: str, model_name: str, timeout_sec: float) -> str:
+    """
+    Raw Gemini call. The timeout is passed to the SDK so the underlying HTTP
+    request is also abandoned, not just the wait on it.
+    Prompts built from a PromptTemplate carry a `prefix`; when a context
+    cache exists for it, only the suffix is sent.
+    """
+    prefix = getattr(prompt, "prefix", "")
+    handle = None
+    if prefix and settings.llm_context_cache_enabled:
+        handle = _context_cache.lookup(model_name, prefix)
+
+    started = time.perf_counter()
+    if handle is not None:
+        try:
+            model = gen.GenerativeModel.from_cached_content(cached_content=handle)
+            response = model.generate_content(
+                prompt[len(prefix):],
+                request_options={"timeout": timeout_sec},
+            )
+        except Exception:
+            # Cache expired or was deleted on the provider side: send the full prompt
+            _context_cache.forget(model_name, prefix)
+            handle = None
+            started = time.perf_counter()
+    if handle is None:
+        model = gen.GenerativeModel(model_name)
+        response = model.generate_content(
+            str(prompt),
+            request_options={"timeout": timeout_sec},
+        )
+
+    usage = getattr(response, "usage_metadata", None)
+    usage_stats.record(
+        cached=handle is not None,
+        prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+        cached_tokens=getattr(usage, "cached_content_token_count", 0) or 0,
+        latency_ms=(time.perf_counter() - started) * 1000,
+    )
     return getattr(response, "text", "").strip()
+
+
+# One shared client so the circuit breaker and latency stats see all traffic
+_client = ResilientLLMClient(
+    provider=get_fake_llm().generate if settings.llm_fake else _gemini_provider,
+    timeout_sec=settings.llm_timeout_sec,
+    max_retries=settings.llm_max_retries,
+    backoff_base_sec=settings.llm_backoff_base_sec,
+    backoff_max_sec=settings.llm_backoff_max_sec,
+    hedge_enabled=settings.llm_hedge_enabled,
+    hedge_min_delay_sec=settings.llm_hedge_min_delay_sec,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.llm_breaker_failure_threshold,
+        reset_timeout_sec=settings.llm_breaker_reset_sec,
+    ),
+    fallback_breaker=CircuitBreaker(
+        failure_threshold=settings.llm_breaker_failure_threshold,
+        reset_timeout_sec=settings.llm_breaker_reset_sec,
+    ),
+    fallback_model=settings.llm_fallback_model,
+    fallback_reply=settings.llm_fallback_reply,
+)
+
+
+def generate_text(prompt: str, model_name: str = DEFAULT_GEMINI_MODEL) -> str:
+    return _client.generate(prompt, model_name)
+
+
+def get_llm_stats() -> dict:
+    return {
+        "usage": usage_stats.stats(),
+        "context_cache": {
+            "enabled": settings.llm_context_cache_enabled,
+            **_context_cache.stats(),
+        },
+        "circuit_breaker": _client.breaker.state,
+        "fallback_circuit_breaker": _client.fallback_breaker.state,
+    }
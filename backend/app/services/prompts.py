@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class Prompt(str):
+    """
+    A prompt string that remembers its stable prefix (system text + KB
+    snippets). It behaves like a normal str everywhere (logging, jobs,
+    retries); the LLM client uses `prefix` for context caching.
+    """
+
+    prefix: str
+
+    def __new__(cls, prefix: str, suffix: str) -> "Prompt":
+        obj = super().__new__(cls, prefix + suffix)
+        obj.prefix = prefix
+        return obj
+
+
+def format_snippets(contexts: Iterable[Dict[str, Any]]) -> str:
+    """
+    KB snippets numbered in retrieval order, most relevant first. Retrieval
+    is deterministic (and cached), so requests that retrieved the same
+    chunks still produce a byte-identical prefix.
+    """
+    return "\n".join(
+        f"[{i}] Source: {(ctx.get('metadata') or {}).get('source', 'kb')}\n{ctx['text']}\n"
+        for i, ctx in enumerate(contexts, start=1)
+    )
+
+
+def format_history(messages: Iterable[Any], user_label: str, other_label: str) -> str:
+    """
+    One "<Label>: <content>" line per message; accepts {"role", "content"}
+    dicts (see mask_messages) or ChatMessage models.
+    """
+    text = "\n".join(
+        f"{user_label if role == 'user' else other_label}: {content}"
+        for role, content in (
+            (m["role"], m["content"]) if isinstance(m, dict) else (m.role, m.content) for m in messages
+        )
+    )
+    return text or "(no previous messages)"
+
+
+class PromptTemplate:
+    """
+    Precompiled prompt layout. Sections go from most to least stable:
+
+        system text                    (constant, joined once here)
+        KB snippets / no-KB notice     (shared by requests about the same topic)
+        --- end of cacheable prefix ---
+        suffix                         (conversation, latest message, instruction)
+
+    The suffix is a str.format template filled in with one call.
+    """
+
+    def __init__(
+        self,
+        system: str,
+        suffix: str,
+        kb_header: Optional[str] = None,
+        no_kb_notice: Optional[str] = None,
+    ) -> None:
+        self.head = system.strip() + "\n\n"
+        self.kb_head = f"{self.head}{kb_header}\n" if kb_header else self.head
+        self.no_kb = f"{self.head}{no_kb_notice}\n\n" if no_kb_notice else self.head
+        self.suffix = suffix
+
+    def render(self, contexts: Optional[List[Dict[str, Any]]] = None, **fields: Any) -> Prompt:
+        if contexts:
+            prefix = f"{self.kb_head}{format_snippets(contexts)}\n"
+        else:
+            prefix = self.no_kb
+        return Prompt(prefix, self.suffix.format(**fields))
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+import warnings
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Typographic variants NFKC leaves alone, plus invisible characters
+_TRANSLATE = str.maketrans(
+    {
+        "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',  # curly quotes
+        "\u2013": "-", "\u2014": "-",  # en / em dash
+        "\u200b": None, "\u200c": None, "\u200d": None, "\ufeff": None,  # zero-width
+    }
+)
+
+_TRAILING_PUNCT = " ?!.,;:"
+_PLACEHOLDER_RE = re.compile(r"\[([a-z]+)\]")
+_DIGITS_RE = re.compile(r"\d{3}")
+
+# Entity spans that make otherwise identical questions look different
+ORDER_ID_RE = re.compile(r"#\s*\d{3,}\b|\b(?:ord|order)[-_#]?\d{3,}\b|\b\d{5,}\b")
+TRACKING_RE = re.compile(r"\b(?=[a-z0-9]*\d)(?=[a-z0-9]*[a-z])[a-z0-9]{10,}\b")
+
+# Chat shorthand seen in the logs
+_SHORTHAND = {
+    "u": "you",
+    "ur": "your",
+    "pls": "please",
+    "plz": "please",
+    "thx": "thanks",
+    "didnot": "did not",
+    "didnt": "did not",
+    "dont": "do not",
+    "cant": "cannot",
+    "wont": "will not",
+    "havent": "have not",
+    "isnt": "is not",
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def canonicalize(text: str) -> str:
+    """
+    Canonical form of a (PII-masked) query for cache keys and retrieval:
+    NFKC + casefold, typographic quotes/dashes folded, shorthand expanded,
+    order/tracking numbers replaced by [ORDER]/[TRACKING], whitespace
+    collapsed and trailing punctuation dropped. Idempotent; placeholders
+    from mask_pii ([EMAIL], [PHONE], [CARD]) stay upper-case.
+
+    Runs on every request, so each step is skipped when it can't apply.
+    """
+    if not text:
+        return ""
+    s = unicodedata.normalize("NFKC", text).translate(_TRANSLATE).casefold()
+    if _DIGITS_RE.search(s):
+        s = ORDER_ID_RE.sub("[ORDER]", TRACKING_RE.sub("[TRACKING]", s))
+    if "[" in s:
+        s = _PLACEHOLDER_RE.sub(lambda m: f"[{m.group(1).upper()}]", s)
+    words = " ".join(s.split()).rstrip(_TRAILING_PUNCT).split(" ")
+    if not _SHORTHAND.keys().isdisjoint(words):
+        words = [_SHORTHAND.get(w, w) for w in words]
+    return " ".join(words)
+
+
+def english_lexicon(min_zipf: float) -> Optional[Callable[[str], bool]]:
+    """
+    "Is this a real English word?" from the wordfreq frequency lists: true
+    when the word's Zipf frequency is at least `min_zipf` (3.0 = once per
+    million words, which leaves common misspellings like "recieve" out).
+    None when wordfreq is not installed.
+    """
+    try:
+        from wordfreq import zipf_frequency  # optional dependency
+    except ImportError:
+        warnings.warn("wordfreq is not installed; query spell correction is disabled (pip install wordfreq)")
+        return None
+    return lambda word: zipf_frequency(word, "en") >= min_zipf
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """
+    Every string reachable from `word` by deleting up to `max_distance` characters.
+    """
+    out = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+def _plausible_typo(word: str, candidate: str) -> bool:
+    """
+    Only transpositions ("trakcing"), letters typed twice or extra
+    ("cancell") and letters left out ("adress") count as typos.
+    Substitutions usually turn one real word into another ("charged" ->
+    "changed", "shoes" -> "shows"), and so do inflections ("arrive" ->
+    "arrived"), so neither is corrected.
+    """
+    if candidate.startswith(word):
+        return False
+    if word.startswith(candidate):
+        return set(word[len(candidate):]) == {candidate[-1]}
+    # Without substitutions, one word's letters contain the other's
+    diff = Counter(word)
+    diff.subtract(candidate)
+    return all(n >= 0 for n in diff.values()) or all(n <= 0 for n in diff.values())
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein + adjacent transpositions),
+    stopping early once every path exceeds `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class SpellCorrector:
+    """
+    Corrects misspelled query words to words of the KB corpus
+    (symmetric-delete lookup, as in SymSpell):
+
+    - only lower-case alphabetic words of at least `min_word_len` letters
+      that are neither in the KB nor real English (`is_english`, see
+      english_lexicon) are touched; without a lexicon nothing is corrected,
+      since a word list of our own can't cover English ("hand" -> "and")
+    - words under 10 letters get at most 1 edit, longer ones `max_distance`;
+      only transpositions, extra and missing letters are treated as typos
+    - among the closest candidates the most frequent KB word wins
+
+    Lookups are memoized, so a repeated typo costs one dict hit.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 2,
+        min_word_len: int = 4,
+        memo_max_entries: int = 50000,
+        is_english: Optional[Callable[[str], bool]] = None,
+    ) -> None:
+        self.max_distance = max_distance
+        self.is_english = is_english
+        self.min_word_len = min_word_len
+        self.memo_max_entries = memo_max_entries
+        self.vocab: Counter = Counter()
+        self._index: Dict[str, List[str]] = {}
+        self._memo: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.corrections = 0
+        self.words_checked = 0
+
+    def fit(self, documents: Iterable[str]) -> "SpellCorrector":
+        vocab: Counter = Counter()
+        for doc in documents:
+            vocab.update(_WORD_RE.findall((doc or "").casefold()))
+        index: Dict[str, List[str]] = {}
+        for word in vocab:
+            if len(word) < self.min_word_len - self.max_distance:
+                continue
+            for d in _deletes(word, self.max_distance):
+                index.setdefault(d, []).append(word)
+        with self._lock:
+            self.vocab, self._index, self._memo = vocab, index, {}
+        return self
+
+    def _lookup(self, word: str) -> str:
+        limit = 1 if len(word) < 10 else self.max_distance
+        best: Optional[Tuple[int, int, str]] = None  # (distance, -frequency, word)
+        seen: Set[str] = set()
+        for d in _deletes(word, limit):
+            for candidate in self._index.get(d, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                dist = _edit_distance(word, candidate, limit)
+                if dist > limit or not _plausible_typo(word, candidate):
+                    continue
+                key = (dist, -self.vocab[candidate], candidate)
+                if best is None or key < best:
+                    best = key
+        return best[2] if best is not None else word
+
+    def correct_word(self, word: str) -> str:
+        if len(word) < self.min_word_len or word in self.vocab or self.is_english is None:
+            return word
+        fixed = self._memo.get(word)
+        if fixed is None:
+            fixed = word if self.is_english(word) else self._lookup(word)
+            with self._lock:
+                if len(self._memo) >= self.memo_max_entries:
+                    self._memo.clear()
+                self._memo[word] = fixed
+        return fixed
+
+    def correct(self, text: str) -> str:
+        """
+        `text` with misspelled words replaced (expects canonicalize() output).
+        """
+        if not self.vocab or self.is_english is None:
+            return text
+
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if len(word) < self.min_word_len or word in self.vocab:
+                continue
+            if word.isalpha():
+                fixed = self.correct_word(word)
+            else:
+                # Punctuation attached or a placeholder: only its lower-case letter runs
+                fixed = _WORD_RE.sub(lambda m: self.correct_word(m.group(0)), word)
+            self.words_checked += 1
+            if fixed != word:
+                self.corrections += 1
+                words[i] = fixed
+        return " ".join(words)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "vocab_size": len(self.vocab),
+            "index_entries": len(self._index),
+            "words_checked": self.words_checked,
+            "corrections": self.corrections,
+            "memo_entries": len(self._memo),
+        }
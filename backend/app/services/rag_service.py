@@ -1,34 +1,75 @@
 from __future__ import annotations
 
+import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 import chromadb
 import google.generativeai as genai
 
 from app.config import settings
+from app.services.context_selection import filter_by_relevance, filter_by_rerank_score, merge_adjacent_chunks
+from app.services.fake_llm import get_fake_llm
+from app.services.query_normalizer import SpellCorrector, canonicalize, english_lexicon
+from app.services.reranker import Reranker, create_reranker, rerank_enabled_for
+from app.services.retrieval_cache import RetrievalCache, cache_key
+from app.utils.hashing import text_digest
 
 # --- Gemini embedding config ---
-if not settings.gemini_api_key:
+if not settings.gemini_api_key and not settings.llm_fake:
     raise RuntimeError("GEMINI_API_KEY is not set in .env")
 
 genai.configure(api_key=settings.gemini_api_key)
 
 # Gemini text-embedding model
 EMBEDDING_MODEL = "text-embedding-004"
+EMBED_BATCH_SIZE = 100  # most texts the batch embed endpoint accepts per call
 
 # --- Paths for KB and Chroma ---
 BASE_DIR = Path(__file__).resolve().parents[1]  # .../app
-KB_DIR = BASE_DIR / "kb"                        # .../app/kb
+KB_DIR = BASE_DIR / "kb"                        # .../app/kb (default tenant)
 CHROMA_DIR = BASE_DIR / "chroma_db"             # .../app/chroma_db
+TENANTS_DIR = BASE_DIR.parent / settings.kb_tenants_dir  # one sub-folder per extra tenant
 
 CHROMA_DIR.mkdir(parents=True, exist_ok=True)
 
-# --- ChromaDB client / collection setup ---
-client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+DEFAULT_TENANT = settings.kb_default_tenant
 
-# Name must be 3–512 chars, alphanumeric / . _ -
-collection = client.get_or_create_collection(name="support_kb")
+# Tenant IDs become part of collection names (3–512 chars, alphanumeric / . _ -)
+_TENANT_RE = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,46}[a-z0-9])?$")
+
+# For TenantIndex.state_bytes: a small str key + value + dict slot, and a MiniLM-size cross-encoder
+_DICT_ENTRY_BYTES = 120
+_MIB = 1024 * 1024
+_CROSS_ENCODER_BYTES = 100 * 1024 * 1024
+
+# --- ChromaDB client setup ---
+# One client for all tenants; Chroma keeps each collection's vector index
+# loaded once used; nothing in this module unloads it.
+if settings.llm_fake:
+    # Load tests index the KB in memory, so fake embeddings never reach app/chroma_db
+    client = chromadb.EphemeralClient()
+else:
+    client = chromadb.PersistentClient(path=str(CHROMA_DIR))
+
+# Retrieval results only change when the KB changes, so they are cached per
+# (normalized query, n_results, topic_hint, tenant + KB version)
+_cache_db_path = BASE_DIR.parent / settings.retrieval_cache_db_path
+if settings.llm_fake:
+    # Same KB version, different vectors: keep load-test results out of the real cache
+    _cache_db_path = _cache_db_path.with_name(f"replay_{_cache_db_path.name}")
+retrieval_cache = RetrievalCache(
+    max_entries=settings.retrieval_cache_max_entries,
+    ttl_sec=settings.retrieval_cache_ttl_sec,
+    db_path=_cache_db_path if settings.retrieval_cache_shared else None,
+)
+
+
+class UnknownTenantError(LookupError):
+    """Raised for a malformed tenant ID or a tenant without a KB folder."""
 
 
 # ---------- Embedding ----------
@@ -37,6 +78,8 @@ def embed_text(text: str) -> List[float]:
     """
     Use Gemini to get an embedding vector for a piece of text.
     """
+    if settings.llm_fake:
+        return get_fake_llm().embed([text])[0]
     result = genai.embed_content(
         model=EMBEDDING_MODEL,
         content=text,
@@ -45,6 +88,26 @@ def embed_text(text: str) -> List[float]:
     return result["embedding"]  # type: ignore[no-any-return]
 
 
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Embed many texts with batched Gemini calls of up to EMBED_BATCH_SIZE
+    texts each (one vector per text, same order).
+    """
+    if not texts:
+        return []
+    if settings.llm_fake:
+        return get_fake_llm().embed(texts)
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        result = genai.embed_content(
+            model=EMBEDDING_MODEL,
+            content=texts[start:start + EMBED_BATCH_SIZE],
+        )
+        # For a list input, "embedding" is a list of vectors
+        vectors.extend(result["embedding"])
+    return vectors
+
+
 # ---------- KB loading & chunking ----------
 
 def _simple_chunk(text: str, max_chars: int = 800) -> List[str]:
@@ -76,15 +139,15 @@ def _simple_chunk(text: str, max_chars: int = 800) -> List[str]:
     return chunks
 
 
-def _load_kb_files() -> List[Dict[str, Any]]:
+def _load_kb_files(kb_dir: Path) -> List[Dict[str, Any]]:
     """
-    Load all .md and .txt files from the kb folder.
+    Load all .md and .txt files from a tenant's kb folder.
     """
     docs: List[Dict[str, Any]] = []
-    if not KB_DIR.exists():
+    if not kb_dir.exists():
         return docs
 
-    for path in KB_DIR.glob("**/*"):
+    for path in kb_dir.glob("**/*"):
         if path.suffix.lower() not in {".md", ".txt"}:
             continue
         try:
@@ -103,92 +166,520 @@ def _load_kb_files() -> List[Dict[str, Any]]:
     return docs
 
 
-def ensure_kb_indexed() -> None:
+def _chunk_kb(kb_dir: Path) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
     """
-    Index KB documents into Chroma if not already present.
-    For this course project we keep it simple:
-    - If the collection already has vectors, we assume it is indexed.
-    - Otherwise, we read all kb/*.md, *.txt and embed them.
+    (ids, texts, metadatas) of every chunk in a kb folder.
     """
-    try:
-        if collection.count() > 0:
-            # Already indexed; skip re-indexing
-            return
-    except Exception:
-        # If count is not supported for some reason, we'll just continue
-        pass
-
-    kb_docs = _load_kb_files()
-    if not kb_docs:
-        return
-
-    new_ids: List[str] = []
-    new_docs: List[str] = []
-    new_metas: List[Dict[str, Any]] = []
-    new_embs: List[List[float]] = []
-
-    for doc in kb_docs:
+    ids: List[str] = []
+    texts: List[str] = []
+    metas: List[Dict[str, Any]] = []
+    for doc in _load_kb_files(kb_dir):
         base_id = doc["id"]
-        chunks = _simple_chunk(doc["text"])
-        for idx, chunk in enumerate(chunks):
-            chunk_id = f"{base_id}::chunk{idx}"
-
-            new_ids.append(chunk_id)
-            new_docs.append(chunk)
-            new_metas.append(
+        for idx, chunk in enumerate(_simple_chunk(doc["text"])):
+            ids.append(f"{base_id}::chunk{idx}")
+            texts.append(chunk)
+            metas.append(
                 {
                     "source": doc["path"],
                     "base_id": base_id,
                     "chunk_index": idx,
                 }
             )
-            new_embs.append(embed_text(chunk))
-
-    if new_ids:
-        collection.add(
-            ids=new_ids,
-            documents=new_docs,
-            metadatas=new_metas,
-            embeddings=new_embs,
-        )
+    return ids, texts, metas
+
+
+# ---------- Tenant indexes ----------
+
+class TenantIndex:
+    """
+    One tenant's KB: its Chroma collection, KB version and reranker.
+
+    Queries never take `_index_lock`; it only serializes (re)indexing of this
+    tenant, so indexing one tenant never blocks queries for the others (and
+    queries for this tenant keep reading the collection while it is updated).
+    """
+
+    def __init__(self, tenant_id: str, kb_dir: Path, collection_name: str) -> None:
+        self.tenant_id = tenant_id
+        self.kb_dir = kb_dir
+        # Name must be 3–512 chars, alphanumeric / . _ -
+        self.collection = client.get_or_create_collection(name=collection_name)
+        self.kb_version = ""
+        self.indexed = False
+        self._version_checked_at = time.monotonic()
+        self._published_seen: str | None = None
+        self.last_used = time.monotonic()
+        self._index_lock = threading.Lock()
+        # Serializes lazy builds of the reranker and spell corrector
+        self._model_lock = threading.Lock()
+        self._reranker: Reranker | None = None
+        self._reranker_kb_version: str | None = None
+        self._speller: SpellCorrector | None = None
+        self._speller_kb_version: str | None = None
+
+    @property
+    def state_bytes(self) -> int:
+        """
+        Rough size of the per-tenant state TenantRegistry caps: the spell
+        corrector's delete index and memo, the reranker's score cache and a
+        cross-encoder model if one is loaded. Not the vector index, which
+        stays in Chroma's memory.
+        """
+        total = 0
+        if self._speller is not None:
+            stats = self._speller.stats()
+            total += (stats["index_entries"] + stats["vocab_size"] + stats["memo_entries"]) * _DICT_ENTRY_BYTES
+        if self._reranker is not None:
+            total += self._reranker.stats()["cache_entries"] * _DICT_ENTRY_BYTES
+            if self._reranker.scorer.name != "bm25":
+                total += _CROSS_ENCODER_BYTES
+        return total
+
+    @property
+    def cache_version(self) -> str:
+        """
+        Version string for the retrieval cache, scoped to this tenant.
+        """
+        return f"{self.tenant_id}:{self.kb_version}"
+
+    def ensure_indexed(self) -> None:
+        """
+        Index the tenant's KB if its collection is empty (lazy first load).
+        """
+        with self._index_lock:
+            try:
+                if self.collection.count() > 0:
+                    # Already indexed; skip re-indexing
+                    self._refresh_kb_version()
+                    self.indexed = True
+                    return
+            except Exception:
+                # If count is not supported for some reason, we'll just continue
+                pass
+            ids, texts, metas = _chunk_kb(self.kb_dir)
+            if ids:
+                self.collection.add(ids=ids, documents=texts, metadatas=metas, embeddings=embed_texts(texts))
+            self._refresh_kb_version(publish=True)
+            self.indexed = True
+
+    def reindex(self) -> str:
+        """
+        Rebuild the tenant's index from its kb folder. Embeddings are computed
+        before touching the collection, and chunks are upserted before stale
+        ones are deleted, so concurrent queries always see a usable index.
+        """
+        with self._index_lock:
+            ids, texts, metas = _chunk_kb(self.kb_dir)
+            embeddings = embed_texts(texts)
+            if ids:
+                self.collection.upsert(ids=ids, documents=texts, metadatas=metas, embeddings=embeddings)
+            try:
+                keep = set(ids)
+                stale = [cid for cid in self.collection.get(include=[])["ids"] if cid not in keep]
+            except Exception:
+                stale = []
+            if stale:
+                self.collection.delete(ids=stale)
+            return self._refresh_kb_version(publish=True)
+
+    def sync_kb_version(self) -> None:
+        """
+        Pick up a re-index done by another worker: when the version it
+        published in the shared cache file changed since we last looked,
+        re-read the collection (which also drops our stale cache entries).
+        Looks at most every `kb_version_check_sec`.
+        """
+        now = time.monotonic()
+        if now - self._version_checked_at < settings.kb_version_check_sec:
+            return
+        self._version_checked_at = now
+        published = retrieval_cache.published_version(self.tenant_id)
+        if published is None or published == self._published_seen:
+            return
+        self._published_seen = published
+        if published != self.kb_version:
+            with self._index_lock:
+                self._refresh_kb_version()
+
+    def _refresh_kb_version(self, publish: bool = False) -> str:
+        """
+        Recompute the KB version from the collection. Only the worker that
+        wrote to the collection publishes it, so a worker with a stale view
+        never overwrites a newer version.
+        """
+        try:
+            data = self.collection.get(include=["documents"])
+        except Exception:
+            data = {}
+        pairs = sorted(zip(data.get("ids") or [], data.get("documents") or []))
+        new_version = text_digest("\n".join(f"{cid}\t{doc}" for cid, doc in pairs), length=12) if pairs else ""
+        if new_version != self.kb_version:
+            # Indexing changed the collection: this tenant's cached results are stale
+            retrieval_cache.invalidate(f"{self.tenant_id}:{new_version}", scope=f"{self.tenant_id}:")
+        self.kb_version = new_version
+        if publish:
+            retrieval_cache.publish_version(self.tenant_id, new_version)
+            self._published_seen = new_version
+        return new_version
+
+    def get_reranker(self) -> Reranker:
+        """
+        Reranker fit on this tenant's KB. Concurrent first requests wait for
+        one build instead of each loading the model and fitting the corpus.
+        """
+        reranker = self._reranker
+        if reranker is not None and self._reranker_kb_version == self.kb_version:
+            return reranker
+        with self._model_lock:
+            if self._reranker is None:
+                self._reranker = create_reranker(
+                    settings.rerank_model,
+                    vector_weight=settings.rerank_vector_weight,
+                    cache_max_entries=settings.rerank_cache_max_entries,
+                )
+            kb_version = self.kb_version
+            if self._reranker_kb_version != kb_version:
+                try:
+                    documents = self.collection.get(include=["documents"]).get("documents") or []
+                except Exception:
+                    documents = []
+                self._reranker.fit(documents)
+                self._reranker_kb_version = kb_version
+            return self._reranker
+
+    def get_spell_corrector(self) -> SpellCorrector:
+        """
+        Spell corrector over this tenant's KB vocabulary, refit when the KB changes.
+        """
+        speller = self._speller
+        if speller is not None and self._speller_kb_version == self.kb_version:
+            return speller
+        with self._model_lock:
+            kb_version = self.kb_version
+            if self._speller is None or self._speller_kb_version != kb_version:
+                try:
+                    documents = self.collection.get(include=["documents"]).get("documents") or []
+                except Exception:
+                    documents = []
+                self._speller = SpellCorrector(
+                    max_distance=settings.query_spellcheck_max_distance,
+                    is_english=english_lexicon(settings.query_spellcheck_min_zipf),
+                ).fit(documents)
+                self._speller_kb_version = kb_version
+            return self._speller
+
+
+class TenantRegistry:
+    """
+    Lazily loaded tenant indexes, least recently used first out.
+
+    get() only holds the registry lock for dictionary bookkeeping; loading a
+    tenant (which may embed its whole KB) happens under that tenant's own
+    lock. The registry is a size-capped cache of per-tenant state: when a
+    tenant is loaded and the estimated state of loaded tenants
+    (TenantIndex.state_bytes) exceeds `state_cache_bytes`, the coldest ones
+    are dropped (the default tenant is kept). That frees their reranker and
+    spell corrector only. It does not bound process memory: all tenants
+    share one Chroma client, which keeps every vector index it has loaded.
+    """
+
+    def __init__(self, state_cache_bytes: int) -> None:
+        self.state_cache_bytes = state_cache_bytes
+        self._indexes: "OrderedDict[str, TenantIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(tenant_id: str | None) -> str:
+        tenant = (tenant_id or DEFAULT_TENANT).strip().lower()
+        if not _TENANT_RE.match(tenant):
+            raise UnknownTenantError(f"Invalid tenant id: {tenant_id!r}")
+        return tenant
+
+    @staticmethod
+    def locate(tenant: str) -> Tuple[Path, str]:
+        if tenant == DEFAULT_TENANT:
+            return KB_DIR, "support_kb"
+        kb_dir = TENANTS_DIR / tenant
+        if not kb_dir.is_dir():
+            raise UnknownTenantError(f"Unknown tenant: {tenant}")
+        return kb_dir, f"support_kb__{tenant}"
+
+    def get(self, tenant_id: str | None = None) -> TenantIndex:
+        tenant = self.normalize(tenant_id)
+        with self._lock:
+            index = self._indexes.get(tenant)
+            if index is not None:
+                self._indexes.move_to_end(tenant)
+                index.last_used = time.monotonic()
+                created = False
+            else:
+                kb_dir, collection_name = self.locate(tenant)
+                index = TenantIndex(tenant, kb_dir, collection_name)
+                self._indexes[tenant] = index
+                created = True
+
+        if created:
+            # Concurrent first requests for this tenant wait here, others don't
+            index.ensure_indexed()
+            with self._lock:
+                self.loads += 1
+                self._evict(keep=tenant)
+        elif not index.indexed:
+            # Still loading in another request (wait for it), or that load failed
+            index.ensure_indexed()
+        else:
+            index.sync_kb_version()
+        return index
+
+    def _evict(self, keep: str) -> None:
+        """
+        Drop cold tenants until their estimated state fits the cap. Caller
+        holds _lock. In-flight queries keep their own reference, so an
+        evicted index is simply reloaded on its next request.
+        """
+        total = sum(ix.state_bytes for ix in self._indexes.values())
+        for tenant in list(self._indexes):
+            if total <= self.state_cache_bytes:
+                break
+            if tenant in (keep, DEFAULT_TENANT):
+                continue
+            total -= self._indexes.pop(tenant).state_bytes
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            indexes = list(self._indexes.items())
+        loaded = {t: {"kb_version": ix.kb_version, "state_mib": round(ix.state_bytes / _MIB, 2)} for t, ix in indexes}
+        return {
+            "loaded": loaded,
+            "state_cache_mib": round(self.state_cache_bytes / _MIB, 1),
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+tenants = TenantRegistry(settings.kb_tenant_state_cache_mib * _MIB)
+
+
+def resolve_tenant_id(tenant_id: str | None = None) -> str:
+    """
+    Validate a tenant ID without loading its index (cheap; safe on the event loop).
+    """
+    tenant = TenantRegistry.normalize(tenant_id)
+    TenantRegistry.locate(tenant)
+    return tenant
+
+
+def get_tenant_index(tenant_id: str | None = None) -> TenantIndex:
+    return tenants.get(tenant_id)
+
+
+def get_kb_version(tenant_id: str | None = None) -> str:
+    return tenants.get(tenant_id).kb_version
 
 
-# Run indexing once at import time (simple, dev-friendly)
+def get_reranker(tenant_id: str | None = None) -> Reranker:
+    return tenants.get(tenant_id).get_reranker()
+
+
+def canonical_query(text: str, tenant_id: str | None = None) -> str:
+    """
+    Canonical form of a PII-masked query, used by the FAQ router, retrieval
+    and their caches: canonicalize() plus spell correction against the
+    tenant's KB vocabulary.
+    """
+    canonical = canonicalize(text)
+    if not settings.query_spellcheck_enabled:
+        return canonical
+    return tenants.get(tenant_id).get_spell_corrector().correct(canonical)
+
+
+def reindex_tenant(tenant_id: str | None = None) -> str:
+    """
+    Re-read a tenant's kb folder and update its index; returns the new KB version.
+    """
+    return tenants.get(tenant_id).reindex()
+
+
+def ensure_kb_indexed() -> None:
+    """
+    Make sure the default tenant's KB is indexed (other tenants load lazily).
+    """
+    tenants.get(DEFAULT_TENANT)
+
+
+# Run indexing of the default KB once at import time (simple, dev-friendly)
 ensure_kb_indexed()
 
 
 # ---------- Retrieval API used by chatbot ----------
 
-def retrieve_relevant_chunks(query: str, n_results: int = 3) -> List[Dict[str, Any]]:
+def _embedding_text(query: str, topic_hint: str | None) -> str:
+    return f"{topic_hint}: {query}" if topic_hint else query
+
+
+def select_contexts(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Post-process retrieved chunks before they go into a prompt:
+    - adaptive k: drop chunks past the relevance threshold or after the
+      distance falls off (so n_results is an upper bound, not a fixed count);
+      reranked chunks are cut on their fused score instead, in rerank order
+    - merge adjacent chunks of the same KB document into one snippet
     """
-    Given a user query, return top-n relevant KB chunks with metadata.
+    if settings.rag_adaptive_k:
+        if chunks and "rerank_score" in chunks[0]:
+            chunks = filter_by_rerank_score(chunks, settings.rag_max_distance, settings.rerank_max_score_gap)
+        else:
+            chunks = filter_by_relevance(chunks, settings.rag_max_distance, settings.rag_max_distance_gap)
+    if settings.rag_merge_adjacent:
+        chunks = merge_adjacent_chunks(chunks)
+    return chunks
+
+
+def _candidate_count(n_results: int, rerank: bool) -> int:
+    return max(n_results, settings.rerank_candidates) if rerank else n_results
+
+
+def _finish(
+    index: TenantIndex,
+    queries: List[str],
+    raw_lists: List[List[Dict[str, Any]]],
+    n_results: int,
+    rerank: bool,
+    select: bool,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Rerank the wide candidate sets (if enabled) down to n_results, then
+    apply select_contexts().
+    """
+    if rerank:
+        lists = index.get_reranker().rerank_many(queries, raw_lists, n_results)
+    else:
+        lists = [[dict(c) for c in raw] for raw in raw_lists]
+    return [select_contexts(chunks) for chunks in lists] if select else lists
+
+
+def retrieve_relevant_chunks(
+    query: str,
+    n_results: int = 3,
+    topic_hint: str | None = None,
+    select: bool = True,
+    endpoint: str | None = None,
+    tenant_id: str | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Given a user query, return up to n relevant KB chunks with metadata from
+    the tenant's KB (default tenant when `tenant_id` is None).
+    An optional topic hint (e.g. "orders") is prepended to the embedded text.
+    If `endpoint` is listed in settings.rerank_endpoints, a wider candidate
+    set is fetched and reranked down to n.
+    With select=True the result goes through select_contexts();
+    select=False returns the plain top-n (used by the evals).
+    Raises UnknownTenantError for an unknown tenant.
     If the collection is empty or anything fails, return [] so caller can fall back.
     """
+    index = tenants.get(tenant_id)
     try:
-        if collection.count() == 0:
+        if index.collection.count() == 0:
             return []
     except Exception:
         # If count not available or Chroma has an issue, fail gracefully
         return []
 
-    query_emb = embed_text(query)
+    rerank = rerank_enabled_for(endpoint, settings.rerank_endpoints)
+    fetch_n = _candidate_count(n_results, rerank)
+    version = index.cache_version
+    key = cache_key(query, fetch_n, topic_hint, version)
+    if settings.retrieval_cache_enabled:
+        cached = retrieval_cache.get(key)
+        if cached is not None:
+            return _finish(index, [query], [cached], n_results, rerank, select)[0]
+
+    query_emb = embed_text(_embedding_text(query, topic_hint))
 
-    result = collection.query(
+    result = index.collection.query(
         query_embeddings=[query_emb],
-        n_results=n_results,
+        n_results=fetch_n,
     )
 
     if not result or not result.get("documents"):
         return []
 
-    docs = result["documents"][0]
-    metas = result["metadatas"][0]
-    distances = result["distances"][0]
+    # The cache keeps the raw candidates, so threshold changes don't need a flush
+    out = _result_rows(result, 0)
+    if settings.retrieval_cache_enabled:
+        retrieval_cache.put(key, version, out)
+    return _finish(index, [query], [out], n_results, rerank, select)[0]
+
+
+def retrieve_relevant_chunks_batch(
+    queries: List[str],
+    n_results: int = 3,
+    topic_hints: List[str | None] | None = None,
+    select: bool = True,
+    endpoint: str | None = None,
+    tenant_id: str | None = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Batched version of retrieve_relevant_chunks (all queries for one tenant):
+    cached queries are served from the retrieval cache, the rest share one
+    embedding call and one Chroma query. Duplicate queries are only looked up once.
+    Returns one list of chunks per query, in the same order.
+    """
+    index = tenants.get(tenant_id)
+    try:
+        if index.collection.count() == 0:
+            return [[] for _ in queries]
+    except Exception:
+        return [[] for _ in queries]
+
+    rerank = rerank_enabled_for(endpoint, settings.rerank_endpoints)
+    fetch_n = _candidate_count(n_results, rerank)
+    version = index.cache_version
+    hints = topic_hints or [None] * len(queries)
+    keys = [cache_key(q, fetch_n, h, version) for q, h in zip(queries, hints)]
+
+    found: Dict[str, List[Dict[str, Any]]] = {}
+    misses: Dict[str, str] = {}  # cache key -> text to embed
+    for key, query, hint in zip(keys, queries, hints):
+        if key in found or key in misses:
+            continue
+        cached = retrieval_cache.get(key) if settings.retrieval_cache_enabled else None
+        if cached is not None:
+            found[key] = cached
+        else:
+            misses[key] = _embedding_text(query, hint)
+
+    if misses:
+        result = index.collection.query(
+            query_embeddings=embed_texts(list(misses.values())),
+            n_results=fetch_n,
+        )
+        for i, key in enumerate(misses):
+            rows = _result_rows(result, i) if result and result.get("documents") else []
+            found[key] = rows
+            if rows and settings.retrieval_cache_enabled:
+                retrieval_cache.put(key, version, rows)
+
+    return _finish(index, list(queries), [found[key] for key in keys], n_results, rerank, select)
+
+
+def _result_rows(result: Dict[str, Any], i: int) -> List[Dict[str, Any]]:
+    """
+    Turn row `i` of a Chroma query result into our chunk dicts.
+    """
+    ids = result["ids"][i]
+    docs = result["documents"][i]
+    metas = result["metadatas"][i]
+    distances = result["distances"][i]
 
     out: List[Dict[str, Any]] = []
-    for text, meta, dist in zip(docs, metas, distances):
+    for chunk_id, text, meta, dist in zip(ids, docs, metas, distances):
         out.append(
             {
+                "id": chunk_id,
                 "text": text,
                 "metadata": meta,
                 "distance": dist,
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+import warnings
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.services.retrieval_cache import normalize_query
+from app.utils.hashing import text_digest
+from app.utils.text import content_tokens
+
+Chunks = List[Dict[str, Any]]
+
+
+# ---------- Scorers ----------
+
+class LexicalScorer:
+    """
+    BM25 over the indexed KB chunks. IDF and average length come from the
+    whole KB (fit()), so a (query, chunk) score does not depend on which
+    other candidates came back and can be cached.
+    """
+
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._idf: Dict[str, float] = {}
+        self._avg_len = 1.0
+
+    def fit(self, documents: Sequence[str]) -> None:
+        docs = [content_tokens(d) for d in documents]
+        n_docs = len(docs) or 1
+        df = Counter(tok for doc in docs for tok in set(doc))
+        self._idf = {tok: math.log(1 + (n_docs - n + 0.5) / (n + 0.5)) for tok, n in df.items()}
+        self._avg_len = (sum(len(d) for d in docs) / n_docs) or 1.0
+
+    def score_batch(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        out: List[float] = []
+        for query, text in pairs:
+            tf = Counter(content_tokens(text))
+            length = sum(tf.values())
+            score = 0.0
+            for tok in set(content_tokens(query)):
+                n = tf.get(tok)
+                if not n:
+                    continue
+                # Unknown words (not in the KB) get the maximum IDF
+                idf = self._idf.get(tok, math.log(1 + len(self._idf) + 0.5))
+                score += idf * n * (self.k1 + 1) / (n + self.k1 * (1 - self.b + self.b * length / self._avg_len))
+            out.append(score)
+        return out
+
+
+class CrossEncoderScorer:
+    """
+    Small local cross-encoder (sentence-transformers), CPU only.
+    predict() scores the whole batch at once.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 32) -> None:
+        from sentence_transformers import CrossEncoder  # optional dependency
+
+        self.name = f"ce:{model_name}"
+        self.batch_size = batch_size
+        self._model = CrossEncoder(model_name, device="cpu")
+
+    def fit(self, documents: Sequence[str]) -> None:
+        pass
+
+    def score_batch(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        scores = self._model.predict(list(pairs), batch_size=self.batch_size, show_progress_bar=False)
+        return [float(s) for s in scores]
+
+
+# ---------- Reranker ----------
+
+class Reranker:
+    """
+    Second-stage ranking of a wide vector-search candidate set:
+    - scores every (query, chunk) pair with the scorer, in one batch per call
+    - caches raw scores per (scorer, normalized query, chunk text) in an LRU
+    - fuses the min-max normalized score with the vector similarity
+      (`vector_weight` of 0 = scorer only) and keeps the top n
+    Cumulative timing is kept in stats() so CPU cost can be compared with
+    the prompt tokens saved.
+    """
+
+    def __init__(
+        self,
+        scorer: Any,
+        vector_weight: float = 0.3,
+        cache_max_entries: int = 20000,
+    ) -> None:
+        self.scorer = scorer
+        self.vector_weight = vector_weight
+        self.cache_max_entries = cache_max_entries
+        self._cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.total_ms = 0.0
+
+    def fit(self, documents: Sequence[str]) -> None:
+        """
+        (Re)build corpus statistics after the KB changes; drops cached scores.
+        """
+        self.scorer.fit(documents)
+        with self._lock:
+            self._cache.clear()
+
+    def rerank_many(self, queries: Sequence[str], candidate_lists: Sequence[Chunks], top_n: int) -> List[Chunks]:
+        """
+        Rerank several candidate lists at once (one scorer batch for all
+        uncached pairs). Returns copies of the chunks with a "rerank_score".
+        """
+        started = time.perf_counter()
+        keys: List[List[Tuple[str, str, str]]] = []
+        todo: "OrderedDict[Tuple[str, str, str], Tuple[str, str]]" = OrderedDict()
+        scores: Dict[Tuple[str, str, str], float] = {}
+
+        with self._lock:
+            for query, chunks in zip(queries, candidate_lists):
+                norm = normalize_query(query)
+                row = []
+                for chunk in chunks:
+                    key = (self.scorer.name, norm, text_digest(chunk.get("text") or ""))
+                    row.append(key)
+                    cached = self._cache.get(key)
+                    if cached is not None:
+                        self._cache.move_to_end(key)
+                        scores[key] = cached
+                        self.cache_hits += 1
+                    elif key not in todo:
+                        todo[key] = (query, chunk.get("text") or "")
+                keys.append(row)
+
+        if todo:
+            fresh = self.scorer.score_batch(list(todo.values()))
+            with self._lock:
+                for key, score in zip(todo, fresh):
+                    scores[key] = score
+                    self._cache[key] = score
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+
+        out = [self._fuse(chunks, [scores[k] for k in row], top_n) for chunks, row in zip(candidate_lists, keys)]
+
+        with self._lock:
+            self.calls += 1
+            self.pairs_scored += len(todo)
+            self.total_ms += (time.perf_counter() - started) * 1000
+        return out
+
+    def rerank(self, query: str, chunks: Chunks, top_n: int) -> Chunks:
+        return self.rerank_many([query], [chunks], top_n)[0]
+
+    def _fuse(self, chunks: Chunks, raw: List[float], top_n: int) -> Chunks:
+        if not chunks:
+            return []
+        lo, hi = min(raw), max(raw)
+        sims = [1.0 / (1.0 + c.get("distance", 0.0)) for c in chunks]
+        s_lo, s_hi = min(sims), max(sims)
+
+        fused = []
+        for chunk, score, sim in zip(chunks, raw, sims):
+            norm_score = (score - lo) / (hi - lo) if hi > lo else 0.0
+            norm_sim = (sim - s_lo) / (s_hi - s_lo) if s_hi > s_lo else 0.0
+            item = dict(chunk)
+            item["rerank_score"] = round((1 - self.vector_weight) * norm_score + self.vector_weight * norm_sim, 4)
+            fused.append(item)
+        fused.sort(key=lambda c: c["rerank_score"], reverse=True)
+        return fused[:top_n]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scorer": self.scorer.name,
+            "calls": self.calls,
+            "pairs_scored": self.pairs_scored,
+            "cache_hits": self.cache_hits,
+            "cache_entries": len(self._cache),
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms_per_call": round(self.total_ms / self.calls, 3) if self.calls else None,
+        }
+
+
+def create_reranker(model_name: str, vector_weight: float, cache_max_entries: int) -> Reranker:
+    """
+    Cross-encoder when `model_name` is set and sentence-transformers is
+    installed, otherwise the BM25 scorer (no extra dependencies).
+    """
+    scorer: Any = None
+    if model_name:
+        try:
+            scorer = CrossEncoderScorer(model_name)
+        except Exception as exc:  # missing package, model download failure, ...
+            warnings.warn(f"Cross-encoder '{model_name}' unavailable ({exc}); using BM25 reranking")
+    return Reranker(scorer or LexicalScorer(), vector_weight=vector_weight, cache_max_entries=cache_max_entries)
+
+
+def rerank_enabled_for(endpoint: Optional[str], endpoints_setting: str) -> bool:
+    """
+    `endpoints_setting` is a comma-separated list, e.g. "chatbot,suggest_reply", or "*".
+    """
+    if not endpoint:
+        return False
+    enabled = {e.strip() for e in endpoints_setting.split(",") if e.strip()}
+    return "*" in enabled or endpoint in enabled
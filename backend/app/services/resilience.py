@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Optional
+
+# A provider takes (prompt, model_name, timeout_sec) and returns the generated text.
+Provider = Callable[[str, str, float], str]
+
+# HTTP-style status codes that are worth retrying (rate limits + transient server errors).
+# google.api_core exceptions expose these on `.code`.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when a call does not finish before its deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker rejects a call without trying the provider."""
+
+
+class TransientLLMError(RuntimeError):
+    """Generic retryable error (used by fake providers and wrappers)."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Decide if an error from the provider is worth retrying.
+    Timeouts, connection problems, rate limits and 5xx errors are retryable;
+    everything else (bad request, auth, safety blocks) is not.
+    """
+    if isinstance(exc, (TimeoutError, ConnectionError, TransientLLMError)):
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+# ---------- Circuit breaker ----------
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker:
+    - closed: calls go through, consecutive failures are counted
+    - open: calls are rejected until reset_timeout_sec has passed
+    - half_open: one trial call is allowed; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_sec: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout_sec:
+            self._state = "half_open"
+            self._trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """
+        Neutral outcome (e.g. a bad request): frees the half-open trial slot
+        without closing the circuit or touching the failure count.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+
+# ---------- Latency tracking (for hedging) ----------
+
+class LatencyTracker:
+    """
+    Keeps a rolling window of successful call latencies so we can estimate p95.
+    """
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_sec: float) -> None:
+        with self._lock:
+            self._samples.append(latency_sec)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+# ---------- Resilient client ----------
+
+class ResilientLLMClient:
+    """
+    Wraps a provider with:
+    - a per-call deadline (the worker is released even if the SDK call hangs)
+    - jittered exponential backoff retries for retryable errors
+    - optional hedged requests: a second call is fired if the first one is
+      slower than the observed p95 latency, and the first answer wins
+    - a circuit breaker that routes to a cheaper fallback model, and finally
+      to a canned response, when the primary model keeps failing (the
+      fallback model has its own breaker so an outage there is not hammered)
+    """
+
+    def __init__(
+        self,
+        provider: Provider,
+        timeout_sec: float = 20.0,
+        max_retries: int = 2,
+        backoff_base_sec: float = 0.5,
+        backoff_max_sec: float = 4.0,
+        hedge_enabled: bool = False,
+        hedge_min_delay_sec: float = 1.0,
+        breaker: Optional[CircuitBreaker] = None,
+        fallback_breaker: Optional[CircuitBreaker] = None,
+        fallback_model: Optional[str] = None,
+        fallback_reply: str = "",
+        max_workers: int = 16,
+    ) -> None:
+        self.provider = provider
+        self.timeout_sec = timeout_sec
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay_sec = hedge_min_delay_sec
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback_breaker = fallback_breaker or CircuitBreaker()
+        self.fallback_model = fallback_model
+        self.fallback_reply = fallback_reply
+        self.latency = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    # --- single attempt (with optional hedge) ---
+
+    def _hedge_delay(self) -> float:
+        p95 = self.latency.percentile(95)
+        if p95 is None:
+            return max(self.hedge_min_delay_sec, self.timeout_sec / 2)
+        return max(self.hedge_min_delay_sec, p95)
+
+    def _attempt(self, prompt: str, model_name: str, deadline: float, hedge: bool) -> str:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeoutError("LLM call deadline exceeded before attempt")
+
+        start = time.monotonic()
+        pending: set[Future] = {self._executor.submit(self.provider, prompt, model_name, remaining)}
+
+        if hedge:
+            done, _ = wait(pending, timeout=min(self._hedge_delay(), remaining))
+            if not done:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    pending.add(self._executor.submit(self.provider, prompt, model_name, remaining))
+
+        last_exc: Optional[BaseException] = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                exc = fut.exception()
+                if exc is None:
+                    # First successful answer wins; the other call (if any) is abandoned
+                    for other in pending:
+                        other.cancel()
+                    self.latency.record(time.monotonic() - start)
+                    return fut.result()
+                last_exc = exc
+
+        for fut in pending:
+            fut.cancel()
+        if last_exc is not None and not pending:
+            raise last_exc
+        raise LLMTimeoutError(f"LLM call exceeded {self.timeout_sec:.1f}s deadline")
+
+    def _call_with_retries(self, prompt: str, model_name: str, hedge: bool) -> str:
+        deadline = time.monotonic() + self.timeout_sec
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(prompt, model_name, deadline, hedge)
+            except Exception as exc:
+                attempt += 1
+                if attempt > self.max_retries or not is_retryable(exc):
+                    raise
+                # Full jitter: sleep a random amount up to the exponential cap
+                cap = min(self.backoff_max_sec, self.backoff_base_sec * (2 ** (attempt - 1)))
+                sleep_for = random.uniform(0, cap)
+                if time.monotonic() + sleep_for >= deadline:
+                    raise
+                time.sleep(sleep_for)
+
+    def _guarded_call(self, breaker: CircuitBreaker, prompt: str, model_name: str, hedge: bool) -> Optional[str]:
+        """
+        One model behind its breaker; returns None if the circuit is open or
+        the call failed.
+        """
+        if not breaker.allow_request():
+            return None
+        try:
+            text = self._call_with_retries(prompt, model_name, hedge=hedge)
+        except Exception as exc:
+            if is_retryable(exc):
+                breaker.record_failure()
+            else:
+                # Bad request / safety block: the provider answered, so this
+                # says nothing about its health either way
+                breaker.release_trial()
+            return None
+        breaker.record_success()
+        return text
+
+    # --- public API ---
+
+    def generate(self, prompt: str, model_name: str) -> str:
+        """
+        Generate text, never raising for provider failures: on repeated
+        failure (or open circuit) we fall back to the cheaper model, then to
+        the canned reply.
+        """
+        text = self._guarded_call(self.breaker, prompt, model_name, hedge=self.hedge_enabled)
+        if text is not None:
+            return text
+
+        if self.fallback_model and self.fallback_model != model_name:
+            text = self._guarded_call(self.fallback_breaker, prompt, self.fallback_model, hedge=False)
+            if text is not None:
+                return text
+
+        return self.fallback_reply
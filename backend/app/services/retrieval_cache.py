@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.query_normalizer import canonicalize
+
+Chunks = List[Dict[str, Any]]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form (case, Unicode, whitespace, order numbers) so trivially
+    different queries share a cache entry. Idempotent, so callers that
+    already pass canonical_query() output get the same key.
+    """
+    return canonicalize(query or "")
+
+
+def cache_key(query: str, n_results: int, topic_hint: Optional[str], kb_version: str) -> str:
+    raw = json.dumps(
+        [normalize_query(query), n_results, (topic_hint or "").strip().lower(), kb_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class RetrievalCache:
+    """
+    Two-level cache of retrieval results:
+    - an in-process LRU (fastest, per worker)
+    - optionally a SQLite table shared by all workers on the machine
+
+    Entries expire after `ttl_sec`. Keys include the KB version, and
+    invalidate() drops everything from other versions when the KB is re-indexed.
+    The SQLite file also holds the current KB version per tenant
+    (publish_version / published_version), so a re-index done by one worker
+    reaches the others.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        ttl_sec: float = 86400.0,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        # key -> (stored_at, kb_version, chunks)
+        self._local: "OrderedDict[str, Tuple[float, str, Chunks]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+
+        if db_path is not None:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=5)
+            with self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS retrieval_cache (
+                        key TEXT PRIMARY KEY,
+                        kb_version TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                    """
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS retrieval_cache_last_used ON retrieval_cache(last_used)"
+                )
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS kb_versions (
+                        scope TEXT PRIMARY KEY,
+                        kb_version TEXT NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                    """
+                )
+
+    # --- local LRU ---
+
+    def _local_get(self, key: str, now: float) -> Optional[Chunks]:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        stored_at, _, value = item
+        if now - stored_at > self.ttl_sec:
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _local_put(self, key: str, kb_version: str, value: Chunks, stored_at: float) -> None:
+        self._local[key] = (stored_at, kb_version, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    # --- public API ---
+
+    def get(self, key: str) -> Optional[Chunks]:
+        now = time.time()
+        with self._lock:
+            value = self._local_get(key, now)
+            if value is None and self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, created_at, kb_version FROM retrieval_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row and now - row[1] <= self.ttl_sec:
+                    value = json.loads(row[0])
+                    self._local_put(key, row[2], value, row[1])
+                    try:
+                        with self._conn:
+                            self._conn.execute(
+                                "UPDATE retrieval_cache SET last_used = ? WHERE key = ?", (now, key)
+                            )
+                    except sqlite3.Error:
+                        pass
+
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Callers get their own copies, so they can't mutate the cached chunks
+        return [dict(c) for c in value]
+
+    def put(self, key: str, kb_version: str, value: Chunks) -> None:
+        now = time.time()
+        value = [dict(c) for c in value]
+        with self._lock:
+            self._local_put(key, kb_version, value, now)
+            if self._conn is None:
+                return
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO retrieval_cache (key, kb_version, value, created_at, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, kb_version, json.dumps(value, ensure_ascii=False), now, now),
+                    )
+                    self._puts += 1
+                    # Evict expired + least recently used rows every so often
+                    if self._puts % 100 == 0:
+                        self._conn.execute(
+                            "DELETE FROM retrieval_cache WHERE created_at < ?", (now - self.ttl_sec,)
+                        )
+                        self._conn.execute(
+                            "DELETE FROM retrieval_cache WHERE key IN ("
+                            "SELECT key FROM retrieval_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                            (self.max_entries,),
+                        )
+            except sqlite3.Error:
+                # The shared tier is best-effort; the local LRU still works
+                pass
+
+    def invalidate(self, kb_version: str, scope: str = "") -> None:
+        """
+        Drop every entry that was not computed against `kb_version`.
+        With a `scope` (e.g. "acme:"), only versions starting with it are
+        touched, so re-indexing one tenant keeps the other tenants' entries.
+        """
+        with self._lock:
+            stale = [
+                k for k, (_, version, _) in self._local.items()
+                if version != kb_version and version.startswith(scope)
+            ]
+            for k in stale:
+                del self._local[k]
+            if self._conn is None:
+                return
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM retrieval_cache WHERE kb_version != ? AND substr(kb_version, 1, ?) = ?",
+                        (kb_version, len(scope), scope),
+                    )
+            except sqlite3.Error:
+                pass
+
+    def publish_version(self, scope: str, kb_version: str) -> None:
+        """
+        Record `kb_version` as the current version of `scope` (a tenant) for
+        the other workers sharing the SQLite file. No-op without it.
+        """
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO kb_versions (scope, kb_version, updated_at) VALUES (?, ?, ?)",
+                        (scope, kb_version, time.time()),
+                    )
+            except sqlite3.Error:
+                pass
+
+    def published_version(self, scope: str) -> Optional[str]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT kb_version FROM kb_versions WHERE scope = ?", (scope,)).fetchone()
+            except sqlite3.Error:
+                return None
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "local_entries": len(self._local),
+        }
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+# Cached entry: {"summary": str, "key_points": List[str], "length": int}
+SummaryEntry = Dict[str, Any]
+
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*\S)\s*$")
+_HEADING_RE = re.compile(r"^\s*(?:#+\s*)?\**\s*(summary|key\s*points?)\s*:?\s*\**\s*:?\s*$", re.IGNORECASE)
+_LABEL_RE = re.compile(r"^\s*\**\s*summary\s*:\s*\**\s*", re.IGNORECASE)
+
+
+def parse_summary_output(text: str) -> Tuple[str, List[str]]:
+    """
+    Split the LLM output into (summary, key_points).
+    Bullet / numbered lines become key points; other lines form the summary.
+    Section headings ("Summary:", "Key points:") are dropped.
+    """
+    summary_lines: List[str] = []
+    key_points: List[str] = []
+
+    for line in (text or "").splitlines():
+        if not line.strip() or _HEADING_RE.match(line):
+            continue
+        bullet = _BULLET_RE.match(line)
+        if bullet:
+            key_points.append(bullet.group(1).replace("**", "").strip())
+        else:
+            summary_lines.append(_LABEL_RE.sub("", line).strip())
+
+    summary = " ".join(s for s in summary_lines if s)
+    return summary or (text or "").strip(), key_points
+
+
+class SummaryCache:
+    """
+    In-memory LRU + TTL cache of case summaries keyed by the digest of the
+    (masked) conversation prefix they summarize. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_sec: float = 3600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries: "OrderedDict[str, Tuple[float, SummaryEntry]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_locked(self, digest: str) -> Optional[SummaryEntry]:
+        item = self._entries.get(digest)
+        if item is None:
+            return None
+        stored_at, entry = item
+        if time.monotonic() - stored_at > self.ttl_sec:
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return entry
+
+    def get(self, digest: str) -> Optional[SummaryEntry]:
+        with self._lock:
+            return self._get_locked(digest)
+
+    def longest_prefix(self, digests: List[str]) -> Tuple[int, Optional[SummaryEntry]]:
+        """
+        Given prefix digests [d0..dn] of a conversation, return (k, entry) for
+        the longest cached prefix d_k (k >= 1), or (0, None).
+        """
+        with self._lock:
+            for k in range(len(digests) - 1, 0, -1):
+                entry = self._get_locked(digests[k])
+                if entry is not None:
+                    return k, entry
+        return 0, None
+
+    def put(self, digest: str, entry: SummaryEntry) -> None:
+        with self._lock:
+            self._entries[digest] = (time.monotonic(), entry)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+summary_cache = SummaryCache(
+    max_entries=settings.summary_cache_max_entries,
+    ttl_sec=settings.summary_cache_ttl_sec,
+)
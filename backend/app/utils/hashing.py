@@ -0,0 +1,36 @@
+import hashlib
+from typing import Any, Iterable, List, Mapping
+
+ROOT_DIGEST = ""
+
+
+def text_digest(text: str, length: int = 16) -> str:
+    """
+    Short, stable content hash for a piece of text.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:length]
+
+
+def extend_digest(prev: str, role: str, content: str) -> str:
+    """
+    Chain one message onto a prefix digest. Because the hash is chained,
+    the digest of every prefix of a conversation can be computed in one pass.
+    """
+    h = hashlib.sha1()
+    h.update(prev.encode("ascii"))
+    h.update(b"\x1e")
+    h.update(role.encode("utf-8"))
+    h.update(b"\x1f")
+    h.update(content.encode("utf-8"))
+    return h.hexdigest()
+
+
+def message_prefix_digests(messages: Iterable[Mapping[str, Any]]) -> List[str]:
+    """
+    Return [d0, d1, ..., dn] where d_k is the digest of the first k messages
+    (d0 is the empty conversation).
+    """
+    digests = [ROOT_DIGEST]
+    for msg in messages:
+        digests.append(extend_digest(digests[-1], str(msg.get("role", "")), str(msg.get("content", ""))))
+    return digests
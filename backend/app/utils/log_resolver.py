@@ -0,0 +1,119 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.utils.hashing import extend_digest
+from app.utils.logger import CHUNK_STORE_PATH
+
+
+class LogResolver:
+    """
+    Rebuild full log records from the compact format written by logger.py:
+    - `history_ref` + `history_delta` -> full `history`
+    - context references (`text_sha`) -> contexts with their `text`
+
+    Records must be fed in the order they were written (file order, oldest
+    rotated file first), because deltas point at earlier turns.
+    Records already in the full format pass through unchanged.
+    """
+
+    def __init__(self, chunk_store_path: Path = CHUNK_STORE_PATH) -> None:
+        self.chunk_store_path = Path(chunk_store_path)
+        self._chunks: Optional[Dict[str, str]] = None
+        # digest -> (parent digest, messages added on top of the parent)
+        self._nodes: Dict[str, Tuple[Optional[str], List[Dict[str, Any]]]] = {}
+
+    # --- chunk texts ---
+
+    def _chunk_texts(self) -> Dict[str, str]:
+        if self._chunks is None:
+            self._chunks = {}
+            if self.chunk_store_path.exists():
+                with self.chunk_store_path.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            row = json.loads(line)
+                            self._chunks[row["text_sha"]] = row["text"]
+                        except (ValueError, KeyError, TypeError):
+                            continue
+        return self._chunks
+
+    def _resolve_contexts(self, contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        texts = self._chunk_texts()
+        out: List[Dict[str, Any]] = []
+        for ctx in contexts:
+            if "text" in ctx or "text_sha" not in ctx:
+                out.append(ctx)
+                continue
+            out.append(
+                {
+                    "id": ctx.get("chunk_id"),
+                    "text_sha": ctx["text_sha"],
+                    "text": texts.get(ctx["text_sha"]),
+                    "metadata": {"source": ctx.get("source")},
+                    "distance": ctx.get("distance"),
+                }
+            )
+        return out
+
+    # --- history ---
+
+    def _history(self, digest: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        segments: List[List[Dict[str, Any]]] = []
+        while digest:
+            node = self._nodes.get(digest)
+            if node is None:
+                return None  # base turn not seen (e.g. older file not provided)
+            digest, added = node
+            segments.append(added)
+        return [msg for seg in reversed(segments) for msg in seg]
+
+    def _resolve_history(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        ref = record.pop("history_ref")
+        delta = record.pop("history_delta", []) or []
+        base = ref.get("base")
+
+        base_history = self._history(base) if base else []
+        if base_history is None:
+            record["history_incomplete"] = True
+            base_history = []
+        record["history"] = base_history + delta
+
+        digest = ref.get("digest")
+        if digest is not None:
+            # Same digest means same messages, so an existing node is kept
+            # (this also avoids a self-loop when the delta is empty).
+            # The empty conversation ("") is the root and needs no node.
+            if digest and digest != base:
+                self._nodes.setdefault(digest, (base, delta))
+            next_turn = extend_digest(
+                extend_digest(digest, "user", record.get("query", "")),
+                "assistant",
+                record.get("reply", ""),
+            )
+            self._nodes.setdefault(
+                next_turn,
+                (
+                    digest,
+                    [
+                        {"role": "user", "content": record.get("query", "")},
+                        {"role": "assistant", "content": record.get("reply", "")},
+                    ],
+                ),
+            )
+        return record
+
+    # --- public API ---
+
+    def resolve(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(record)
+        if "history_ref" in record:
+            record = self._resolve_history(record)
+        extra = record.get("extra")
+        if extra and extra.get("contexts"):
+            record["extra"] = {**extra, "contexts": self._resolve_contexts(extra["contexts"])}
+        return record
+
+    def resolve_all(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for record in records:
+            yield self.resolve(record)
@@ -1,16 +1,156 @@
 import json
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import settings
+from app.utils.hashing import extend_digest, message_prefix_digests, text_digest
+
+try:
+    import orjson
+except ImportError:  # optional speedup; falls back to the standard json module
+    orjson = None
 
 BASE_LOG_DIR = Path(__file__).resolve().parents[2] / "logs"
+if settings.llm_fake:
+    # Replayed load-test traffic (fake replies) stays out of the real logs
+    BASE_LOG_DIR = BASE_LOG_DIR / "replay"
 BASE_LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+# KB chunk texts are written here once; log records only reference them
+CHUNK_STORE_PATH = BASE_LOG_DIR / "kb_chunks.jsonl"
+
+# How many conversation prefixes we remember for history deltas
+MAX_KNOWN_HISTORIES = 50_000
+
+_lock = threading.Lock()
+
+
+def elapsed_ms(started: float) -> float:
+    """
+    Milliseconds since `started` (a time.perf_counter() value), rounded for logging.
+    """
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def dumps_line(record: Dict[str, Any]) -> bytes:
+    """
+    One JSONL line as UTF-8 bytes. orjson is several times faster than
+    json.dumps and writes bytes directly; default=str covers stray
+    non-JSON values (e.g. datetimes) the same way in both paths.
+    """
+    if orjson is not None:
+        return orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    return (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
 
 def _write_jsonl(path: Path, record: Dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    with path.open("ab") as f:
+        f.write(dumps_line(record))
+
+
+# ---------- Context references ----------
+
+_seen_chunks: Optional[Set[str]] = None
+
+
+def _load_seen_chunks() -> Set[str]:
+    seen: Set[str] = set()
+    if CHUNK_STORE_PATH.exists():
+        with CHUNK_STORE_PATH.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    seen.add(json.loads(line)["text_sha"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+    return seen
+
+
+def _compact_contexts(contexts: List[Dict[str, Any]], kb_version: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Replace full chunk texts with references. Each distinct text is appended
+    to the chunk store the first time it is seen. Caller holds _lock.
+    """
+    global _seen_chunks
+    if _seen_chunks is None:
+        _seen_chunks = _load_seen_chunks()
+
+    refs: List[Dict[str, Any]] = []
+    for ctx in contexts:
+        text = ctx.get("text") or ""
+        sha = text_digest(text)
+        meta = ctx.get("metadata", {}) or {}
+        chunk_id = ctx.get("id") or f"{meta.get('base_id', 'kb')}::chunk{meta.get('chunk_index', '?')}"
+        if sha not in _seen_chunks:
+            _write_jsonl(
+                CHUNK_STORE_PATH,
+                {"text_sha": sha, "chunk_id": chunk_id, "kb_version": kb_version, "text": text},
+            )
+            _seen_chunks.add(sha)
+        ref = {
+            "chunk_id": chunk_id,
+            "distance": ctx.get("distance"),
+            "source": re.split(r"[\\/]", str(meta.get("source", "kb")))[-1],
+            "text_sha": sha,
+        }
+        if ctx.get("merged_ids"):
+            # Adjacent chunks merged into one snippet by context selection
+            ref["merged_ids"] = ctx["merged_ids"]
+        refs.append(ref)
+    return refs
+
+
+def _compact_extra(extra: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not extra or not extra.get("contexts"):
+        return extra
+    compact = dict(extra)
+    compact["contexts"] = _compact_contexts(extra["contexts"], extra.get("kb_version"))
+    return compact
+
+
+# ---------- History deltas ----------
+
+# Digests of conversation prefixes already written to the log (bounded LRU)
+_known_histories: "OrderedDict[str, None]" = OrderedDict()
+
+
+def _remember_history(digest: str) -> None:
+    _known_histories[digest] = None
+    _known_histories.move_to_end(digest)
+    while len(_known_histories) > MAX_KNOWN_HISTORIES:
+        _known_histories.popitem(last=False)
+
+
+def _history_delta(history: List[Dict[str, Any]], query: str, reply: str) -> Dict[str, Any]:
+    """
+    Express `history` as (longest previously logged prefix, new messages).
+    After a turn, the next request's history is usually this history plus
+    the query and reply, so that is remembered too. Caller holds _lock.
+    """
+    digests = message_prefix_digests(history)
+    base_len = 0
+    for k in range(len(history), 0, -1):
+        if digests[k] in _known_histories:
+            base_len = k
+            break
+
+    full = digests[-1]
+    next_turn = extend_digest(extend_digest(full, "user", query), "assistant", reply)
+    _remember_history(full)
+    _remember_history(next_turn)
+
+    return {
+        "history_ref": {
+            "base": digests[base_len] if base_len else None,
+            "digest": full,
+        },
+        "history_delta": history[base_len:],
+    }
 
 
 def log_chatbot_call(
@@ -19,16 +159,23 @@ def log_chatbot_call(
     reply: str,
     extra: Optional[Dict[str, Any]] = None,
 ) -> None:
-    record: Dict[str, Any] = {
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "type": "chatbot",
-        "query": query,
-        "history": history,
-        "reply": reply,
-    }
-    if extra:
-        record["extra"] = extra
-    _write_jsonl(BASE_LOG_DIR / "chatbot_logs.jsonl", record)
+    """
+    Log a chatbot call. Retrieved contexts are stored as chunk references and
+    the history as a delta against earlier turns; see app/utils/log_resolver.py
+    to rebuild full records.
+    """
+    with _lock:
+        record: Dict[str, Any] = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "type": "chatbot",
+            "query": query,
+            **_history_delta(list(history or []), query, reply),
+            "reply": reply,
+        }
+        extra = _compact_extra(extra)
+        if extra:
+            record["extra"] = extra
+        _write_jsonl(BASE_LOG_DIR / "chatbot_logs.jsonl", record)
 
 
 def log_copilot_call(
@@ -37,13 +184,15 @@ def log_copilot_call(
     output: Any,
     extra: Optional[Dict[str, Any]] = None,
 ) -> None:
-    record: Dict[str, Any] = {
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "type": "copilot",
-        "mode": mode,
-        "payload": payload,
-        "output": output,
-    }
-    if extra:
-        record["extra"] = extra
-    _write_jsonl(BASE_LOG_DIR / "copilot_logs.jsonl", record)
+    with _lock:
+        record: Dict[str, Any] = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "type": "copilot",
+            "mode": mode,
+            "payload": payload,
+            "output": output,
+        }
+        extra = _compact_extra(extra)
+        if extra:
+            record["extra"] = extra
+        _write_jsonl(BASE_LOG_DIR / "copilot_logs.jsonl", record)
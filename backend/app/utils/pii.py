@@ -1,5 +1,5 @@
 import re
-from typing import Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 # Very simple regex-based PII detectors
 EMAIL_RE = re.compile(
@@ -42,3 +42,24 @@ def mask_pii(text: str) -> Tuple[str, bool]:
     masked = _sub_and_flag(CARD_RE, "[CARD]", masked)
 
     return masked, had_pii
+
+
+def mask_messages(messages: Optional[Iterable[Any]]) -> Tuple[List[Dict[str, str]], bool]:
+    """
+    Mask a conversation without building new models.
+    Accepts ChatMessage objects or {"role", "content"} dicts (already validated
+    by the request model) and returns plain dicts, which the prompt builders,
+    digests and logger use directly.
+    Returns (masked_messages, had_pii).
+    """
+    out: List[Dict[str, str]] = []
+    had_pii = False
+    for msg in messages or ():
+        if isinstance(msg, dict):
+            role, content = msg["role"], msg["content"]
+        else:
+            role, content = msg.role, msg.content
+        masked, flagged = mask_pii(content)
+        had_pii = had_pii or flagged
+        out.append({"role": role, "content": masked})
+    return out, had_pii
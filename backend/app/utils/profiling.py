@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import anyio
+
+# Leaf frames in these files mean the thread is parked (lock wait, select, queue get)
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+PROFILE_SUFFIX = ".speedscope.json"
+
+
+def token_matches(value: Optional[str], token: str) -> bool:
+    """
+    Constant-time token check; an empty configured token never matches,
+    so profiling can't be forced or read without one.
+    """
+    if not token or value is None:
+        return False
+    return hmac.compare_digest(value.encode("latin-1"), token.encode("latin-1"))
+
+
+# ---------- Sampler ----------
+
+class StackSampler:
+    """
+    Statistical CPU profiler in pure Python: a background thread reads every
+    thread's current stack (sys._current_frames) each `interval_ms` and
+    counts identical stacks. Nothing is hooked into the profiled code, so
+    only requests that are being sampled pay for it.
+
+    Sync endpoints run in the threadpool and async ones on the event loop,
+    so all threads are sampled; parked threads are skipped. Requests that
+    run concurrently with a profiled one show up in its profile as well.
+    """
+
+    def __init__(self, interval_ms: float = 5.0, max_depth: int = 128) -> None:
+        self.interval_sec = max(interval_ms, 0.5) / 1000
+        self.max_depth = max_depth
+        # (thread name, stack of (name, file, line) from root to leaf) -> samples
+        self.counts: Dict[Tuple[str, Tuple[Tuple[str, str, int], ...]], int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration_ms = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration_ms = (time.perf_counter() - self.started_at) * 1000
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval_sec):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                key = (names.get(thread_id, str(thread_id)), tuple(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.samples += 1
+
+    def to_speedscope(self, name: str) -> Dict[str, Any]:
+        """
+        Speedscope "sampled" file, one profile per thread
+        (open it at https://www.speedscope.app).
+        """
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Tuple[str, str, int], int] = {}
+        per_thread: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        interval_ms = self.interval_sec * 1000
+
+        for (thread_name, stack), count in self.counts.items():
+            indices = []
+            for frame in stack:
+                idx = frame_index.get(frame)
+                if idx is None:
+                    idx = frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(idx)
+            samples, weights = per_thread.setdefault(thread_name, ([], []))
+            samples.append(indices)
+            weights.append(count * interval_ms)
+
+        profiles = [
+            {
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            for thread_name, (samples, weights) in sorted(per_thread.items(), key=lambda kv: -sum(kv[1][1]))
+        ]
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "ai-customer-service-backend",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+# ---------- Profile files ----------
+
+class ProfileStore:
+    """
+    Speedscope files in one folder, newest `max_files` kept. Request details
+    (path, status, duration, trigger) are remembered in memory for the
+    admin listing; files from earlier runs are listed from disk.
+    """
+
+    def __init__(self, directory: Path, max_files: int = 50) -> None:
+        self.directory = directory
+        self.max_files = max_files
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._order: Deque[str] = deque()
+        self._lock = threading.Lock()
+
+    def path_for(self, profile_id: str) -> Optional[Path]:
+        # IDs are generated by us; anything else (e.g. "../x") is not a profile
+        if not profile_id.replace("-", "").isalnum():
+            return None
+        path = self.directory / f"{profile_id}{PROFILE_SUFFIX}"
+        return path if path.exists() else None
+
+    def save(self, profile_id: str, sampler: StackSampler, meta: Dict[str, Any]) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{profile_id}{PROFILE_SUFFIX}"
+        title = f"{meta['method']} {meta['path']} ({meta['duration_ms']:.0f} ms)"
+        path.write_text(json.dumps(sampler.to_speedscope(title)), encoding="utf-8")
+        with self._lock:
+            self._meta[profile_id] = meta
+            self._order.append(profile_id)
+            while len(self._order) > self.max_files:
+                self._meta.pop(self._order.popleft(), None)
+        self._prune()
+        return path
+
+    def _prune(self) -> None:
+        files = sorted(self.directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda p: p.stat().st_mtime)
+        for old in files[: max(0, len(files) - self.max_files)]:
+            old.unlink(missing_ok=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not self.directory.exists():
+            return []
+        files = sorted(self.directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda p: p.stat().st_mtime, reverse=True)
+        out = []
+        with self._lock:
+            for path in files:
+                profile_id = path.name[: -len(PROFILE_SUFFIX)]
+                stat = path.stat()
+                out.append(
+                    {
+                        "profile_id": profile_id,
+                        "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+                        "size_kb": round(stat.st_size / 1024, 1),
+                        **self._meta.get(profile_id, {}),
+                    }
+                )
+        return out
+
+
+# ---------- ASGI middleware ----------
+
+class ProfilingMiddleware:
+    """
+    Profiles a random `sample_rate` share of HTTP requests, plus any request
+    sending `header` with the value `token`. Without a token the header
+    trigger is off, so clients can't force profiling on their own.
+    The profile ID is returned in the X-Profile-Id response header.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so unprofiled requests cost
+    one random() call and a header scan, and streaming responses are
+    passed through untouched. main.py only installs it when enabled.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        store: ProfileStore,
+        sample_rate: float = 0.0,
+        header: str = "x-debug-profile",
+        token: str = "",
+        interval_ms: float = 5.0,
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.header = header.lower().encode("latin-1")
+        self.token = token
+        self.interval_ms = interval_ms
+
+    def _trigger(self, scope: Dict[str, Any]) -> Optional[str]:
+        for key, value in scope.get("headers") or []:
+            if key == self.header:
+                if token_matches(value.decode("latin-1"), self.token):
+                    return "header"
+                break
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        status = 500
+
+        async def _send(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sampler = StackSampler(self.interval_ms)
+        sampler.start()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            # Joining the sampler thread and writing the file both block: keep them off the event loop
+            await anyio.to_thread.run_sync(sampler.stop)
+            meta = {
+                "method": scope.get("method", ""),
+                "path": scope.get("path", ""),
+                "status": status,
+                "trigger": trigger,
+                "duration_ms": round(sampler.duration_ms, 1),
+                "samples": sampler.samples,
+            }
+            await anyio.to_thread.run_sync(self.store.save, profile_id, sampler, meta)
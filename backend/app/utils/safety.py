@@ -1,4 +1,6 @@
-from typing import Literal
+import re
+from bisect import bisect_right
+from typing import List, Literal
 
 SafetyFlag = Literal["normal", "unsafe", "out_of_scope"]
 
@@ -29,6 +31,12 @@ OUT_OF_SCOPE_KEYWORDS = [
 ]
 
 
+# Each keyword list compiled into one alternation, so a text is scanned once
+# per list instead of once per keyword
+_UNSAFE_RE = re.compile("|".join(re.escape(kw) for kw in UNSAFE_KEYWORDS))
+_OUT_OF_SCOPE_RE = re.compile("|".join(re.escape(kw) for kw in OUT_OF_SCOPE_KEYWORDS))
+
+
 def classify_safety(text: str) -> SafetyFlag:
     """
     Very basic classifier:
@@ -38,12 +46,40 @@ def classify_safety(text: str) -> SafetyFlag:
     """
     s = (text or "").lower()
 
-    for kw in UNSAFE_KEYWORDS:
-        if kw in s:
-            return "unsafe"
+    if _UNSAFE_RE.search(s):
+        return "unsafe"
 
-    for kw in OUT_OF_SCOPE_KEYWORDS:
-        if kw in s:
-            return "out_of_scope"
+    if _OUT_OF_SCOPE_RE.search(s):
+        return "out_of_scope"
 
     return "normal"
+
+
+def classify_safety_batch(texts: List[str]) -> List[SafetyFlag]:
+    """
+    Classify many texts at once. Texts are joined into one buffer (separated
+    by a character no keyword contains) and each pattern is run over it once;
+    match offsets are mapped back to the text they came from.
+    """
+    flags: List[SafetyFlag] = ["normal"] * len(texts)
+    if not texts:
+        return flags
+
+    sep = "\x00"
+    lowered = [(t or "").lower().replace(sep, " ") for t in texts]
+    buffer = sep.join(lowered)
+
+    # Start offset of each text inside the buffer
+    starts: List[int] = []
+    pos = 0
+    for t in lowered:
+        starts.append(pos)
+        pos += len(t) + 1
+
+    for m in _OUT_OF_SCOPE_RE.finditer(buffer):
+        flags[bisect_right(starts, m.start()) - 1] = "out_of_scope"
+    # Unsafe wins over out_of_scope, same as classify_safety
+    for m in _UNSAFE_RE.finditer(buffer):
+        flags[bisect_right(starts, m.start()) - 1] = "unsafe"
+
+    return flags
@@ -0,0 +1,26 @@
+import re
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Shared by the FAQ intent router and the lexical reranker
+STOPWORDS = frozenset({
+    "a", "an", "the", "i", "me", "my", "is", "are", "do", "does", "to", "of", "for", "and", "or",
+    "can", "be", "it", "in", "on", "at", "you", "your", "we", "what", "how", "when", "where",
+    "which", "will", "have", "has", "this", "that", "with", "please", "there", "get", "was",
+})
+
+
+def content_tokens(text: str) -> List[str]:
+    """
+    Lower-cased alphanumeric tokens minus stopwords, with very light
+    stemming so "returns"/"return" and "days"/"day" match.
+    """
+    out = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        out.append(tok)
+    return out
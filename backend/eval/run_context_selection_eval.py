@@ -0,0 +1,150 @@
+"""
+Evaluation of RAG context selection (relevance threshold + adaptive k +
+merging of adjacent chunks) against the old fixed top-3.
+
+Offline (default): replays the contexts recorded in logs/chatbot_logs.jsonl and
+logs/copilot_logs.jsonl and reports how many chunks / prompt characters the
+KB-snippet section shrinks by. No API key needed.
+
+Live (--live): runs eval/chatbot_testset.json through the real retriever and
+prompt builder with select=False vs select=True. With --answers it also calls
+the LLM for both prompts and compares keyword recall of the ideal-answer notes.
+
+Run from the backend folder:
+    python -m eval.run_context_selection_eval
+    python -m eval.run_context_selection_eval --live --answers
+"""
+import argparse
+import json
+import statistics
+from pathlib import Path
+
+from app.config import settings
+from app.services.context_selection import filter_by_relevance, merge_adjacent_chunks
+
+HERE = Path(__file__).resolve().parent
+LOG_DIR = HERE.parent / "logs"
+
+# Rough chars-per-token ratio for English prompts
+CHARS_PER_TOKEN = 4
+
+
+def snippet_chars(contexts: list) -> int:
+    """
+    Size of the "Knowledge base snippets" section as build_prompt() writes it.
+    """
+    total = 0
+    for i, ctx in enumerate(contexts, start=1):
+        src = (ctx.get("metadata", {}) or {}).get("source", "kb")
+        total += len(f"[{i}] Source: {src}\n{ctx.get('text') or ''}\n\n")
+    return total
+
+
+def select(contexts: list) -> list:
+    if settings.rag_adaptive_k:
+        contexts = filter_by_relevance(contexts, settings.rag_max_distance, settings.rag_max_distance_gap)
+    if settings.rag_merge_adjacent:
+        contexts = merge_adjacent_chunks(contexts)
+    return contexts
+
+
+def _logged_contexts() -> list:
+    out = []
+    for name in ("chatbot_logs.jsonl", "copilot_logs.jsonl"):
+        path = LOG_DIR / name
+        if not path.exists():
+            continue
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                contexts = (rec.get("extra") or {}).get("contexts") or []
+                # Compact records only hold references; they need the full texts
+                if contexts and all("text" in c for c in contexts):
+                    out.append((rec.get("query") or rec.get("type"), contexts))
+    return out
+
+
+def _report(rows: list) -> None:
+    """
+    rows: (label, fixed_contexts, selected_contexts)
+    """
+    fixed_chars = [snippet_chars(f) for _, f, _ in rows]
+    sel_chars = [snippet_chars(s) for _, _, s in rows]
+    for (label, fixed, sel), fc, sc in zip(rows, fixed_chars, sel_chars):
+        print(f"{str(label)[:48]:<50} chunks {len(fixed)} -> {len(sel)}   chars {fc:>5} -> {sc:>5}")
+
+    total_fixed, total_sel = sum(fixed_chars), sum(sel_chars)
+    print(
+        f"\nKB snippet chars: {total_fixed} -> {total_sel} "
+        f"(~{total_fixed // CHARS_PER_TOKEN} -> ~{total_sel // CHARS_PER_TOKEN} tokens, "
+        f"{1 - total_sel / total_fixed:.1%} smaller)" if total_fixed else "\nNo contexts."
+    )
+    print(
+        f"Mean chunks per prompt: {statistics.mean(len(f) for _, f, _ in rows):.2f} -> "
+        f"{statistics.mean(len(s) for _, _, s in rows):.2f}"
+    )
+    print(f"Prompts with no KB snippets after selection: {sum(1 for _, _, s in rows if not s)}/{len(rows)}")
+
+
+def run_offline() -> None:
+    logged = _logged_contexts()
+    if not logged:
+        print("No logged contexts with full text found.")
+        return
+    print(f"=== Logged RAG calls ({len(logged)}) ===")
+    _report([(label, ctx, select(ctx)) for label, ctx in logged])
+
+
+def run_live(answers: bool) -> None:
+    from app.models.chatbot import ChatRequest
+    from app.routers.chatbot import build_prompt
+    from app.services.llm_client import generate_text
+    from app.services.rag_service import retrieve_relevant_chunks
+    from eval.run_intent_router_eval import keyword_recall
+
+    tests = json.loads((HERE / "chatbot_testset.json").read_text(encoding="utf-8"))
+    rows, prompt_sizes, recalls = [], [], []
+    for item in tests:
+        fixed = retrieve_relevant_chunks(item["query"], n_results=3, select=False)
+        selected = retrieve_relevant_chunks(item["query"], n_results=3)
+        rows.append((item["id"], fixed, selected))
+
+        request = ChatRequest(query=item["query"], history=[])
+        prompts = (build_prompt(request, fixed), build_prompt(request, selected))
+        prompt_sizes.append(tuple(len(p) for p in prompts))
+        if answers:
+            recalls.append(
+                tuple(keyword_recall(item["ideal_answer_notes"], generate_text(p)) for p in prompts)
+            )
+
+    print(f"=== Eval set ({len(tests)}) ===")
+    _report(rows)
+    before, after = sum(a for a, _ in prompt_sizes), sum(b for _, b in prompt_sizes)
+    print(f"Full prompt chars: {before} -> {after} ({1 - after / before:.1%} smaller)")
+    if recalls:
+        print(
+            f"Answer keyword recall: fixed top-3 {statistics.mean(a for a, _ in recalls):.2f}, "
+            f"selected {statistics.mean(b for _, b in recalls):.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure RAG context selection.")
+    parser.add_argument("--live", action="store_true", help="use the real retriever on the eval set")
+    parser.add_argument("--answers", action="store_true", help="with --live, also compare LLM answers")
+    args = parser.parse_args()
+    print(
+        f"Settings: adaptive_k={settings.rag_adaptive_k} max_distance={settings.rag_max_distance} "
+        f"max_gap={settings.rag_max_distance_gap} merge_adjacent={settings.rag_merge_adjacent}\n"
+    )
+    if args.live:
+        run_live(args.answers)
+    else:
+        run_offline()
+
+
+if __name__ == "__main__":
+    main()
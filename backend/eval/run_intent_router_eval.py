@@ -0,0 +1,183 @@
+"""
+Offline evaluation of the pre-LLM FAQ intent router.
+
+Reports:
+- LLM-skip rate on the eval set and on real queries from logs/chatbot_logs.jsonl
+- router latency vs the recorded RAG latency (estimated savings)
+- a quality check against eval/chatbot_testset.json: for each query, keyword
+  recall of the ideal-answer notes in the router answer vs the recorded RAG
+  answer (chatbot_eval_results.json). Queries the router skips keep the RAG answer.
+- FAQ-shaped cases (paraphrases not in the router examples): whether each
+  is routed to the right KB section and its reply states the KB answer,
+  plus case-specific look-alikes that must go to the LLM
+
+Queries go through mask_pii() and canonical_query() first, as in the
+chatbot route, so the router sees exactly what it sees in production.
+
+Run from the backend folder:
+    python -m eval.run_intent_router_eval
+"""
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+
+from app.services.intent_router import route_faq
+from app.services.rag_service import canonical_query
+from app.utils.pii import mask_pii
+
+HERE = Path(__file__).resolve().parent
+LOG_PATH = HERE.parent / "logs" / "chatbot_logs.jsonl"
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[–-][a-z0-9]+)?")
+_NOTE_STOPWORDS = {
+    "the", "and", "or", "a", "an", "of", "to", "if", "in", "on", "it", "is", "as", "such",
+    "mention", "explain", "based", "recognize", "possibly", "yes", "s",
+}
+
+# (query, expected intent, fact the KB answer gives); expected None = case-specific,
+# must reach the LLM. Phrased unlike the router examples on purpose.
+FAQ_CASES = [
+    ("How many days do I get to send something back?", "return_window", "30 days"),
+    ("what's the deadline for returning stuff", "return_window", "30 days"),
+    ("Can gift cards be returned?", "non_returnable_items", "gift cards"),
+    ("are digital downloads returnable", "non_returnable_items", "digital products"),
+    ("Do I pay the shipping when I return an item?", "return_shipping_cost", "return shipping cost"),
+    ("How long until my refund shows up?", "refund_timing", "5–10 business days"),
+    ("when do refunds get processed", "refund_timing", "5–10 business days"),
+    ("How long does it take you to process orders?", "order_processing_time", "1–2 business days"),
+    ("How many days does express shipping take?", "shipping_times", "1–2 business days"),
+    ("what shipping methods do you have", "shipping_times", "standard shipping"),
+    ("Is there free shipping on orders?", "shipping_fees", "free shipping"),
+    ("How much do you charge for shipping?", "shipping_fees", "calculated at checkout"),
+    ("Where do I find the tracking number for my order?", "order_tracking", "tracking number"),
+    ("I can't remember my password, how do I reset it?", "forgot_password", "reset link"),
+    ("My order #12345 still hasn't arrived, where is it?", None, None),
+    ("I was charged twice for my refund", None, None),
+    ("The shoes I returned last week, when will I get my money back?", None, None),
+    ("Please cancel my order, it hasn't shipped", None, None),
+]
+
+
+def route(query: str):
+    """
+    Route a raw query the way the chatbot does: PII-masked, then canonical.
+    """
+    masked, _ = mask_pii(query)
+    return route_faq(canonical_query(masked))
+
+
+def keyword_recall(notes: str, answer: str) -> float:
+    """
+    Share of content words from the ideal-answer notes that appear in the answer.
+    Crude, but enough to spot a templated answer that misses the point.
+    """
+    wanted = {w for w in _WORD_RE.findall(notes.lower()) if w not in _NOTE_STOPWORDS}
+    if not wanted:
+        return 1.0
+    have = set(_WORD_RE.findall((answer or "").lower()))
+    return len(wanted & have) / len(wanted)
+
+
+def faq_cases() -> None:
+    """
+    Route the FAQ-shaped cases. Routed replies are checked against the KB:
+    the intent must be the expected one and the reply must carry the fact
+    the KB section gives for that question.
+    """
+    routed_ok = wrong = missed = leaked = 0
+    print("\n=== FAQ-shaped cases ===")
+    for query, expected, fact in FAQ_CASES:
+        routed = route(query)
+        got = routed["intent"] if routed else None
+        if expected is None:
+            leaked += got is not None
+            status = "ok (LLM)" if got is None else f"LEAKED -> {got}"
+            print(f"  {status:<30} {query}")
+            continue
+        if got is None:
+            missed += 1
+            print(f"  {'missed -> LLM':<30} {query}")
+            continue
+        correct = got == expected and fact.lower() in routed["reply"].lower()
+        routed_ok += correct
+        wrong += not correct
+        status = f"{got} ({routed['confidence']:.2f})" + ("" if correct else " WRONG")
+        print(f"  {status:<30} {query}  [{fact}: {'yes' if fact.lower() in routed['reply'].lower() else 'no'}]")
+    n_faq = sum(1 for _, e, _ in FAQ_CASES if e is not None)
+    print(f"Answered from the KB correctly: {routed_ok}/{n_faq}, wrong answer: {wrong}, left to the LLM: {missed}")
+    print(f"Case-specific queries answered from the FAQ: {leaked}/{len(FAQ_CASES) - n_faq}")
+
+
+def _log_queries() -> list:
+    if not LOG_PATH.exists():
+        return []
+    out = []
+    with LOG_PATH.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("type") == "chatbot" and rec.get("query"):
+                out.append(rec["query"])
+    return out
+
+
+def main() -> None:
+    tests = json.loads((HERE / "chatbot_testset.json").read_text(encoding="utf-8"))
+    results_path = HERE / "chatbot_eval_results.json"
+    recorded = {}
+    if results_path.exists():
+        recorded = {r["id"]: r for r in json.loads(results_path.read_text(encoding="utf-8"))}
+
+    print("=== Eval set ===")
+    skipped = 0
+    rag_latencies = []
+    for item in tests:
+        routed = route(item["query"])
+        rag = (recorded.get(item["id"]) or {}).get("rag") or {}
+        rag_reply = rag.get("reply") or ""
+        if rag.get("latency_sec"):
+            rag_latencies.append(rag["latency_sec"])
+
+        rag_recall = keyword_recall(item["ideal_answer_notes"], rag_reply)
+        if routed is None:
+            print(f"{item['id']:<24} -> LLM    recall(rag)={rag_recall:.2f}")
+            continue
+        skipped += 1
+        faq_recall = keyword_recall(item["ideal_answer_notes"], routed["reply"])
+        flag = "" if faq_recall >= rag_recall else "  <-- worse than RAG"
+        print(
+            f"{item['id']:<24} -> {routed['intent']} ({routed['confidence']:.2f})  "
+            f"recall(faq)={faq_recall:.2f} recall(rag)={rag_recall:.2f}{flag}"
+        )
+    print(f"LLM-skip rate: {skipped}/{len(tests)}")
+
+    queries = _log_queries()
+    if queries:
+        print("\n=== Logged chatbot queries ===")
+        hits = [q for q in queries if route(q) is not None]
+        print(f"LLM-skip rate: {len(hits)}/{len(queries)} ({len(hits) / len(queries):.1%})")
+        for q in sorted(set(hits)):
+            print(f"  skipped: {q[:90]}")
+
+    faq_cases()
+
+    # Router latency (routing only: the probe is canonicalized up front)
+    probe = [canonical_query(mask_pii(q)[0]) for q in [item["query"] for item in tests] + queries]
+    start = time.perf_counter()
+    rounds = 200
+    for _ in range(rounds):
+        for q in probe:
+            route_faq(q)
+    per_call_ms = (time.perf_counter() - start) * 1000 / (rounds * len(probe))
+    print(f"\nRouter latency: {per_call_ms * 1000:.0f} µs per query")
+    if rag_latencies:
+        rag_ms = statistics.mean(rag_latencies) * 1000
+        print(f"Recorded RAG latency: {rag_ms:.0f} ms per query -> ~{rag_ms - per_call_ms:.0f} ms saved per skipped query")
+
+
+if __name__ == "__main__":
+    main()
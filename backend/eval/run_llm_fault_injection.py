@@ -0,0 +1,185 @@
+"""
+Offline check of the resilient LLM client against a fault-injecting fake provider.
+No Gemini key or network is needed.
+
+Run from the backend folder:
+    python -m eval.run_llm_fault_injection
+"""
+import random
+import statistics
+import threading
+import time
+
+from app.services.resilience import (
+    CircuitBreaker,
+    ResilientLLMClient,
+    TransientLLMError,
+)
+
+FALLBACK_REPLY = "[canned fallback]"
+
+
+class FakeProvider:
+    """
+    Pretends to be Gemini:
+    - `error_rate`  of calls raise a retryable error
+    - `slow_rate`   of calls take `slow_sec` instead of the normal latency
+    - `fatal_models` always fail (to exercise the circuit breaker)
+    """
+
+    def __init__(
+        self,
+        error_rate: float = 0.0,
+        slow_rate: float = 0.0,
+        base_sec: float = 0.02,
+        slow_sec: float = 1.0,
+        fatal_models: tuple[str, ...] = (),
+        seed: int = 7,
+    ) -> None:
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.base_sec = base_sec
+        self.slow_sec = slow_sec
+        self.fatal_models = fatal_models
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt: str, model_name: str, timeout_sec: float) -> str:
+        with self._lock:
+            self.calls += 1
+            roll_err = self._rng.random()
+            roll_slow = self._rng.random()
+        if model_name in self.fatal_models:
+            raise TransientLLMError(f"{model_name} unavailable")
+        delay = self.slow_sec if roll_slow < self.slow_rate else self.base_sec
+        time.sleep(min(delay, timeout_sec))
+        if delay > timeout_sec:
+            raise TimeoutError("fake provider timed out")
+        if roll_err < self.error_rate:
+            raise TransientLLMError("fake 503")
+        return f"{model_name}: ok"
+
+
+def run_scenario(name: str, provider: FakeProvider, n_calls: int = 60, **client_kwargs) -> dict:
+    client = ResilientLLMClient(
+        provider=provider,
+        fallback_reply=FALLBACK_REPLY,
+        backoff_base_sec=0.01,
+        backoff_max_sec=0.05,
+        **client_kwargs,
+    )
+    latencies = []
+    outcomes = {"primary": 0, "fallback_model": 0, "canned": 0}
+    for _ in range(n_calls):
+        start = time.perf_counter()
+        text = client.generate("hello", "primary-model")
+        latencies.append(time.perf_counter() - start)
+        if text == FALLBACK_REPLY:
+            outcomes["canned"] += 1
+        elif text.startswith("fallback-model"):
+            outcomes["fallback_model"] += 1
+        else:
+            outcomes["primary"] += 1
+
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"\n=== {name} ===")
+    print(
+        f"Outcomes: {outcomes}  provider calls: {provider.calls}  "
+        f"breaker: {client.breaker.state}  fallback breaker: {client.fallback_breaker.state}"
+    )
+    print(f"Latency: mean {statistics.mean(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms")
+    return {
+        "outcomes": outcomes,
+        "p95": p95,
+        "max": latencies[-1],
+        "breaker": client.breaker.state,
+        "fallback_breaker": client.fallback_breaker.state,
+        "calls": provider.calls,
+    }
+
+
+def check_neutral_outcome() -> None:
+    """
+    A non-retryable error (bad request) must neither close a half-open
+    breaker nor reset the failure count of a closed one.
+    """
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=0.05)
+    breaker.record_failure()
+    breaker.release_trial()
+    breaker.record_failure()
+    assert breaker.state == "open", breaker.state
+
+    time.sleep(0.06)
+    assert breaker.allow_request() and breaker.state == "half_open"
+    breaker.release_trial()
+    assert breaker.state == "half_open", breaker.state
+    assert breaker.allow_request(), "trial slot was not released"
+    print("\n=== neutral outcomes ===\nBad requests leave the breaker state and failure count alone.")
+
+
+def main() -> None:
+    # 1) Transient errors are absorbed by retries
+    res = run_scenario(
+        "30% transient errors, retries on",
+        FakeProvider(error_rate=0.3),
+        max_retries=3,
+    )
+    assert res["outcomes"]["canned"] <= 3, res
+
+    # 2) Slow calls never exceed the deadline
+    res = run_scenario(
+        "20% very slow calls, 0.3s deadline",
+        FakeProvider(slow_rate=0.2, slow_sec=2.0),
+        timeout_sec=0.3,
+        max_retries=0,
+    )
+    assert res["max"] < 0.5, res
+
+    # 3) Hedging cuts the tail caused by slow calls
+    unhedged = run_scenario(
+        "10% slow calls, no hedging",
+        FakeProvider(slow_rate=0.1, slow_sec=0.5),
+        timeout_sec=2.0,
+    )
+    hedged = run_scenario(
+        "10% slow calls, hedging",
+        FakeProvider(slow_rate=0.1, slow_sec=0.5),
+        timeout_sec=2.0,
+        hedge_enabled=True,
+        hedge_min_delay_sec=0.05,
+    )
+    assert hedged["p95"] < unhedged["p95"], (hedged, unhedged)
+
+    # 4) Primary model hard down: breaker opens, traffic goes to the fallback model
+    res = run_scenario(
+        "primary down, fallback model up",
+        FakeProvider(fatal_models=("primary-model",)),
+        max_retries=1,
+        breaker=CircuitBreaker(failure_threshold=3, reset_timeout_sec=60),
+        fallback_model="fallback-model",
+    )
+    assert res["breaker"] == "open" and res["outcomes"]["fallback_model"] == 60, res
+
+    # 5) Everything down: canned response, no exceptions
+    res = run_scenario(
+        "all models down",
+        FakeProvider(fatal_models=("primary-model", "fallback-model")),
+        max_retries=1,
+        fallback_model="fallback-model",
+        breaker=CircuitBreaker(failure_threshold=3, reset_timeout_sec=60),
+        fallback_breaker=CircuitBreaker(failure_threshold=3, reset_timeout_sec=60),
+    )
+    assert res["outcomes"]["canned"] == 60, res
+    # Both circuits open, so the dead fallback model is not called 60 more times
+    assert res["fallback_breaker"] == "open" and res["calls"] <= 12, res
+
+    # 6) Bad requests are neutral for the breaker
+    check_neutral_outcome()
+
+    print("\nAll fault-injection scenarios passed.")
+
+
+if __name__ == "__main__":
+    main()
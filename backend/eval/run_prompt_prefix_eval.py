@@ -0,0 +1,152 @@
+"""
+Measure the precompiled prompt templates and their cacheable prefixes.
+
+Offline (default), on the RAG calls recorded in logs/chatbot_logs.jsonl:
+- build time of the template vs the old list-append builder
+- share of each prompt that is stable prefix (system text + KB snippets)
+- how often a prefix repeats, and the input tokens a context cache would
+  bill at the cached rate
+
+Live (--live N): replays the logged prompts N times through generate_text with
+explicit context caching on and prints get_llm_stats() (needs GEMINI_API_KEY).
+
+Run from the backend folder:
+    python -m eval.run_prompt_prefix_eval
+    python -m eval.run_prompt_prefix_eval --live 3
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.models.chatbot import ChatMessage, ChatRequest
+from app.routers.chatbot import SYSTEM_INSTRUCTIONS, build_prompt
+from eval.run_context_selection_eval import CHARS_PER_TOKEN
+
+HERE = Path(__file__).resolve().parent
+LOG_PATH = HERE.parent / "logs" / "chatbot_logs.jsonl"
+
+# Cached input tokens are billed at roughly a quarter of the normal rate
+CACHED_TOKEN_PRICE = 0.25
+
+
+def legacy_build_prompt(request: ChatRequest, contexts: list) -> str:
+    """
+    The previous build_prompt (list appends + join on every call), for timing.
+    """
+    lines = [SYSTEM_INSTRUCTIONS.strip(), ""]
+    lines.append("Conversation so far:")
+    if request.history:
+        for msg in request.history:
+            prefix = "User" if msg.role == "user" else "Assistant"
+            lines.append(f"{prefix}: {msg.content}")
+    else:
+        lines.append("(no previous messages)")
+    if contexts:
+        lines.append("")
+        lines.append("Knowledge base snippets (treat these as ground truth if relevant):")
+        for i, ctx in enumerate(contexts, start=1):
+            meta = ctx.get("metadata", {}) or {}
+            lines.append(f"[{i}] Source: {meta.get('source', 'kb')}")
+            lines.append(ctx["text"])
+            lines.append("")
+    else:
+        lines.append("")
+        lines.append(
+            "No specific knowledge base snippets were found. "
+            "Answer only if it is generic customer-service knowledge; "
+            "otherwise, say you are not sure and suggest a human agent."
+        )
+    lines.append("")
+    lines.append(f"User: {request.query}")
+    lines.append("Assistant:")
+    return "\n".join(lines)
+
+
+def _logged_requests() -> list:
+    out = []
+    if not LOG_PATH.exists():
+        return out
+    with LOG_PATH.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            extra = rec.get("extra") or {}
+            contexts = extra.get("contexts")
+            if rec.get("query") is None or contexts is None or not all("text" in c for c in contexts):
+                continue
+            history = [ChatMessage(**m) for m in rec.get("history") or []]
+            out.append((ChatRequest(query=rec["query"], history=history), contexts))
+    return out
+
+
+def _time_us(fn, requests: list, rounds: int = 500) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for req, ctx in requests:
+            fn(req, ctx)
+    return (time.perf_counter() - start) * 1e6 / (rounds * len(requests))
+
+
+def run_offline(requests: list) -> None:
+    print(f"=== {len(requests)} logged RAG calls ===")
+    print(f"Build time: legacy {_time_us(legacy_build_prompt, requests):.1f} µs, "
+          f"template {_time_us(build_prompt, requests):.1f} µs per prompt")
+
+    prompts = [build_prompt(req, ctx) for req, ctx in requests]
+    total = sum(len(p) for p in prompts)
+    prefix_total = sum(len(p.prefix) for p in prompts)
+    print(f"Stable prefix: {prefix_total / total:.1%} of prompt characters")
+
+    seen = set()
+    repeat_chars = 0
+    for p in prompts:
+        if p.prefix in seen:
+            repeat_chars += len(p.prefix)
+        seen.add(p.prefix)
+    print(f"Distinct prefixes: {len(seen)} for {len(prompts)} prompts")
+
+    total_tokens = total // CHARS_PER_TOKEN
+    cacheable = repeat_chars // CHARS_PER_TOKEN
+    billed = total_tokens - cacheable * (1 - CACHED_TOKEN_PRICE)
+    print(
+        f"Input tokens: ~{total_tokens}, ~{cacheable} of them served from a prefix cache "
+        f"-> billed as ~{billed:.0f} ({1 - billed / total_tokens:.1%} saving)"
+    )
+    short = sum(1 for p in prompts if len(p.prefix) < settings.llm_context_cache_min_chars)
+    if short:
+        print(
+            f"Note: {short}/{len(prompts)} prefixes are below llm_context_cache_min_chars="
+            f"{settings.llm_context_cache_min_chars}; they only benefit from implicit caching."
+        )
+
+
+def run_live(requests: list, rounds: int) -> None:
+    from app.services.llm_client import generate_text, get_llm_stats
+
+    settings.llm_context_cache_enabled = True
+    for _ in range(rounds):
+        for req, ctx in requests:
+            generate_text(build_prompt(req, ctx))
+    print(json.dumps(get_llm_stats(), indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure prompt templates and prefix caching.")
+    parser.add_argument("--live", type=int, default=0, metavar="N", help="replay logged prompts N times")
+    args = parser.parse_args()
+
+    requests = _logged_requests()
+    if not requests:
+        print("No logged RAG calls with full contexts found.")
+        return
+    run_offline(requests)
+    if args.live:
+        run_live(requests, args.live)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Measure how query normalization raises exact-key cache hit rates.
+
+Replays the queries recorded in logs/chatbot_logs.jsonl (already PII-masked)
+through a simulated LRU cache keyed four ways:
+- exact:      the masked query as typed
+- legacy:     strip + lower + collapse whitespace (the old retrieval cache key)
+- canonical:  canonicalize() (Unicode, case, shorthand, order numbers, punctuation)
+- +spell:     canonicalize() + the KB-vocabulary spell corrector (canonical_query)
+
+The logs are small, so --variants N also replays N noisy copies of every
+logged query (case, spacing, punctuation, curly quotes, a typo, a different
+order number), the kind of repeats real traffic has. Prints hit rates,
+normalization cost and every spelling correction made, for review, and
+checks a fixed set of real words the corrector must leave alone and typos
+it must fix.
+No API key needed (the KB vocabulary is read straight from app/chroma_db).
+
+Run from the backend folder:
+    python -m eval.run_query_normalization_eval
+    python -m eval.run_query_normalization_eval --variants 3
+"""
+import argparse
+import random
+import re
+import time
+from collections import OrderedDict
+
+from app.config import settings
+from app.services.query_normalizer import SpellCorrector, canonicalize, english_lexicon
+from eval.run_rerank_eval import _kb_chunks, _logged_queries
+
+_WS_RE = re.compile(r"\s+")
+
+# (word, expected): real words that are one edit from a KB word, then typos
+SPELLING_CASES = [
+    ("charged", "charged"),
+    ("complaint", "complaint"),
+    ("shoes", "shoes"),
+    ("arrive", "arrive"),
+    ("supposed", "supposed"),
+    ("hand", "hand"),
+    ("lose", "lose"),
+    ("four", "four"),
+    ("black", "black"),
+    ("play", "play"),
+    ("rest", "rest"),
+    ("cause", "cause"),
+    ("loss", "loss"),
+    ("seat", "seat"),
+    ("speak", "speak"),
+    ("roof", "roof"),
+    ("ball", "ball"),
+    ("wall", "wall"),
+    ("tall", "tall"),
+    ("recieve", "receive"),
+    ("cancell", "cancel"),
+    ("adress", "address"),
+    ("trakcing", "tracking"),
+]
+
+
+def legacy_key(query: str) -> str:
+    return _WS_RE.sub(" ", (query or "").strip().lower())
+
+
+def _noisy(query: str, rng: random.Random) -> str:
+    """
+    One plausible re-phrasing of the same question.
+    """
+    words = query.split()
+    if not words:
+        return query
+    i = rng.randrange(len(words))
+    choice = rng.randrange(6)
+    if choice == 0:
+        words[i] = words[i].upper() if rng.random() < 0.5 else words[i].capitalize()
+    elif choice == 1:
+        long_words = [j for j, w in enumerate(words) if len(w) >= 5 and w.isalpha()]
+        if long_words:
+            j = rng.choice(long_words)
+            w = words[j]
+            k = rng.randrange(1, len(w) - 2)
+            words[j] = w[:k] + w[k + 1] + w[k] + w[k + 2:]
+    elif choice == 2:
+        return "  ".join(words) + rng.choice(["", "?", "??", "!", " ."])
+    elif choice == 3:
+        return " ".join(words).replace("'", "’")
+    elif choice == 4:
+        text = re.sub(r"\d{5,}", lambda m: str(rng.randrange(10000, 99999)), " ".join(words))
+        return f"{text} #{rng.randrange(10000, 99999)}"
+    else:
+        return " ".join(words).lower()
+    return " ".join(words)
+
+
+def _replay(stream: list, key_fn, cache_size: int) -> dict:
+    cache: "OrderedDict[str, None]" = OrderedDict()
+    hits = 0
+    keys = [key_fn(q) for q in stream]
+    # Second pass for the cost: steady state, with the spell corrector's memo warm
+    start = time.perf_counter()
+    for q in stream:
+        key_fn(q)
+    cost_us = (time.perf_counter() - start) * 1e6 / max(1, len(stream))
+    for key in keys:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+        else:
+            cache[key] = None
+            if len(cache) > cache_size:
+                cache.popitem(last=False)
+    return {"hit_rate": hits / max(1, len(stream)), "distinct": len(set(keys)), "cost_us": cost_us}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cache hit rate with and without query normalization.")
+    parser.add_argument("--variants", type=int, default=0, help="noisy copies replayed per logged query")
+    parser.add_argument("--cache-size", type=int, default=settings.retrieval_cache_max_entries)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    queries = _logged_queries()
+    if not queries:
+        print("No logged queries found.")
+        return
+    rng = random.Random(args.seed)
+    stream = list(queries)
+    for q in queries:
+        stream.extend(_noisy(q, rng) for _ in range(args.variants))
+    rng.shuffle(stream)
+
+    speller = SpellCorrector(
+        max_distance=settings.query_spellcheck_max_distance,
+        is_english=english_lexicon(settings.query_spellcheck_min_zipf),
+    )
+    speller.fit(c["text"] for c in _kb_chunks())
+
+    key_fns = {
+        "exact": lambda q: q,
+        "legacy": legacy_key,
+        "canonical": canonicalize,
+        "+spell": lambda q: speller.correct(canonicalize(q)),
+    }
+    print(f"=== {len(stream)} queries ({len(queries)} logged, {args.variants} variants each), "
+          f"LRU of {args.cache_size} ===")
+    print(f"{'key':<10} {'hit rate':>9} {'distinct':>9} {'µs/query':>9}  (warm)")
+    for name, fn in key_fns.items():
+        r = _replay(stream, fn, args.cache_size)
+        print(f"{name:<10} {r['hit_rate']:>9.1%} {r['distinct']:>9} {r['cost_us']:>9.1f}")
+
+    corrections = {}
+    for q in stream:
+        for word in re.findall(r"[a-z]+", canonicalize(q)):
+            fixed = speller.correct_word(word)
+            if fixed != word:
+                corrections[word] = fixed
+    print(f"\nSpelling corrections ({len(corrections)}; vocabulary {len(speller.vocab)} words):")
+    for word, fixed in sorted(corrections.items()):
+        print(f"  {word} -> {fixed}")
+
+    failures = [(w, want, speller.correct_word(w)) for w, want in SPELLING_CASES if speller.correct_word(w) != want]
+    print(f"\nSpelling cases: {len(SPELLING_CASES) - len(failures)}/{len(SPELLING_CASES)} as expected")
+    for word, want, got in failures:
+        print(f"  {word} -> {got} (expected {want})")
+
+
+if __name__ == "__main__":
+    main()
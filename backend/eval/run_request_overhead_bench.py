@@ -0,0 +1,147 @@
+"""
+Per-request CPU overhead of the API with the LLM and retrieval stubbed out,
+so only our own work is measured: validation, PII masking, prompt building,
+logging and response serialization.
+
+Compares:
+- the app as configured (Pydantic serializes response models straight to JSON)
+- the same routers with ORJSONResponse as default_response_class
+- logger with orjson vs the standard json fallback
+plus micro-benchmarks of the hot-path pieces (masking, log encoding).
+
+Logs go to a temporary folder. Run from the backend folder:
+    python -m eval.run_request_overhead_bench --requests 2000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+os.environ.setdefault("GEMINI_API_KEY", "bench-not-used")  # the LLM is never called
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.models.chatbot import ChatMessage
+from app.routers import chatbot, copilot
+from app.utils import logger
+from app.utils.pii import mask_messages, mask_pii
+
+HISTORY = [
+    {"role": "user", "content": "Hi, my order #12345 has not arrived, my email is jane@example.com"},
+    {"role": "assistant", "content": "Sorry to hear that! Let me check the status for you."},
+    {"role": "user", "content": "It was supposed to arrive 4 days ago with express shipping."},
+    {"role": "assistant", "content": "Thanks, I can see the tracking has not updated recently."},
+] * 2
+
+CONTEXTS = [
+    {
+        "id": f"orders_and_shipping::chunk{i}",
+        "text": "Shipping policy text. " * 40,
+        "metadata": {"source": "orders_and_shipping.md", "base_id": "orders_and_shipping", "chunk_index": i},
+        "distance": 0.6 + i / 10,
+    }
+    for i in range(3)
+]
+
+CALLS = [
+    ("/chatbot/query", {"query": "Where is my order? Call me at 555-123-4567", "history": HISTORY}),
+    ("/copilot/suggest-reply", {"customer_message": "Where is my order?", "conversation_history": HISTORY}),
+    ("/copilot/summarize-case", {"conversation": HISTORY}),
+]
+
+
+def _stub_backends() -> None:
+    reply = "Summary: Late express order.\nKey points:\n- Tracking stale\n- Offer to investigate"
+    for module in (chatbot, copilot):
+        module.generate_text = lambda prompt, *a, **k: reply
+        module.retrieve_relevant_chunks = lambda *a, **k: [dict(c) for c in CONTEXTS]
+    settings.intent_router_enabled = False
+
+
+def _cpu_us_per_request(client: TestClient, n: int) -> dict:
+    out = {}
+    for path, body in CALLS:
+        for _ in range(20):  # warm-up
+            client.post(path, json=body)
+        start = time.process_time()
+        for _ in range(n):
+            resp = client.post(path, json=body)
+        out[path] = (time.process_time() - start) * 1e6 / n
+        assert resp.status_code == 200, resp.text
+    return out
+
+
+def _orjson_app() -> FastAPI:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        from fastapi.responses import ORJSONResponse
+
+        alt = FastAPI(default_response_class=ORJSONResponse)
+    alt.include_router(chatbot.router)
+    alt.include_router(copilot.router)
+    return alt
+
+
+def _micro(n: int) -> None:
+    models = [ChatMessage(**m) for m in HISTORY]
+
+    def legacy_mask():
+        masked = [ChatMessage(role=m.role, content=mask_pii(m.content)[0]) for m in models]
+        return [m.model_dump() for m in masked]
+
+    def dict_mask():
+        return mask_messages(models)[0]
+
+    record = {"type": "chatbot", "query": "q", "history_delta": HISTORY, "reply": "r" * 400,
+              "extra": {"contexts": [{"chunk_id": c["id"], "distance": c["distance"]} for c in CONTEXTS]}}
+
+    def stdlib_line():
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    for label, fn in (
+        ("mask history: new models + model_dump", legacy_mask),
+        ("mask history: mask_messages (dicts)", dict_mask),
+        ("log line: json.dumps", stdlib_line),
+        ("log line: dumps_line (orjson)", lambda: logger.dumps_line(record)),
+    ):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        print(f"  {label:<42} {(time.perf_counter() - start) * 1e6 / n:7.2f} µs")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-request CPU overhead with the LLM stubbed out.")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint and variant")
+    args = parser.parse_args()
+
+    _stub_backends()
+    with tempfile.TemporaryDirectory() as tmp:
+        logger.BASE_LOG_DIR = Path(tmp)
+        logger.CHUNK_STORE_PATH = Path(tmp) / "kb_chunks.jsonl"
+
+        variants = {}
+        variants["default (pydantic -> JSON bytes), orjson logs"] = _cpu_us_per_request(TestClient(app), args.requests)
+        variants["ORJSONResponse default class"] = _cpu_us_per_request(TestClient(_orjson_app()), args.requests)
+        fast = logger.orjson
+        logger.orjson = None
+        variants["default, stdlib json logs"] = _cpu_us_per_request(TestClient(app), args.requests)
+        logger.orjson = fast
+
+    print(f"CPU time per request (µs, {args.requests} requests each, includes TestClient overhead)")
+    print(f"{'variant':<48}" + "".join(f"{p:>26}" for p, _ in CALLS))
+    for name, row in variants.items():
+        print(f"{name:<48}" + "".join(f"{row[p]:>26.0f}" for p, _ in CALLS))
+
+    print("\nHot-path pieces:")
+    _micro(max(args.requests * 10, 10000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Measure the optional rerank stage (wide candidate set -> CPU rerank -> top n).
+
+Offline (default): CPU cost only. Scores every logged query against
+`--candidates` KB chunks read straight from app/chroma_db, cold and with the
+score cache warm. No API key needed.
+
+Live (--live): runs eval/chatbot_testset.json through the real retriever with
+and without reranking and compares chunk counts, KB snippet size and rerank
+time. With --answers it also calls the LLM for both prompts and compares
+keyword recall of the ideal-answer notes.
+
+Run from the backend folder:
+    python -m eval.run_rerank_eval
+    python -m eval.run_rerank_eval --live --answers
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.services.reranker import create_reranker
+from eval.run_context_selection_eval import CHARS_PER_TOKEN, snippet_chars
+
+HERE = Path(__file__).resolve().parent
+BACKEND_DIR = HERE.parent
+LOG_DIR = BACKEND_DIR / "logs"
+
+
+def _logged_queries() -> list:
+    out = []
+    for name in ("chatbot_logs.jsonl", "copilot_logs.jsonl"):
+        path = LOG_DIR / name
+        if not path.exists():
+            continue
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if rec.get("type") == "copilot":
+                    text = (rec.get("payload") or {}).get("customer_message")
+                else:
+                    text = rec.get("query")
+                if text:
+                    out.append(text)
+    return out
+
+
+def _kb_chunks() -> list:
+    import chromadb
+
+    client = chromadb.PersistentClient(path=str(BACKEND_DIR / "app" / "chroma_db"))
+    data = client.get_or_create_collection(name="support_kb").get(include=["documents", "metadatas"])
+    return [
+        {"id": cid, "text": doc, "metadata": meta, "distance": 0.0}
+        for cid, doc, meta in zip(data["ids"], data["documents"], data["metadatas"])
+    ]
+
+
+def run_offline(candidates: int) -> None:
+    chunks = _kb_chunks()
+    queries = _logged_queries()
+    if not chunks or not queries:
+        print("Need an indexed KB (app/chroma_db) and logged queries.")
+        return
+
+    reranker = create_reranker(
+        settings.rerank_model,
+        vector_weight=settings.rerank_vector_weight,
+        cache_max_entries=settings.rerank_cache_max_entries,
+    )
+    reranker.fit([c["text"] for c in chunks])
+
+    rng = random.Random(0)
+    sets = []
+    for _ in queries:
+        picked = rng.sample(chunks, min(candidates, len(chunks)))
+        # Fake vector distances so the fusion step does real work
+        sets.append([dict(c, distance=rng.uniform(0.5, 1.3)) for c in picked])
+
+    print(f"Scorer: {reranker.scorer.name}, {len(queries)} queries x {len(sets[0])} candidates")
+    for label in ("cold cache", "warm cache"):
+        per_query = []
+        for query, cands in zip(queries, sets):
+            start = time.perf_counter()
+            reranker.rerank(query, cands, top_n=3)
+            per_query.append((time.perf_counter() - start) * 1000)
+        print(
+            f"  {label:<10} mean {statistics.mean(per_query):.3f} ms  "
+            f"max {max(per_query):.3f} ms per query"
+        )
+
+    start = time.perf_counter()
+    reranker.fit([c["text"] for c in chunks])  # also clears the score cache
+    reranker.rerank_many(queries, sets, top_n=3)
+    batch_ms = (time.perf_counter() - start) * 1000
+    print(f"  batched    {batch_ms / len(queries):.3f} ms per query ({len(queries)} in one call)")
+    print(f"Stats: {reranker.stats()}")
+
+
+def run_live(answers: bool) -> None:
+    from app.models.chatbot import ChatRequest
+    from app.routers.chatbot import build_prompt
+    from app.services.llm_client import generate_text
+    from app.services.rag_service import get_reranker, retrieve_relevant_chunks
+    from eval.run_intent_router_eval import keyword_recall
+
+    settings.rerank_endpoints = "eval"
+    tests = json.loads((HERE / "chatbot_testset.json").read_text(encoding="utf-8"))
+    reranker = get_reranker()
+
+    rows = []
+    for item in tests:
+        plain = retrieve_relevant_chunks(item["query"], n_results=3)
+        before_ms = reranker.total_ms
+        reranked = retrieve_relevant_chunks(item["query"], n_results=3, endpoint="eval")
+        rerank_ms = reranker.total_ms - before_ms
+
+        request = ChatRequest(query=item["query"], history=[])
+        recall = None
+        if answers:
+            recall = tuple(
+                keyword_recall(item["ideal_answer_notes"], generate_text(build_prompt(request, ctx)))
+                for ctx in (plain, reranked)
+            )
+        rows.append((item["id"], plain, reranked, rerank_ms, recall))
+        print(
+            f"{item['id']:<24} chunks {len(plain)} -> {len(reranked)}   "
+            f"chars {snippet_chars(plain):>5} -> {snippet_chars(reranked):>5}   rerank {rerank_ms:.2f} ms"
+        )
+
+    before = sum(snippet_chars(r[1]) for r in rows)
+    after = sum(snippet_chars(r[2]) for r in rows)
+    print(
+        f"\nKB snippet chars: {before} -> {after} "
+        f"(~{before // CHARS_PER_TOKEN} -> ~{after // CHARS_PER_TOKEN} tokens)"
+    )
+    print(f"Mean rerank time: {statistics.mean(r[3] for r in rows):.2f} ms per query")
+    recalls = [r[4] for r in rows if r[4]]
+    if recalls:
+        print(
+            f"Answer keyword recall: vector top-3 {statistics.mean(a for a, _ in recalls):.2f}, "
+            f"reranked {statistics.mean(b for _, b in recalls):.2f}"
+        )
+    print(f"Reranker stats: {reranker.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the rerank stage.")
+    parser.add_argument("--live", action="store_true", help="use the real retriever on the eval set")
+    parser.add_argument("--answers", action="store_true", help="with --live, also compare LLM answers")
+    parser.add_argument("--candidates", type=int, default=settings.rerank_candidates)
+    args = parser.parse_args()
+    if args.live:
+        run_live(args.answers)
+    else:
+        run_offline(args.candidates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Streaming analytics over the chatbot / copilot JSONL logs.
+
+Every file is read line by line and folded into small, mergeable aggregates
+(counters, a log-bucketed latency histogram and a bounded top-k sketch), so
+memory stays flat no matter how big the logs get. Files are processed in
+parallel, one per worker process, and the partial results are merged.
+
+Run from the backend folder:
+    python -m tools.log_analytics logs/
+    python -m tools.log_analytics logs/ archive/*.jsonl.gz --workers 8 --json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.log_io import expand_log_paths, iter_records, record_query
+
+
+# ---------- Mergeable sketches ----------
+
+class LatencyHistogram:
+    """
+    Log-scale histogram: each bucket is ~5% wide, so percentiles are accurate
+    to within ~5% while the number of buckets stays in the low hundreds.
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self) -> None:
+        self.buckets: Counter = Counter()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value_ms: float) -> None:
+        idx = 0 if value_ms <= 1 else int(math.log(value_ms, self.GROWTH)) + 1
+        self.buckets[idx] += 1
+        self.count += 1
+        self.total += value_ms
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.count:
+            return None
+        target = pct / 100.0 * self.count
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= target:
+                # Upper edge of the bucket
+                return 1.0 if idx == 0 else self.GROWTH ** idx
+        return self.GROWTH ** max(self.buckets)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 1) if self.count else None,
+            "p50_ms": _round(self.percentile(50)),
+            "p90_ms": _round(self.percentile(90)),
+            "p95_ms": _round(self.percentile(95)),
+            "p99_ms": _round(self.percentile(99)),
+        }
+
+
+class TopK:
+    """
+    Space-Saving heavy hitters sketch with a fixed number of counters.
+    Counts for frequent items are exact or slightly over-estimated.
+    """
+
+    def __init__(self, capacity: int = 1000) -> None:
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+
+    def add(self, item: str, n: int = 1) -> None:
+        if item in self.counts or len(self.counts) < self.capacity:
+            self.counts[item] = self.counts.get(item, 0) + n
+            return
+        # Replace the current minimum; the newcomer inherits its count
+        victim = min(self.counts, key=self.counts.__getitem__)
+        floor = self.counts.pop(victim)
+        self.counts[item] = floor + n
+
+    def merge(self, other: "TopK") -> None:
+        for item, n in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + n
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[: self.capacity]
+            self.counts = dict(keep)
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+# ---------- Per-file aggregation ----------
+
+_WS_RE = re.compile(r"\s+")
+
+# Handlers that answer without calling the LLM (for the LLM-skip rate)
+NO_LLM_HANDLERS = {"intent_router", "summary_cache"}
+
+
+def _source_name(ctx: Dict[str, Any]) -> str:
+    # Old records nest the source under metadata; compact records keep it flat
+    src = ctx.get("source") or (ctx.get("metadata") or {}).get("source") or "kb"
+    return re.split(r"[\\/]", str(src))[-1]
+
+
+class LogStats:
+    """
+    All aggregates for a set of log records. Instances are mergeable so each
+    worker can build one per file.
+    """
+
+    def __init__(self, top_capacity: int = 1000) -> None:
+        self.records = 0
+        self.by_type: Counter = Counter()
+        self.by_handled_by: Counter = Counter()
+        self.guardrail_hits = 0
+        self.llm_skipped = 0
+        self.pii_masked = 0
+        self.sources: Counter = Counter()
+        self.latency = LatencyHistogram()
+        self.latency_by_handled_by: Dict[str, LatencyHistogram] = {}
+        self.top_queries = TopK(top_capacity)
+
+    def add(self, record: Dict[str, Any]) -> None:
+        extra = record.get("extra") or {}
+        rec_type = record.get("type", "unknown")
+        if rec_type == "copilot":
+            rec_type = f"copilot:{record.get('mode', 'unknown')}"
+        handled_by = extra.get("handled_by", "unknown")
+
+        self.records += 1
+        self.by_type[rec_type] += 1
+        self.by_handled_by[handled_by] += 1
+        if "guardrail" in handled_by:
+            self.guardrail_hits += 1
+        if "guardrail" in handled_by or handled_by in NO_LLM_HANDLERS:
+            self.llm_skipped += 1
+        if extra.get("pii_masked"):
+            self.pii_masked += 1
+
+        for ctx in extra.get("contexts") or []:
+            self.sources[_source_name(ctx)] += 1
+
+        latency = extra.get("latency_ms")
+        if isinstance(latency, (int, float)):
+            self.latency.add(latency)
+            self.latency_by_handled_by.setdefault(handled_by, LatencyHistogram()).add(latency)
+
+        query = _WS_RE.sub(" ", record_query(record)).strip().lower()
+        if query:
+            self.top_queries.add(query)
+
+    def merge(self, other: "LogStats") -> None:
+        self.records += other.records
+        self.by_type.update(other.by_type)
+        self.by_handled_by.update(other.by_handled_by)
+        self.guardrail_hits += other.guardrail_hits
+        self.llm_skipped += other.llm_skipped
+        self.pii_masked += other.pii_masked
+        self.sources.update(other.sources)
+        self.latency.merge(other.latency)
+        for key, hist in other.latency_by_handled_by.items():
+            self.latency_by_handled_by.setdefault(key, LatencyHistogram()).merge(hist)
+        self.top_queries.merge(other.top_queries)
+
+    def report(self, top_n: int = 10) -> Dict[str, Any]:
+        total = self.records or 1
+        return {
+            "records": self.records,
+            "by_type": dict(self.by_type.most_common()),
+            "by_handled_by": dict(self.by_handled_by.most_common()),
+            "guardrail_hit_rate": round(self.guardrail_hits / total, 4),
+            "llm_skip_rate": round(self.llm_skipped / total, 4),
+            "pii_rate": round(self.pii_masked / total, 4),
+            "retrieval_sources": dict(self.sources.most_common()),
+            "latency": self.latency.summary(),
+            "latency_by_handled_by": {
+                key: hist.summary() for key, hist in sorted(self.latency_by_handled_by.items())
+            },
+            "top_queries": self.top_queries.top(top_n),
+        }
+
+
+def _aggregate_file(args: Tuple[str, int]) -> LogStats:
+    path, top_capacity = args
+    stats = LogStats(top_capacity)
+    for record in iter_records(Path(path)):
+        stats.add(record)
+    return stats
+
+
+def aggregate(paths: List[Path], workers: int = 0, top_capacity: int = 1000) -> LogStats:
+    """
+    Aggregate many log files, one file per worker process.
+    `workers=0` means one per CPU core (capped at the number of files).
+    """
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(paths)))
+    jobs = [(str(p), top_capacity) for p in paths]
+
+    total = LogStats(top_capacity)
+    if workers == 1:
+        for job in jobs:
+            total.merge(_aggregate_file(job))
+        return total
+
+    with Pool(processes=workers) as pool:
+        for partial in pool.imap_unordered(_aggregate_file, jobs):
+            total.merge(partial)
+    return total
+
+
+# ---------- CLI ----------
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"Records: {report['records']}")
+
+    print("\nVolume by handled_by:")
+    for key, n in report["by_handled_by"].items():
+        print(f"  {key:<28} {n:>8}")
+
+    print("\nVolume by type:")
+    for key, n in report["by_type"].items():
+        print(f"  {key:<28} {n:>8}")
+
+    print(f"\nGuardrail hit rate: {report['guardrail_hit_rate']:.2%}")
+    print(f"LLM-skip rate:      {report['llm_skip_rate']:.2%}")
+    print(f"PII rate:           {report['pii_rate']:.2%}")
+
+    lat = report["latency"]
+    print(f"\nLatency (ms, {lat['count']} records with timing):")
+    print(f"  overall   p50={lat['p50_ms']} p90={lat['p90_ms']} p95={lat['p95_ms']} p99={lat['p99_ms']}")
+    for key, s in report["latency_by_handled_by"].items():
+        print(f"  {key:<28} p50={s['p50_ms']} p95={s['p95_ms']} (n={s['count']})")
+
+    print("\nRetrieval sources:")
+    for key, n in report["retrieval_sources"].items():
+        print(f"  {key:<40} {n:>8}")
+
+    print("\nTop queries:")
+    for query, n in report["top_queries"]:
+        print(f"  {n:>6}  {query[:100]}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Aggregate chatbot/copilot JSONL logs.")
+    parser.add_argument("paths", nargs="*", default=["logs"], help="log files or folders (default: logs)")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per core)")
+    parser.add_argument("--top", type=int, default=10, help="how many top queries to show")
+    parser.add_argument("--top-capacity", type=int, default=1000, help="counters kept by the top-k sketch")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    paths = expand_log_paths(args.paths)
+    if not paths:
+        parser.error("no log files found")
+
+    stats = aggregate(paths, workers=args.workers, top_capacity=args.top_capacity)
+    report = stats.report(top_n=args.top)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
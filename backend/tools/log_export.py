@@ -0,0 +1,394 @@
+"""
+Compact the JSONL logs into date-partitioned Parquet files.
+
+Layout of the output folder:
+    chatbot/date=2025-11-29/part-<source>.parquet
+    copilot/date=2025-11-29/part-<source>.parquet
+    chunks/chunks.parquet        # one row per distinct chunk text, keyed by text_sha
+
+Each source log file gets one part file per partition, named after the
+file's first line, so re-exporting (also after the file was rotated or
+compressed) overwrites its parts instead of duplicating the rows.
+
+Retrieved KB chunks are stored once in `chunks/` and records only keep the
+chunk keys and distances, so the same KB text is not repeated in every row.
+A chunk's key is the digest of its text (the logger's `text_sha`): chunk IDs
+repeat across tenants and survive KB edits, the text digest does not.
+Compact log records (history deltas, chunk references) are resolved first.
+Logs are streamed and written in batches, so memory stays bounded.
+
+Run from the backend folder:
+    python -m tools.log_export logs/ --out logs/columnar
+    python -m tools.log_export logs/ --out logs/columnar --benchmark
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError as exc:  # pragma: no cover - optional dependency
+    raise SystemExit("pyarrow is required for log export: pip install pyarrow") from exc
+
+from app.utils.hashing import text_digest
+from app.utils.log_resolver import LogResolver
+from tools.log_io import expand_log_paths, iter_records, open_log
+
+MESSAGE_TYPE = pa.list_(pa.struct([("role", pa.string()), ("content", pa.string())]))
+
+COMMON_FIELDS = [
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("safety_flag", pa.string()),
+    ("pii_masked", pa.bool_()),
+    ("handled_by", pa.string()),
+    ("latency_ms", pa.float64()),
+    ("context_chunk_ids", pa.list_(pa.string())),  # text_sha keys into chunks/
+    ("context_distances", pa.list_(pa.float64())),
+]
+
+CHATBOT_SCHEMA = pa.schema(
+    COMMON_FIELDS
+    + [
+        ("query", pa.string()),
+        ("reply", pa.string()),
+        ("history", MESSAGE_TYPE),
+    ]
+)
+
+COPILOT_SCHEMA = pa.schema(
+    COMMON_FIELDS
+    + [
+        ("mode", pa.string()),
+        ("customer_message", pa.string()),
+        ("topic_hint", pa.string()),
+        ("conversation", MESSAGE_TYPE),
+        ("output_text", pa.string()),
+        ("key_points", pa.list_(pa.string())),
+    ]
+)
+
+CHUNK_SCHEMA = pa.schema(
+    [
+        ("text_sha", pa.string()),
+        ("chunk_id", pa.string()),
+        ("source", pa.string()),
+        ("base_id", pa.string()),
+        ("chunk_index", pa.int32()),
+        ("text", pa.string()),
+    ]
+)
+
+
+# ---------- Record flattening ----------
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).astimezone(timezone.utc)
+    except ValueError:
+        return None
+
+
+def chunk_id_for(ctx: Dict[str, Any]) -> str:
+    """
+    Stable chunk ID: the Chroma ID if logged, else `<base_id>::chunk<idx>`
+    (same scheme as ensure_kb_indexed), else a hash of the text.
+    """
+    if ctx.get("chunk_id") or ctx.get("id"):
+        return str(ctx.get("chunk_id") or ctx.get("id"))
+    meta = ctx.get("metadata") or {}
+    if "base_id" in meta and "chunk_index" in meta:
+        return f"{meta['base_id']}::chunk{meta['chunk_index']}"
+    return "sha1:" + hashlib.sha1((ctx.get("text") or "").encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_key_for(ctx: Dict[str, Any]) -> str:
+    """
+    Key of a chunk in chunks/: the logged text_sha, else the digest of the
+    text (same digest as the logger), else the chunk ID for unresolved refs.
+    """
+    if ctx.get("text_sha"):
+        return str(ctx["text_sha"])
+    if ctx.get("text"):
+        return text_digest(ctx["text"])
+    return chunk_id_for(ctx)
+
+
+def _messages(raw: Any) -> List[Dict[str, str]]:
+    out = []
+    for msg in raw or []:
+        if isinstance(msg, dict):
+            out.append({"role": str(msg.get("role", "")), "content": str(msg.get("content", ""))})
+    return out
+
+
+class ChunkStore:
+    """
+    Distinct KB chunk texts seen during the export (bounded by KB size, not log size).
+    """
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, key: str, ctx: Dict[str, Any]) -> None:
+        if key in self.rows or not ctx.get("text"):
+            return
+        meta = ctx.get("metadata") or {}
+        source = ctx.get("source") or meta.get("source") or ""
+        self.rows[key] = {
+            "text_sha": key,
+            "chunk_id": chunk_id_for(ctx),
+            "source": re.split(r"[\\/]", str(source))[-1],
+            "base_id": meta.get("base_id"),
+            "chunk_index": meta.get("chunk_index"),
+            "text": ctx["text"],
+        }
+
+
+def _contexts(extra: Dict[str, Any], chunks: ChunkStore) -> Tuple[List[str], List[Optional[float]]]:
+    ids: List[str] = []
+    distances: List[Optional[float]] = []
+    for ctx in extra.get("contexts") or []:
+        key = chunk_key_for(ctx)
+        chunks.add(key, ctx)
+        ids.append(key)
+        distances.append(ctx.get("distance"))
+    return ids, distances
+
+
+def flatten(record: Dict[str, Any], chunks: ChunkStore) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Map one log record to (table_name, row). Returns None for unknown types.
+    """
+    extra = record.get("extra") or {}
+    ids, distances = _contexts(extra, chunks)
+    row: Dict[str, Any] = {
+        "timestamp": _parse_timestamp(record.get("timestamp")),
+        "safety_flag": extra.get("safety_flag"),
+        "pii_masked": extra.get("pii_masked"),
+        "handled_by": extra.get("handled_by"),
+        "latency_ms": extra.get("latency_ms"),
+        "context_chunk_ids": ids,
+        "context_distances": distances,
+    }
+
+    if record.get("type") == "chatbot":
+        history = record.get("history")
+        row.update(
+            {
+                "query": record.get("query"),
+                "reply": record.get("reply"),
+                "history": _messages(history if isinstance(history, list) else []),
+            }
+        )
+        return "chatbot", row
+
+    if record.get("type") == "copilot":
+        payload = record.get("payload") or {}
+        output = record.get("output") or {}
+        row.update(
+            {
+                "mode": record.get("mode"),
+                "customer_message": payload.get("customer_message"),
+                "topic_hint": payload.get("topic_hint"),
+                "conversation": _messages(payload.get("conversation_history") or payload.get("conversation")),
+                "output_text": output.get("suggested_reply") or output.get("summary"),
+                "key_points": [str(p) for p in output.get("key_points") or []],
+            }
+        )
+        return "copilot", row
+
+    return None
+
+
+# ---------- Partitioned writer ----------
+
+class PartitionedWriter:
+    """
+    Buffers rows per (table, date) partition and flushes them as Parquet row
+    groups once `batch_size` rows are collected. Rows of the current source
+    (see begin_source) go to part-<source>.parquet, written under a temporary
+    name and swapped in on close, so an existing part is replaced whole.
+    """
+
+    SCHEMAS = {"chatbot": CHATBOT_SCHEMA, "copilot": COPILOT_SCHEMA}
+
+    def __init__(self, out_dir: Path, batch_size: int = 50_000) -> None:
+        self.out_dir = out_dir
+        self.batch_size = batch_size
+        self.source_id = "logs"
+        self._buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._writers: Dict[Tuple[str, str], Tuple[pq.ParquetWriter, Path]] = {}
+        self.rows_written: Counter = Counter()
+
+    def begin_source(self, source_id: str) -> None:
+        """
+        Finish the parts of the previous source; later rows go to `source_id`'s.
+        """
+        self.close()
+        self.source_id = source_id
+
+    def add(self, table: str, row: Dict[str, Any]) -> None:
+        ts = row["timestamp"]
+        date = ts.strftime("%Y-%m-%d") if ts else "unknown"
+        key = (table, date)
+        buf = self._buffers.setdefault(key, [])
+        buf.append(row)
+        if len(buf) >= self.batch_size:
+            self._flush(key)
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        rows = self._buffers.pop(key, [])
+        if not rows:
+            return
+        table_name, date = key
+        schema = self.SCHEMAS[table_name]
+        entry = self._writers.get(key)
+        if entry is None:
+            part_dir = self.out_dir / table_name / f"date={date}"
+            part_dir.mkdir(parents=True, exist_ok=True)
+            path = part_dir / f"part-{self.source_id}.parquet"
+            tmp = path.with_suffix(".parquet.tmp")
+            entry = self._writers[key] = (pq.ParquetWriter(tmp, schema, compression="zstd"), path)
+        writer = entry[0]
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        self.rows_written[table_name] += len(rows)
+
+    def close(self) -> None:
+        for key in list(self._buffers):
+            self._flush(key)
+        for writer, path in self._writers.values():
+            writer.close()
+            path.with_suffix(".parquet.tmp").replace(path)
+        self._writers.clear()
+
+
+def _source_id(path: Path) -> str:
+    """
+    Stable part name for one log file: a hash of its first line, which stays
+    the same when the file is rotated (chatbot_logs.jsonl -> .1 -> .2.gz).
+    """
+    with open_log(path) as f:
+        first = f.readline().strip()
+    if not first:
+        return path.name
+    return hashlib.sha1(first.encode("utf-8")).hexdigest()[:16]
+
+
+def _write_chunks(out_dir: Path, chunks: ChunkStore) -> int:
+    """
+    Merge newly seen chunks into chunks/chunks.parquet. Keys are text digests,
+    so a key always maps to the same text; a file from before text_sha keys
+    is rebuilt.
+    """
+    path = out_dir / "chunks" / "chunks.parquet"
+    rows: Dict[str, Dict[str, Any]] = {}
+    if path.exists():
+        table = pq.read_table(path)
+        if "text_sha" in table.column_names:
+            for row in table.to_pylist():
+                rows[row["text_sha"]] = row
+    for key, row in chunks.rows.items():
+        rows.setdefault(key, row)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.Table.from_pylist(list(rows.values()), schema=CHUNK_SCHEMA), path, compression="zstd")
+    return len(rows)
+
+
+def export_logs(
+    paths: List[Path],
+    out_dir: Path,
+    batch_size: int = 50_000,
+    chunk_store: Optional[Path] = None,
+) -> Dict[str, Any]:
+    resolver = LogResolver(chunk_store or paths[0].parent / "kb_chunks.jsonl")
+    chunks = ChunkStore()
+    writer = PartitionedWriter(out_dir, batch_size=batch_size)
+    skipped = 0
+    try:
+        for path in paths:
+            writer.begin_source(_source_id(path))
+            for record in resolver.resolve_all(iter_records(path)):
+                flat = flatten(record, chunks)
+                if flat is None:
+                    skipped += 1
+                    continue
+                writer.add(*flat)
+    finally:
+        writer.close()
+    n_chunks = _write_chunks(out_dir, chunks)
+    return {"rows": dict(writer.rows_written), "skipped": skipped, "chunks": n_chunks}
+
+
+# ---------- Benchmark ----------
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*.parquet"))
+
+
+def benchmark(paths: List[Path], out_dir: Path) -> None:
+    """
+    Compare a typical aggregate (count by handled_by + mean latency) over the
+    raw JSONL vs the Parquet export.
+    """
+    start = time.perf_counter()
+    counts: Counter = Counter()
+    for path in paths:
+        for record in iter_records(path):
+            counts[(record.get("extra") or {}).get("handled_by")] += 1
+    jsonl_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parquet_counts: Counter = Counter()
+    for table_name in ("chatbot", "copilot"):
+        if not (out_dir / table_name).exists():
+            continue
+        dataset = ds.dataset(out_dir / table_name, format="parquet", partitioning="hive")
+        table = dataset.to_table(columns=["handled_by"])
+        for row in table.group_by("handled_by").aggregate([("handled_by", "count")]).to_pylist():
+            parquet_counts[row["handled_by"]] += row["handled_by_count"]
+    parquet_sec = time.perf_counter() - start
+
+    jsonl_bytes = sum(p.stat().st_size for p in paths)
+    parquet_bytes = _dir_size(out_dir)
+    print("\nBenchmark: count records by handled_by")
+    print(f"  JSONL   {jsonl_sec * 1000:9.1f} ms  {jsonl_bytes / 1024:10.1f} KiB")
+    print(f"  Parquet {parquet_sec * 1000:9.1f} ms  {parquet_bytes / 1024:10.1f} KiB")
+    if parquet_sec > 0 and parquet_bytes > 0:
+        print(f"  speed-up x{jsonl_sec / parquet_sec:.1f}, size ratio x{jsonl_bytes / parquet_bytes:.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export JSONL logs to date-partitioned Parquet.")
+    parser.add_argument("paths", nargs="*", default=["logs"], help="log files or folders (default: logs)")
+    parser.add_argument("--out", default="logs/columnar", help="output folder")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="rows per Parquet row group")
+    parser.add_argument("--chunk-store", default=None, help="kb_chunks.jsonl (default: next to the first log)")
+    parser.add_argument("--benchmark", action="store_true", help="compare an aggregate query before/after")
+    args = parser.parse_args(argv)
+
+    paths = expand_log_paths(args.paths)
+    if not paths:
+        parser.error("no log files found")
+
+    out_dir = Path(args.out)
+    chunk_store = Path(args.chunk_store) if args.chunk_store else None
+    result = export_logs(paths, out_dir, batch_size=args.batch_size, chunk_store=chunk_store)
+    print(f"Exported {result['rows']} rows ({result['skipped']} skipped), {result['chunks']} distinct chunks -> {out_dir}")
+
+    if args.benchmark:
+        benchmark(paths, out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Shared helpers for offline tools that read the JSONL logs written by
+app/utils/logger.py. Handles rotated and compressed files, e.g.:
+
+    logs/chatbot_logs.jsonl
+    logs/chatbot_logs.jsonl.1
+    logs/chatbot_logs.jsonl.2.gz
+"""
+from __future__ import annotations
+
+import bz2
+import gzip
+import json
+import lzma
+import re
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Tuple
+
+_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+
+# chatbot_logs.jsonl, chatbot_logs.jsonl.3, chatbot_logs.jsonl.3.gz
+_ROTATED_RE = re.compile(r"^(?P<base>.+?\.jsonl)(?:\.(?P<n>\d+))?(?:\.(?:gz|bz2|xz))?$")
+
+
+def open_log(path: Path) -> IO[str]:
+    """
+    Open a (possibly compressed) log file for streaming text reads.
+    """
+    opener = _OPENERS.get(path.suffix.lower())
+    if opener is not None:
+        return opener(path, "rt", encoding="utf-8")  # type: ignore[operator]
+    return path.open("r", encoding="utf-8")
+
+
+def _chronological_key(path: Path) -> Tuple[str, int, str]:
+    """
+    Sort key putting rotated siblings oldest first: highest rotation number
+    first, the live file (no number) last.
+    """
+    m = _ROTATED_RE.match(path.name)
+    if m is None:
+        return (path.name, 0, path.name)
+    n = m.group("n")
+    return (m.group("base"), -int(n) if n is not None else 0, path.name)
+
+
+def expand_log_paths(paths: Iterable[str], pattern: str = "*_logs.jsonl*") -> List[Path]:
+    """
+    Turn CLI arguments (files or folders) into a list of log files, rotated
+    files in the order they were written (.2.gz, .1, live file).
+    Folders are searched (non-recursively) with `pattern`, which skips
+    side files such as the kb_chunks.jsonl chunk store.
+    """
+    out: List[Path] = []
+    for raw in paths:
+        p = Path(raw)
+        if p.is_dir():
+            out.extend(sorted((x for x in p.glob(pattern) if x.is_file()), key=_chronological_key))
+        elif p.is_file():
+            out.append(p)
+    return out
+
+
+def iter_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Stream JSON records from one log file, one line at a time.
+    Broken lines (e.g. a partially written last line) are skipped.
+    """
+    with open_log(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def record_query(record: Dict[str, Any]) -> str:
+    """
+    The customer-facing text of a record: chatbot `query` or the copilot
+    customer message.
+    """
+    if record.get("type") == "copilot":
+        payload = record.get("payload") or {}
+        return payload.get("customer_message") or ""
+    return record.get("query") or ""
@@ -0,0 +1,393 @@
+"""
+Replay logged traffic against a running backend for capacity planning.
+
+Requests are rebuilt from logs/chatbot_logs.jsonl and copilot_logs.jsonl and
+sent with their original inter-arrival times (idle gaps capped by
+--max-gap-sec), compressed by --speed and multiplied by --amplify. The app
+should run with LLM_FAKE=true: Gemini is replaced by app/services/fake_llm.py,
+which sleeps for LLM latencies sampled from the same logs, so the test costs
+nothing and measures our own serving capacity.
+
+Each speed in --sweep is one step. Per step the report shows offered vs
+achieved throughput, latency, queueing delay (latency minus the unloaded
+service time measured in a sequential warm-up) and worker utilization
+(offered rate x service time / capacity), and the saturation point is the
+first step that can't keep up.
+
+Run from the backend folder:
+    # start a fake-LLM app with 2 workers, replay at 1x..32x, stop it again
+    python -m tools.log_replay logs/ --spawn-workers 2 --sweep 1,2,4,8,16,32
+    # against an app you started yourself with LLM_FAKE=true
+    python -m tools.log_replay logs/ --url http://127.0.0.1:8000 --speed 10 --amplify 3
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from app.utils.log_resolver import LogResolver
+from tools.log_analytics import LatencyHistogram
+from tools.log_io import expand_log_paths, iter_records
+
+# Starlette runs sync endpoints in AnyIO's thread pool (40 threads by default)
+THREADS_PER_WORKER = 40
+
+# A step is saturated when it falls this far behind the offered load
+MIN_THROUGHPUT_RATIO = 0.95
+MAX_ERROR_RATE = 0.01
+
+
+# ---------- Requests from logs ----------
+
+def _timestamp(record: Dict[str, Any]) -> Optional[float]:
+    raw = record.get("timestamp")
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw.rstrip("Z")).timestamp()
+    except ValueError:
+        return None
+
+
+def _to_request(record: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    (endpoint path, JSON body) that reproduces a logged call, or None.
+    """
+    extra = record.get("extra") or {}
+    if record.get("type") == "copilot":
+        payload = record.get("payload") or {}
+        if record.get("mode") == "suggest-reply" and payload.get("customer_message") is not None:
+            body = dict(payload)
+            # The tenant may have come from the X-Tenant-ID header; the log records the resolved one
+            if extra.get("tenant_id"):
+                body["tenant_id"] = extra["tenant_id"]
+            return "/copilot/suggest-reply", body
+        if record.get("mode") == "summarize-case" and payload.get("conversation"):
+            return "/copilot/summarize-case", payload
+        return None
+    if record.get("query") is None:
+        return None
+    body: Dict[str, Any] = {"query": record["query"], "history": record.get("history") or []}
+    if extra.get("tenant_id"):
+        body["tenant_id"] = extra["tenant_id"]
+    path = "/chatbot/query-baseline" if str(extra.get("handled_by", "")).startswith("baseline") else "/chatbot/query"
+    return path, body
+
+
+def load_requests(paths: List[Path]) -> List[Tuple[float, str, Dict[str, Any]]]:
+    """
+    (seconds since the first logged call, path, body) for every replayable record.
+    """
+    resolver = LogResolver(paths[0].parent / "kb_chunks.jsonl")
+    out: List[Tuple[float, str, Dict[str, Any]]] = []
+    for path in paths:
+        for record in resolver.resolve_all(iter_records(path)):
+            ts = _timestamp(record)
+            req = _to_request(record)
+            if ts is not None and req is not None:
+                out.append((ts, *req))
+    out.sort(key=lambda r: r[0])
+    if out:
+        start = out[0][0]
+        out = [(ts - start, path, body) for ts, path, body in out]
+    return out
+
+
+def build_schedule(
+    logged: List[Tuple[float, str, Dict[str, Any]]],
+    speed: float,
+    amplify: int,
+    max_gap_sec: float,
+    jitter_sec: float,
+    seed: int = 0,
+) -> List[Tuple[float, str, Dict[str, Any]]]:
+    """
+    Send times for one step: logged gaps capped at max_gap_sec and divided
+    by speed; each call is sent `amplify` times, the copies spread over
+    jitter_sec so they don't arrive in lockstep.
+    """
+    rng = random.Random(seed)
+    schedule = []
+    t = 0.0
+    prev = logged[0][0] if logged else 0.0
+    for ts, path, body in logged:
+        t += min(ts - prev, max_gap_sec) / speed
+        prev = ts
+        for copy in range(amplify):
+            schedule.append((t + (rng.uniform(0, jitter_sec) if copy else 0.0), path, body))
+    schedule.sort(key=lambda s: s[0])
+    return schedule
+
+
+# ---------- Load generation ----------
+
+_local = threading.local()
+
+
+def _post(url: str, body: Dict[str, Any], timeout: float) -> Tuple[int, float]:
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    started = time.perf_counter()
+    try:
+        status = session.post(url, json=body, timeout=timeout).status_code
+    except requests.RequestException:
+        status = 0
+    return status, (time.perf_counter() - started) * 1000
+
+
+def run_schedule(
+    base_url: str,
+    schedule: List[Tuple[float, str, Dict[str, Any]]],
+    client_threads: int,
+    timeout: float,
+) -> List[Dict[str, Any]]:
+    """
+    Open-loop replay: every request is sent at its scheduled time whether or
+    not earlier ones have finished, so server-side queueing shows up as latency.
+    """
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def _send(path: str, body: Dict[str, Any], scheduled: float, t0: float) -> None:
+        lag_ms = (time.perf_counter() - t0 - scheduled) * 1000
+        status, latency_ms = _post(base_url + path, body, timeout)
+        with lock:
+            results.append(
+                {
+                    "path": path,
+                    "status": status,
+                    "latency_ms": latency_ms,
+                    "client_lag_ms": lag_ms,
+                    "done_at": time.perf_counter() - t0,
+                }
+            )
+
+    with ThreadPoolExecutor(max_workers=client_threads) as pool:
+        t0 = time.perf_counter()
+        for scheduled, path, body in schedule:
+            delay = scheduled - (time.perf_counter() - t0)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_send, path, body, scheduled, t0)
+    return results
+
+
+def calibrate(
+    base_url: str,
+    logged: List[Tuple[float, str, Dict[str, Any]]],
+    per_path: int,
+    timeout: float,
+) -> Dict[str, float]:
+    """
+    Unloaded service time per endpoint: median latency of sequential calls
+    (one warm-up pass first, so caches are in the same state as under load).
+    """
+    samples: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for _, path, body in logged:
+        if len(samples.setdefault(path, [])) < per_path:
+            samples[path].append((path, body))
+    service: Dict[str, float] = {}
+    for path, reqs in samples.items():
+        for p, body in reqs:
+            _post(base_url + p, body, timeout)
+        service[path] = statistics.median(_post(base_url + p, body, timeout)[1] for p, body in reqs)
+    return service
+
+
+# ---------- Report ----------
+
+def summarize_step(
+    speed: float,
+    schedule: List[Tuple[float, str, Dict[str, Any]]],
+    results: List[Dict[str, Any]],
+    service_ms: Dict[str, float],
+    capacity: int,
+) -> Dict[str, Any]:
+    span = max(schedule[-1][0], 1e-3) if schedule else 1e-3
+    wall = max((r["done_at"] for r in results), default=span)
+    ok = [r for r in results if 200 <= r["status"] < 300]
+    latency, queue = LatencyHistogram(), LatencyHistogram()
+    for r in ok:
+        latency.add(r["latency_ms"])
+        queue.add(max(0.0, r["latency_ms"] - service_ms.get(r["path"], 0.0)))
+
+    mean_service_s = statistics.mean(service_ms.get(p, 0.0) for _, p, _ in schedule) / 1000 if schedule else 0.0
+    offered_rps = len(schedule) / span
+    # Without queueing the last reply lands one service time after the last send,
+    # so only the drain time beyond that counts against throughput
+    achieved_rps = len(ok) / max(span, wall - mean_service_s)
+    return {
+        "speed": speed,
+        "requests": len(schedule),
+        "errors": len(results) - len(ok),
+        "offered_rps": round(offered_rps, 2),
+        "achieved_rps": round(achieved_rps, 2),
+        "latency": latency.summary(),
+        "queue_delay": queue.summary(),
+        # Utilization law: U = X * S / c (can exceed 1 when the offered load is more than we can serve)
+        "utilization": round(offered_rps * mean_service_s / capacity, 3),
+        # Little's law: average number of requests inside the app
+        "mean_in_flight": round(sum(r["latency_ms"] for r in results) / 1000 / wall, 2),
+        "client_lag_p95_ms": round(statistics.quantiles([r["client_lag_ms"] for r in results], n=20)[-1], 1)
+        if len(results) >= 2
+        else 0.0,
+    }
+
+
+def is_saturated(step: Dict[str, Any], max_queue_ms: float) -> bool:
+    requests_ = step["requests"] or 1
+    queue_p95 = step["queue_delay"]["p95_ms"] or 0.0
+    return (
+        step["achieved_rps"] < MIN_THROUGHPUT_RATIO * step["offered_rps"]
+        or step["errors"] / requests_ > MAX_ERROR_RATE
+        or queue_p95 > max_queue_ms
+    )
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"Capacity: {report['capacity']} concurrent requests; service time (ms): "
+          + ", ".join(f"{p} {ms:.0f}" for p, ms in report["service_ms"].items()))
+    print(f"\n{'speed':>6} {'reqs':>6} {'err':>5} {'offered':>8} {'achieved':>9} "
+          f"{'p50':>7} {'p95':>7} {'q mean':>7} {'q p95':>7} {'util':>6} {'in-flight':>9}")
+    for s in report["steps"]:
+        lat, q = s["latency"], s["queue_delay"]
+        print(f"{s['speed']:>6g} {s['requests']:>6} {s['errors']:>5} {s['offered_rps']:>8.2f} {s['achieved_rps']:>9.2f} "
+              f"{lat['p50_ms'] or 0:>7.0f} {lat['p95_ms'] or 0:>7.0f} {q['mean_ms'] or 0:>7.0f} {q['p95_ms'] or 0:>7.0f} "
+              f"{s['utilization']:>6.1%} {s['mean_in_flight']:>9.1f}")
+        if s["client_lag_p95_ms"] > 100:
+            print(f"{'':>6} warning: the replay client fell {s['client_lag_p95_ms']:.0f} ms behind (p95); "
+                  "raise --client-threads")
+    sat = report["saturation"]
+    if sat["saturated_at_rps"] is None:
+        print(f"\nNo saturation up to {sat['max_sustained_rps']} rps.")
+    else:
+        print(f"\nSaturates between {sat['max_sustained_rps']} and {sat['saturated_at_rps']} rps offered.")
+    print(f"Utilization-law ceiling: ~{report['estimated_max_rps']} rps (capacity / mean service time).")
+
+
+# ---------- Spawned app ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_app(workers: int, port: int) -> subprocess.Popen:
+    """
+    Start uvicorn with the fake LLM; returns once /health answers.
+    """
+    env = {**os.environ, "LLM_FAKE": "true"}
+    backend_dir = Path(__file__).resolve().parents[1]
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=backend_dir,
+        env=env,
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("the app exited during startup")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).ok:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("the app did not become healthy within 120 s")
+
+
+# ---------- CLI ----------
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay logged traffic against the backend for capacity planning.")
+    parser.add_argument("paths", nargs="*", default=["logs"], help="log files or folders (default: logs)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="running app (ignored with --spawn-workers)")
+    parser.add_argument("--spawn-workers", type=int, default=0, help="start a fake-LLM app with N uvicorn workers")
+    parser.add_argument("--app-workers", type=int, default=1, help="uvicorn workers of the app at --url")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help=f"concurrent requests the app can serve (default: workers x {THREADS_PER_WORKER})")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression (10 = ten times faster)")
+    parser.add_argument("--sweep", default="", help="comma-separated speeds, one step each (overrides --speed)")
+    parser.add_argument("--amplify", type=int, default=1, help="send every logged call N times")
+    parser.add_argument("--max-gap-sec", type=float, default=5.0, help="cap on idle gaps between logged calls")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="spread of amplified copies")
+    parser.add_argument("--max-queue-ms", type=float, default=1000.0, help="p95 queueing delay that counts as saturated")
+    parser.add_argument("--client-threads", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    paths = expand_log_paths(args.paths)
+    if not paths:
+        parser.error("no log files found")
+    logged = load_requests(paths)
+    if not logged:
+        parser.error("no replayable requests in the logs")
+    speeds = [float(s) for s in args.sweep.split(",") if s.strip()] or [args.speed]
+
+    proc = None
+    base_url = args.url.rstrip("/")
+    workers = args.app_workers
+    if args.spawn_workers:
+        port = _free_port()
+        proc = spawn_app(args.spawn_workers, port)
+        base_url, workers = f"http://127.0.0.1:{port}", args.spawn_workers
+    elif not args.json:
+        print("Note: start the app with LLM_FAKE=true, or replies and latency come from the real Gemini API.")
+    capacity = args.capacity or workers * THREADS_PER_WORKER
+
+    try:
+        service_ms = calibrate(base_url, logged, per_path=5, timeout=args.timeout)
+        steps = []
+        for speed in speeds:
+            schedule = build_schedule(logged, speed, args.amplify, args.max_gap_sec, args.jitter_ms / 1000)
+            results = run_schedule(base_url, schedule, args.client_threads, args.timeout)
+            steps.append(summarize_step(speed, schedule, results, service_ms, capacity))
+            if not args.json:
+                print(f"step {speed:g}x: {steps[-1]['achieved_rps']} rps achieved", file=sys.stderr)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    sustained = [s["offered_rps"] for s in steps if not is_saturated(s, args.max_queue_ms)]
+    saturated = [s["offered_rps"] for s in steps if is_saturated(s, args.max_queue_ms)]
+    all_paths = [p for _, p, _ in logged]
+    mean_service_s = statistics.mean(service_ms.get(p, 0.0) for p in all_paths) / 1000
+    report = {
+        "logged_requests": len(logged),
+        "capacity": capacity,
+        "service_ms": {p: round(ms, 1) for p, ms in service_ms.items()},
+        "steps": steps,
+        "saturation": {
+            "max_sustained_rps": max(sustained) if sustained else None,
+            "saturated_at_rps": min(saturated) if saturated else None,
+        },
+        "estimated_max_rps": round(capacity / mean_service_s, 1) if mean_service_s else None,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Rebuild full log records (history + context texts) from the compact format.
+
+Run from the backend folder:
+    python -m tools.log_resolve logs/chatbot_logs.jsonl > chatbot_full.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from app.utils.log_resolver import LogResolver
+from tools.log_io import expand_log_paths, iter_records
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Resolve compact log records to full records.")
+    parser.add_argument("paths", nargs="+", help="log files or folders, oldest first")
+    parser.add_argument("--chunk-store", default=None, help="kb_chunks.jsonl (default: next to the first log)")
+    args = parser.parse_args(argv)
+
+    paths = expand_log_paths(args.paths)
+    if not paths:
+        parser.error("no log files found")
+
+    store = Path(args.chunk_store) if args.chunk_store else paths[0].parent / "kb_chunks.jsonl"
+    resolver = LogResolver(store)
+    for path in paths:
+        for record in resolver.resolve_all(iter_records(path)):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()